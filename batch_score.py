@@ -0,0 +1,188 @@
+"""Overnight pre-screen for a whole book of business.
+
+    python batch_score.py clients.jsonl -o scored.jsonl
+    python batch_score.py clients.csv -o scored.csv --workers 8
+    cat clients.jsonl | python batch_score.py - > scored.jsonl
+
+Input records carry: id, meds, conditions, smoker, and either feet/inches or
+height_in plus weight (or a precomputed bmi), and optionally age and sex for
+the build chart. In CSV, list fields are separated with ";" or ",". Records are
+streamed through a process pool with a bounded number in flight, so memory
+stays flat however big the file is. Build ratings are done in the parent, a
+chunk of records at a time, with one vectorized lookup per chunk.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import islice
+
+import fda_api
+from engine import score_applicant, rate_builds
+
+BUILD_CHUNK = 2000
+CSV_FIELDS = ["id", "bmi", "bmi_category", "build_class", "smoker", "overall_risk", "med_risks", "combinations", "conditions", "warnings", "not_found"]
+
+
+# =========================================================
+#  READERS / WRITERS (one record at a time)
+# =========================================================
+class InvalidRecord:
+    """An input line that isn't an applicant object. It becomes an error row, the run goes on."""
+
+    def __init__(self, line_no, reason):
+        self.line_no = line_no
+        self.reason = reason
+
+    def error_row(self):
+        return {"id": None, "error": f"line {self.line_no}: {self.reason}"}
+
+
+def read_records(stream, fmt):
+    if fmt == "csv":
+        yield from csv.DictReader(stream)
+        return
+    for line_no, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield InvalidRecord(line_no, f"not valid JSON ({e})")
+            continue
+        if not isinstance(record, dict):
+            yield InvalidRecord(line_no, f"expected a JSON object, got {type(record).__name__}")
+            continue
+        yield record
+
+
+def with_builds(items, chunk=BUILD_CHUNK, key=None):
+    # (item, build rating) pairs; the chart lookup runs once per chunk, not once per record.
+    # `key` picks the applicant record out of each item when items aren't records themselves.
+    items = iter(items)
+    while True:
+        batch = list(islice(items, chunk))
+        if not batch:
+            return
+        yield from zip(batch, _rate_chunk([key(x) for x in batch] if key else batch))
+
+
+def _rate_chunk(records):
+    # Ratings for the applicant records, None for anything else. If the chunk won't rate as a
+    # whole (one record with odd fields), every record gets None and score_applicant rates it
+    # on its own, inside the per-record error handling.
+    builds = [None] * len(records)
+    valid = [i for i, r in enumerate(records) if isinstance(r, dict)]
+    try:
+        rated = rate_builds([records[i] for i in valid])
+    except Exception:
+        return builds
+    for i, build in zip(valid, rated):
+        builds[i] = build
+    return builds
+
+
+def _split_quota(workers):
+    # Each worker process gets its own token bucket; together they must stay inside the one openFDA quota
+    fda_api.set_default_gateway(fda_api.UpstreamGateway(rate_per_min=fda_api.FDA_RATE_PER_MIN / workers,
+                                                        burst=max(1, fda_api.FDA_RATE_BURST // workers)))
+
+
+def worker_pool(workers):
+    """Process pool whose workers share FDA_RATE_PER_MIN between them."""
+    if workers > 1 and fda_api.FDA_RATE_PER_MIN > 0:
+        return ProcessPoolExecutor(max_workers=workers, initializer=_split_quota, initargs=(workers,))
+    return ProcessPoolExecutor(max_workers=workers)
+
+
+def flatten_for_csv(result):
+    return {
+        "id": result["id"],
+        "bmi": result["bmi"],
+        "bmi_category": result["bmi_category"],
+        "build_class": result["build_class"],
+        "smoker": result["smoker"],
+        "overall_risk": result["overall_risk"],
+        "med_risks": "; ".join(f"{m['name']}: {m['risk']}" for m in result["meds"] if m.get("risk")),
+        "combinations": " | ".join(result["combinations"]),
+        "conditions": "; ".join(f"{c['name']}: {c.get('rating', 'Unknown condition')}" for c in result["conditions"]),
+        "warnings": " | ".join(result["warnings"]),
+        "not_found": "; ".join(m["name"] for m in result["meds"] if m["found"] is False),
+    }
+
+
+def score_record(item, use_fda=True):
+    record, build = item
+    if isinstance(record, InvalidRecord):
+        return record.error_row()
+    try:
+        return score_applicant(record, use_fda=use_fda, build=build)
+    except Exception as e:
+        return {"id": record.get("id"), "error": f"{type(e).__name__}: {e}"}
+
+
+def bounded_imap(executor, fn, iterable, window):
+    # Like executor.map, but never reads more than `window` records ahead of the writer
+    pending = deque()
+    for item in iterable:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def _detect_format(path, explicit):
+    if explicit:
+        return explicit
+    return "csv" if path.lower().endswith(".csv") else "jsonl"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score a file of applicants with the Rx Assistant engine.")
+    parser.add_argument("input", help="JSONL or CSV file, or - for stdin")
+    parser.add_argument("-o", "--output", default="-", help="output file (default stdout)")
+    parser.add_argument("--in-format", choices=["jsonl", "csv"])
+    parser.add_argument("--out-format", choices=["jsonl", "csv"])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--offline", action="store_true", help="skip openFDA and classify meds by name only")
+    args = parser.parse_args(argv)
+
+    in_fmt = _detect_format(args.input, args.in_format)
+    out_fmt = _detect_format(args.output, args.out_format)
+    src = sys.stdin if args.input == "-" else open(args.input, newline="", encoding="utf-8")
+    dst = sys.stdout if args.output == "-" else open(args.output, "w", newline="", encoding="utf-8")
+
+    writer = None
+    if out_fmt == "csv":
+        writer = csv.DictWriter(dst, fieldnames=CSV_FIELDS + ["error"], extrasaction="ignore")
+        writer.writeheader()
+
+    done = errors = 0
+    try:
+        with worker_pool(args.workers) as pool:
+            scorer = partial(score_record, use_fda=not args.offline)
+            for result in bounded_imap(pool, scorer, with_builds(read_records(src, in_fmt)), window=args.workers * 4):
+                if "error" in result:
+                    errors += 1
+                if writer is not None:
+                    writer.writerow(result if "error" in result else flatten_for_csv(result))
+                else:
+                    dst.write(json.dumps(result) + "\n")
+                done += 1
+                if done % 500 == 0:
+                    print(f"{done} records scored ({errors} errors)", file=sys.stderr)
+    finally:
+        if src is not sys.stdin: src.close()
+        if dst is not sys.stdout: dst.close()
+    print(f"Done: {done} records scored ({errors} errors)", file=sys.stderr)
+    return 1 if errors and errors == done else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,265 @@
+"""Concurrent-session load test: how many agents can one web worker carry?
+
+    python benchmarks/load_test.py                           # ramp 1,2,4,8,16 sessions
+    python benchmarks/load_test.py --ramp 1,4,16,32 --journeys 3 --latency-ms 150
+    python benchmarks/load_test.py --output load.json
+
+Every session is its own AppTest (own session state, same process, same
+caches), driven from its own thread, the way the Streamlit server runs one
+script thread per browser tab. Each journey is what an agent does on a call:
+  login      fill the registration form (fake sheet backend)
+  tab1       look up one drug
+  tab2       paste 10 meds and Analyze Combinations
+  tab3       pick 3 conditions + smoker, then export the impairment PDF
+openFDA is the local mock (benchmarks/mock_openfda.py); the sheet is
+REGISTRATION_BACKEND=fake. Per ramp step it reports throughput, rerun latency
+p50/p95/p99 (overall and per step), process RSS growth and session-state size.
+Needs the Streamlit version in benchmarks/requirements.txt.
+"""
+import argparse
+import json
+import os
+import pickle
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+APP = os.path.join(ROOT, "med_decoder.py")
+
+from mock_openfda import start_server
+from run_benchmarks import percentiles
+
+# share_server_state() is only known to work on this release series (see benchmarks/requirements.txt)
+STREAMLIT_SERIES = "1.65."
+STEPS = ("login", "tab1_search", "tab2_combo", "tab3_conditions", "tab3_pdf")
+
+
+def rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def session_bytes(at):
+    # What this session keeps between reruns (rough: pickled size, getsizeof when it won't pickle)
+    total = 0
+    for value in at.session_state.to_dict().values():
+        try:
+            total += len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        except Exception:
+            total += sys.getsizeof(value)
+    return total
+
+
+def share_server_state():
+    # AppTest builds a fresh mock Runtime and ScriptCache for every run and puts
+    # the Runtime in a process-wide slot, clearing it afterwards. With several
+    # sessions rerunning at once that races (and compiling the script on many
+    # threads at once trips CPython). A real server has one of each, so do that.
+    # These are Streamlit internals (benchmarks/requirements.txt pins the version they
+    # match); fail loudly rather than measure something else on any other version.
+    import streamlit
+    if not streamlit.__version__.startswith(STREAMLIT_SERIES):
+        raise RuntimeError(f"load_test.py patches Streamlit {STREAMLIT_SERIES}x internals, this is {streamlit.__version__};"
+                           " pip install -r benchmarks/requirements.txt")
+    import streamlit.testing.v1.app_test as app_test
+    import streamlit.testing.v1.local_script_runner as local_script_runner
+    from streamlit.runtime.runtime import Runtime
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    if not (hasattr(app_test, "ScriptCache") and hasattr(local_script_runner, "ScriptCache")
+            and hasattr(Runtime, "_instance") and hasattr(Runtime, "exists")):
+        raise RuntimeError(f"load_test.share_server_state() doesn't match Streamlit {streamlit.__version__}'s AppTest internals")
+    script_cache = ScriptCache()
+    app_test.ScriptCache = local_script_runner.ScriptCache = lambda: script_cache
+    pinned = {}
+
+    def instance(cls):
+        if cls._instance is not None:
+            pinned.setdefault("runtime", cls._instance)
+        if "runtime" not in pinned:
+            raise RuntimeError("Runtime hasn't been created!")
+        return pinned["runtime"]
+
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(lambda cls: "runtime" in pinned or cls._instance is not None)
+
+
+# =========================================================
+#  ONE AGENT
+# =========================================================
+class Session:
+    def __init__(self, n, rng, drugs, conditions, timeout):
+        from streamlit.testing.v1 import AppTest
+        self.n = n
+        self.rng = rng
+        self.drugs = drugs
+        self.conditions = conditions
+        self.at = AppTest.from_file(APP, default_timeout=timeout)
+        self.samples = []  # (step, ms)
+        self.errors = []
+
+    def _step(self, name, action):
+        t0 = time.perf_counter()
+        try:
+            action()
+        except Exception as e:
+            self.errors.append(f"{name}: {type(e).__name__}: {e}")
+            return
+        self.samples.append((name, (time.perf_counter() - t0) * 1000.0))
+        if self.at.exception:
+            self.errors.extend(f"{name}: {e.value}" for e in self.at.exception)
+
+    def journey(self):
+        at = self.at
+        if "logged_in" not in at.session_state or not at.session_state["logged_in"]:
+            def login():
+                at.run()
+                at.text_input[0].input(f"Load Agent {self.n}")
+                at.text_input[1].input(f"agent{self.n}@example.com")
+                at.button[0].click().run()
+                if not at.session_state["logged_in"]:
+                    raise RuntimeError("login form did not let the agent in")
+            self._step("login", login)
+
+        drug = self.rng.choice(self.drugs)
+        self._step("tab1_search", lambda: at.text_input(key="single_input").input(drug).run())
+
+        meds = ", ".join(self.rng.sample(self.drugs, 10))
+
+        def combo():
+            at.text_area(key="multi_input").input(meds)
+            at.button(key="analyze_btn").click().run()
+        self._step("tab2_combo", combo)
+
+        picked = self.rng.sample(self.conditions, 3)
+
+        def conditions():
+            at.checkbox(key="smoker_check").check()
+            at.multiselect(key="cond_select").set_value(picked).run()
+        self._step("tab3_conditions", conditions)
+
+        def pdf():
+            # What a click on the app's download button costs: the PDF its deferred callable
+            # renders (same arguments: conditions in order, the analysis' lines, the last
+            # condition's risk) and the rerun the click triggers. The deferred callable itself
+            # can't be called here: every AppTest shares one session id, so concurrent sessions
+            # drop each other's registrations.
+            from engine import render_pdf
+            shown = at.multiselect(key="cond_select").value
+            analysis = at.session_state["tab3_result"][1]
+            render_pdf("Impairment Analysis", shown, analysis["pdf_lines"], risk_level=analysis["risks"][shown[-1]])
+            at.download_button(key="pdf_imp").click().run()
+        self._step("tab3_pdf", pdf)
+
+
+def run_level(sessions, journeys, rng_seed, drugs, conditions, timeout):
+    rss_before = rss_mb()
+    agents = [Session(i, random.Random(rng_seed + i), drugs, conditions, timeout) for i in range(sessions)]
+    start = threading.Barrier(sessions)
+
+    def drive(agent):
+        start.wait()
+        for _ in range(journeys):
+            try:
+                agent.journey()
+            except Exception as e:
+                agent.errors.append(f"journey: {type(e).__name__}: {e}")
+
+    threads = [threading.Thread(target=drive, args=(a,), name=f"agent-{a.n}") for a in agents]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+    rss_after = rss_mb()
+
+    samples = [ms for a in agents for _, ms in a.samples]
+    by_step = {step: [ms for a in agents for s, ms in a.samples if s == step] for step in STEPS}
+    state_kb = [session_bytes(a.at) / 1024 for a in agents]
+    level = {
+        "sessions": sessions,
+        "journeys": sessions * journeys,
+        "reruns": len(samples),
+        "wall_s": round(wall, 3),
+        "throughput_reruns_per_s": round(len(samples) / wall, 2) if wall else 0.0,
+        "throughput_journeys_per_s": round(sessions * journeys / wall, 3) if wall else 0.0,
+        "rerun": percentiles(samples) if samples else None,
+        "steps": {step: percentiles(v) for step, v in by_step.items() if v},
+        "errors": sorted({e for a in agents for e in a.errors})[:20],
+        "error_count": sum(len(a.errors) for a in agents),
+        "rss_mb_before": round(rss_before, 1),
+        "rss_mb_after": round(rss_after, 1),
+        "rss_mb_per_session": round((rss_after - rss_before) / sessions, 2),
+        "session_state_kb": {"mean": round(statistics.fmean(state_kb), 1), "max": round(max(state_kb), 1)},
+    }
+    del agents
+    return level
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rx Assistant concurrent-session load test")
+    parser.add_argument("--ramp", default="1,2,4,8,16", help="concurrent sessions per step")
+    parser.add_argument("--journeys", type=int, default=2, help="journeys per session at each step")
+    parser.add_argument("--latency-ms", type=float, default=80.0, help="mock openFDA latency per request")
+    parser.add_argument("--jitter-ms", type=float, default=20.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--timeout", type=float, default=120.0, help="seconds one rerun may take before it counts as failed")
+    parser.add_argument("--real-quota", action="store_true", help="keep the openFDA token bucket (default: unlimited, to measure the worker)")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--output", help="write the report JSON here")
+    args = parser.parse_args(argv)
+
+    scratch = tempfile.mkdtemp(prefix="rx-load-")
+    server = start_server(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate, seed=args.seed)
+    # Before the app modules are imported: they read these once
+    os.environ.update({"OPENFDA_LABEL_URL": server.url, "REGISTRATION_BACKEND": "fake", "PREWARM": "0", "LABEL_KB_PATH": "",
+                       "FAKE_SHEET_PATH": os.path.join(scratch, "sheet.jsonl"),
+                       "LABEL_CACHE_PATH": os.path.join(scratch, "labels.sqlite3")})
+    import fda_api
+    from data import COMMON_DRUGS_LIST, IMPAIRMENT_DATA
+    if not args.real_quota:
+        fda_api.set_default_gateway(fda_api.UpstreamGateway(rate_per_min=0))
+
+    share_server_state()
+    drugs = list(dict.fromkeys(COMMON_DRUGS_LIST))
+    conditions = sorted(IMPAIRMENT_DATA)
+    # One untimed journey first, so imports and the first compile don't land in the 1-session numbers
+    run_level(1, 1, args.seed - 1, drugs, conditions, args.timeout)
+    levels = []
+    print(f"{'sessions':>8s} {'reruns/s':>9s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s} {'errors':>6s} {'RSS MB':>8s} {'MB/sess':>8s}")
+    for i, sessions in enumerate(int(s) for s in args.ramp.split(",") if s.strip()):
+        level = run_level(sessions, args.journeys, args.seed + 1000 * i, drugs, conditions, args.timeout)
+        levels.append(level)
+        r = level["rerun"] or {"p50_ms": 0, "p95_ms": 0, "p99_ms": 0}
+        print(f"{sessions:8d} {level['throughput_reruns_per_s']:9.2f} {r['p50_ms']:9.1f} {r['p95_ms']:9.1f} {r['p99_ms']:9.1f}"
+              f" {level['error_count']:6d} {level['rss_mb_after']:8.1f} {level['rss_mb_per_session']:8.2f}")
+        for e in level["errors"][:3]:
+            print(f"         ! {e}")
+    server.shutdown()
+
+    report = {
+        "meta": {"created": datetime.now(timezone.utc).isoformat(timespec="seconds"), "journeys_per_session": args.journeys,
+                 "mock": {"latency_ms": args.latency_ms, "jitter_ms": args.jitter_ms, "error_rate": args.error_rate},
+                 "real_quota": args.real_quota, "upstream_requests": server.request_count},
+        "levels": levels,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"Wrote {args.output}")
+    return 1 if any(level["error_count"] for level in levels) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
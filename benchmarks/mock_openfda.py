@@ -0,0 +1,220 @@
+"""Local stand-in for api.fda.gov/drug/label.json.
+
+Serves label records from fixtures/openfda_labels.json with the same search
+syntax the app uses (field:"phrase" terms joined by + for OR, +AND+ for AND),
+plus configurable latency and error injection.
+
+    python benchmarks/mock_openfda.py --port 8765 --latency-ms 150 --error-rate 0.02
+    OPENFDA_LABEL_URL=http://127.0.0.1:8765/drug/label.json streamlit run med_decoder.py
+
+    python benchmarks/mock_openfda.py --record   # refresh the fixture from the real API
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+FIXTURE_PATH = os.path.join(HERE, "fixtures", "openfda_labels.json")
+TERM_RE = re.compile(r'([\w.]+):"([^"]*)"|\b(AND|OR)\b')
+
+
+def load_labels(path=FIXTURE_PATH):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)["results"]
+
+
+def _field_values(label, field):
+    node = label
+    for part in field.replace(".exact", "").split("."):
+        node = node.get(part, {}) if isinstance(node, dict) else {}
+    return node if isinstance(node, list) else []
+
+
+def parse_search(search):
+    """[(field, phrase)], and whether the terms are AND'ed (default OR, like openFDA)."""
+    terms, use_and = [], False
+    for m in TERM_RE.finditer(search):
+        if m.group(3):
+            use_and = use_and or m.group(3) == "AND"
+        else:
+            terms.append((m.group(1), m.group(2).lower()))
+    return terms, use_and
+
+
+def term_score(label, field, phrase):
+    # 2 = whole field equals the phrase, 1 = phrase appears as words inside it, 0 = no match
+    best = 0
+    for value in _field_values(label, field):
+        v = value.lower()
+        if v == phrase:
+            return 2
+        if not field.endswith(".exact") and re.search(rf"\b{re.escape(phrase)}\b", v):
+            best = 1
+    return best
+
+
+def search_labels(labels, search):
+    terms, use_and = parse_search(search)
+    if not terms:
+        return []
+    scored = []
+    for pos, label in enumerate(labels):
+        scores = [term_score(label, f, p) for f, p in terms]
+        if (all(scores) if use_and else any(scores)):
+            scored.append((-sum(scores), pos, label))
+    scored.sort(key=lambda t: (t[0], t[1]))
+    return [label for _, _, label in scored]
+
+
+class MockOpenFDAServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, labels, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0,
+                 throttle_rate=0.0, payload_kb=0, seed=None):
+        super().__init__(address, MockOpenFDAHandler)
+        self.labels = labels
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.filler = "x" * (payload_kb * 1024)
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.status_counts = {}
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/drug/label.json"
+
+    def count(self, status):
+        with self.lock:
+            self.request_count += 1
+            self.status_counts[status] = self.status_counts.get(status, 0) + 1
+
+    def reset_counts(self):
+        with self.lock:
+            self.request_count = 0
+            self.status_counts = {}
+
+
+class MockOpenFDAHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body, headers=()):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in headers:
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+        self.server.count(status)
+
+    def do_GET(self):
+        srv = self.server
+        with srv.lock:
+            delay = srv.latency_ms + srv.rng.uniform(0, srv.jitter_ms)
+            roll = srv.rng.random()
+        if delay:
+            time.sleep(delay / 1000.0)
+
+        parsed = urlparse(self.path)
+        if parsed.path != "/drug/label.json":
+            return self._send(404, {"error": {"code": "NOT_FOUND", "message": "Not found"}})
+        if roll < srv.throttle_rate:
+            return self._send(429, {"error": {"code": "OVER_RATE_LIMIT", "message": "API rate limit exceeded"}},
+                              headers=[("Retry-After", "1")])
+        if roll < srv.throttle_rate + srv.error_rate:
+            return self._send(500, {"error": {"code": "SERVER_ERROR", "message": "Injected error"}})
+
+        qs = parse_qs(parsed.query)
+        limit = int(qs.get("limit", ["1"])[0])
+        skip = int(qs.get("skip", ["0"])[0])
+        matches = search_labels(srv.labels, qs.get("search", [""])[0])
+        if not matches:
+            return self._send(404, {"error": {"code": "NOT_FOUND", "message": "No matches found!"}})
+        page = matches[skip:skip + limit]
+        if srv.filler:
+            page = [dict(label, warnings_and_cautions=[srv.filler]) for label in page]
+        self._send(200, {"meta": {"results": {"skip": skip, "limit": limit, "total": len(matches)}}, "results": page})
+
+
+def start_server(host="127.0.0.1", port=0, labels=None, **options):
+    """Start the mock in a daemon thread; returns the server (server.url is the label endpoint)."""
+    server = MockOpenFDAServer((host, port), labels if labels is not None else load_labels(), **options)
+    threading.Thread(target=server.serve_forever, name="mock-openfda", daemon=True).start()
+    return server
+
+
+# =========================================================
+#  RECORDING (real api.fda.gov -> fixture file)
+# =========================================================
+KEEP_FIELDS = ("set_id", "id", "version", "effective_time", "indications_and_usage")
+KEEP_OPENFDA = ("brand_name", "generic_name", "route", "product_type")
+
+
+def trim_label(label):
+    out = {k: label[k] for k in KEEP_FIELDS if k in label}
+    out["openfda"] = {k: v for k, v in label.get("openfda", {}).items() if k in KEEP_OPENFDA}
+    return out
+
+
+def record(names, path=FIXTURE_PATH):
+    import fda_api
+    labels, seen = [], set()
+    for name in names:
+        status_code, payload = fda_api.fetch_label(f'openfda.brand_name:"{name}"')
+        if status_code != 200:
+            print(f"{name}: HTTP {status_code}, skipped")
+            continue
+        for label in payload["results"]:
+            if label.get("set_id") not in seen:
+                seen.add(label.get("set_id"))
+                labels.append(trim_label(label))
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"meta": {"note": "Recorded from api.fda.gov and trimmed by mock_openfda.py --record"},
+                   "results": labels}, f, indent=1)
+    print(f"Recorded {len(labels)} labels to {path}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mock openFDA drug label server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with HTTP 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction answered with HTTP 429")
+    parser.add_argument("--payload-kb", type=int, default=0, help="pad each label to mimic full-size inserts")
+    parser.add_argument("--record", nargs="*", metavar="NAME", help="re-record the fixture (default: COMMON_DRUGS_LIST)")
+    args = parser.parse_args(argv)
+
+    if args.record is not None:
+        from data import COMMON_DRUGS_LIST
+        return record(args.record or COMMON_DRUGS_LIST)
+
+    server = MockOpenFDAServer((args.host, args.port), load_labels(), latency_ms=args.latency_ms,
+                               jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+                               throttle_rate=args.throttle_rate, payload_kb=args.payload_kb)
+    print(f"Mock openFDA serving {len(server.labels)} labels at {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
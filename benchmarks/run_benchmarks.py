@@ -0,0 +1,255 @@
+"""Benchmark the decoder's hot paths against the local mock openFDA.
+
+    python benchmarks/run_benchmarks.py                          # print results
+    python benchmarks/run_benchmarks.py --save-baseline          # write benchmarks/baseline.json
+    python benchmarks/run_benchmarks.py --compare benchmarks/baseline.json
+
+Every scenario is measured cold (label cache, PDF cache and name index reset
+before each iteration) and warm (primed once, then repeated). --compare exits
+non-zero when a p50 or p95 regresses past --tolerance, or when a scenario is
+missing from either the run or the baseline.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from mock_openfda import start_server
+
+BASELINE_PATH = os.path.join(HERE, "baseline.json")
+TYPOS = ["Metforman", "Lisinipril", "eliqis", "Ozempik", "Atorvastatn", "Gabapenton", "xarelto", "Plavx", "Zzyzx", "Cymbolta"]
+
+
+def percentiles(samples_ms):
+    ordered = sorted(samples_ms)
+
+    def pct(p):
+        k = (len(ordered) - 1) * p / 100.0
+        lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+        return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+    return {"n": len(ordered), "mean_ms": round(statistics.fmean(ordered), 3), "min_ms": round(ordered[0], 3),
+            "p50_ms": round(pct(50), 3), "p90_ms": round(pct(90), 3), "p95_ms": round(pct(95), 3),
+            "p99_ms": round(pct(99), 3), "max_ms": round(ordered[-1], 3)}
+
+
+def measure(fn, iterations, before_each=None):
+    samples = []
+    for _ in range(iterations):
+        if before_each:
+            before_each()
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    return samples
+
+
+def build_scenarios():
+    import engine
+    import name_index
+    from data import COMMON_DRUGS_LIST, IMPAIRMENT_DATA
+
+    def tab1_single():
+        status_code, record = engine.fetch_fda_single_drug("Eliquis")
+        insight = engine.analyze_single_med(record.indications, "Eliquis")
+        engine.get_product_matrix(insight["style"])
+
+    def tab2(n):
+        meds = COMMON_DRUGS_LIST[:n]
+
+        def run():
+            tags = []
+            for i, status_code, record, err in engine.resolve_fda_multi_drugs(meds):
+                if status_code == 200:
+                    engine.simple_category_check(record.indications, meds[i])
+                    tags.append(engine.drug_tags(record.indications, meds[i]))
+            engine.check_med_combinations(tags)
+        return run
+
+    conditions = sorted(IMPAIRMENT_DATA)
+
+    def tab3_all_conditions():
+        analysis = engine.assess_comorbidities(conditions, True, 34.0)
+        lines = ["--- WARNINGS ---"] + analysis["warnings"] + ["--- DETAILS ---"]
+        for cond in conditions:
+            engine.get_product_matrix(analysis["risks"][cond])
+            lines.append(f"Condition: {cond} | Rating: {IMPAIRMENT_DATA[cond]['rating']}")
+            lines.extend(f" - {q}" for q in IMPAIRMENT_DATA[cond]["qs"])
+
+    pdf_args = ("Report - Eliquis", ["Eliquis"], ["Risk: Heart Disease", "Est. Life Rating: Standard"], "risk-med",
+                "Eliquis is a factor Xa inhibitor indicated to reduce the risk of stroke. " * 20)
+
+    import fpdf  # noqa: F401  engine imports it on the first report; time the render, not the import
+
+    def create_pdf():
+        engine.render_pdf(*pdf_args)
+
+    # Synthetic rule table: 3000 rules over 400 tags, 30 meds with two tags each
+    from rules import InteractionIndex
+    rng = random.Random(7)
+    vocab = [f"tag{i}" for i in range(400)]
+    big_index = InteractionIndex([{"id": f"r{i}", "priority": i, "style": "risk-med", "finding": f"rule {i}",
+                                   "needs": {t: 1 for t in rng.sample(vocab, rng.randint(2, 4))}} for i in range(3000)])
+    med_tags = [set(rng.sample(vocab, 2)) for _ in range(30)]
+
+    def combo_30_meds_3000_rules():
+        big_index.match(med_tags)
+
+    # A book of 10,000 applicants rated against the build chart in one call. The chart is loaded
+    # (and numpy imported) once per process, so that happens here rather than in the first cold run
+    import build_chart
+    build_chart.get_default_chart()
+    applicants = [{"height_in": rng.randint(58, 78), "weight": rng.randint(100, 330), "age": rng.randint(18, 85),
+                   "sex": rng.choice("MF")} for _ in range(10000)]
+
+    def build_chart_10000():
+        engine.rate_builds(applicants)
+
+    # The offline knowledge base built from the fixture dump, answering a 50-med list locally
+    import label_kb
+    kb_dir = tempfile.mkdtemp(prefix="rx-kb-")
+    label_kb.ingest([os.path.join(HERE, "fixtures", "openfda_labels.json")], kb_dir)
+    kb = label_kb.LabelKB(kb_dir)
+
+    def kb_50_lookups():
+        for name in COMMON_DRUGS_LIST[:50]:
+            kb.lookup(name)
+
+    def tab1_typos():
+        # What an agent's misspellings cost: pre-flight answers most, the negative cache the rest
+        for typo in TYPOS:
+            engine.decode_drug(typo)
+
+    index_holder = {}
+
+    def fuzzy_suggest():
+        index = index_holder.get("index") or index_holder.setdefault("index", name_index.build_default_index())
+        for typo in TYPOS:
+            index.suggest(typo, n=1)
+
+    return {
+        "tab1_single_lookup": tab1_single,
+        "tab1_10_typos": tab1_typos,
+        "tab2_multi_1": tab2(1),
+        "tab2_multi_10": tab2(10),
+        "tab2_multi_50": tab2(50),
+        "tab3_impairment_all_conditions": tab3_all_conditions,
+        "combo_30_meds_3000_rules": combo_30_meds_3000_rules,
+        "build_chart_10000_applicants": build_chart_10000,
+        "label_kb_50_lookups": kb_50_lookups,
+        "create_pdf": create_pdf,
+        "fuzzy_suggest_10_typos": fuzzy_suggest,
+    }, index_holder
+
+
+def run(iterations, cold_iterations, server):
+    import engine
+    import label_cache
+    import rules
+
+    scratch = tempfile.mkdtemp(prefix="rx-bench-")
+    scenarios, index_holder = build_scenarios()
+
+    def reset_caches():
+        path = os.path.join(scratch, f"labels-{time.perf_counter_ns()}.sqlite3")
+        label_cache.set_default_cache(label_cache.LabelCache(path=path))
+        engine.clear_pdf_cache()
+        rules.classify_category.cache_clear()
+        rules.classify_tags.cache_clear()
+        index_holder.clear()
+
+    results = {}
+    for name, fn in scenarios.items():
+        server.reset_counts()
+        cold = measure(fn, cold_iterations, before_each=reset_caches)
+        cold_requests = server.request_count / cold_iterations
+
+        fn()  # prime
+        server.reset_counts()
+        warm = measure(fn, iterations)
+        results[name] = {"cold": percentiles(cold), "warm": percentiles(warm),
+                         "upstream_requests_per_run": {"cold": cold_requests, "warm": server.request_count / iterations}}
+        print(f"{name:34s} cold p50 {results[name]['cold']['p50_ms']:9.2f} ms   warm p50 {results[name]['warm']['p50_ms']:9.3f} ms"
+              f"   upstream/run {cold_requests:.1f}")
+    return results
+
+
+def compare(current, baseline, tolerance, floor_ms):
+    regressions = []
+    old_results = baseline.get("results", {})
+    # A scenario on one side only can't be checked; that fails too, so a stale baseline gets re-saved
+    for name in old_results.keys() - current["results"].keys():
+        regressions.append(f"{name}: in the baseline but no longer run")
+    for name, modes in current["results"].items():
+        old = old_results.get(name)
+        if not old:
+            regressions.append(f"{name}: missing from the baseline (re-save it with --save-baseline)")
+            continue
+        for mode in ("cold", "warm"):
+            for stat in ("p50_ms", "p95_ms"):
+                new_v, old_v = modes[mode][stat], old[mode][stat]
+                if new_v > old_v * (1 + tolerance) and new_v - old_v > floor_ms:
+                    regressions.append(f"{name} {mode} {stat}: {old_v:.3f} -> {new_v:.3f} ms")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rx Assistant benchmark suite")
+    parser.add_argument("--iterations", type=int, default=50, help="warm iterations per scenario")
+    parser.add_argument("--cold-iterations", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="mock openFDA latency per request")
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--payload-kb", type=int, default=0)
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--save-baseline", action="store_true", help=f"write results to {BASELINE_PATH}")
+    parser.add_argument("--compare", metavar="BASELINE", help="fail if slower than this baseline")
+    parser.add_argument("--tolerance", type=float, default=1.0, help="allowed relative slowdown (1.0 = twice as slow)")
+    parser.add_argument("--floor-ms", type=float, default=2.0, help="ignore regressions smaller than this")
+    args = parser.parse_args(argv)
+
+    server = start_server(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+                          payload_kb=args.payload_kb, seed=1234)
+    os.environ["OPENFDA_LABEL_URL"] = server.url
+    os.environ["LABEL_KB_PATH"] = ""  # Lookups go to the mock, not a knowledge base this checkout may have
+    import fda_api
+    fda_api.FDA_LABEL_URL = server.url
+    # Measure our own code, not the openFDA quota (cold runs would queue behind the token bucket)
+    fda_api.set_default_gateway(fda_api.UpstreamGateway(rate_per_min=0))
+
+    results = run(args.iterations, args.cold_iterations, server)
+    report = {
+        "meta": {"created": datetime.now(timezone.utc).isoformat(timespec="seconds"), "python": platform.python_version(),
+                 "platform": platform.platform(), "iterations": args.iterations, "cold_iterations": args.cold_iterations,
+                 "mock": {"latency_ms": args.latency_ms, "jitter_ms": args.jitter_ms, "error_rate": args.error_rate,
+                          "payload_kb": args.payload_kb}},
+        "results": results,
+    }
+    for path in filter(None, [args.output, BASELINE_PATH if args.save_baseline else None]):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"Wrote {path}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance, args.floor_ms)
+        if regressions:
+            print("REGRESSIONS:\n  " + "\n  ".join(regressions))
+            return 1
+        print("No regressions against baseline.")
+    server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
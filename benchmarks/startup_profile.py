@@ -0,0 +1,178 @@
+"""Cold-start profile of the web process, checked against a budget.
+
+    python benchmarks/startup_profile.py                 # print the profile
+    python benchmarks/startup_profile.py --check         # exit 1 if over benchmarks/startup_budget.json
+    python benchmarks/startup_profile.py --runs 5 --output startup.json
+
+Each run starts fresh interpreters, so nothing is warm:
+  server_ready_s       `streamlit run med_decoder.py` until /_stcore/health answers
+  server_rss_mb        resident memory of that server once it is ready
+  first_render_s       new interpreter -> login page rendered (AppTest, same script path)
+  app_render_s         login -> first render of the tabs, same process
+  render_rss_mb        resident memory after both renders
+The render child runs under -X importtime; the slowest imports are listed,
+and any module on the budget's forbidden_at_boot list that got imported fails the check.
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+APP = os.path.join(ROOT, "med_decoder.py")
+BUDGET_PATH = os.path.join(HERE, "startup_budget.json")
+
+RENDER_CHILD = r"""
+import json, sys, time
+t0 = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file(sys.argv[1], default_timeout=60)
+at.run()
+first = time.perf_counter() - t0
+at.session_state["logged_in"] = True
+t1 = time.perf_counter()
+at.run()
+app = time.perf_counter() - t1
+rss_kb = next((int(l.split()[1]) for l in open("/proc/self/status") if l.startswith("VmRSS:")), 0)
+print(json.dumps({"first_render_s": first, "app_render_s": app, "render_rss_mb": rss_kb / 1024,
+                  "exceptions": [str(e.value) for e in at.exception], "modules": sorted(sys.modules)}))
+"""
+
+
+def child_env(scratch):
+    env = dict(os.environ)
+    # Boot only: no warm-up traffic, no real sheet, no metrics exporter
+    env.update({"PREWARM": "0", "REGISTRATION_BACKEND": "fake", "RX_METRICS": "0",
+                "LABEL_CACHE_PATH": os.path.join(scratch, "labels.sqlite3"),
+                "LABEL_SNAPSHOT_PATH": os.path.join(scratch, "snapshot.json.gz")})
+    return env
+
+
+def rss_mb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def parse_importtime(stderr, top=10):
+    # "import time: self [us] | cumulative | imported package"
+    rows = []
+    for line in stderr.splitlines():
+        parts = line[len("import time:"):].split("|") if line.startswith("import time:") else []
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2].rstrip()
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((int(parts[1]), depth, name.strip()))
+    top_level = sorted((r for r in rows if r[1] == 0), reverse=True)[:top]
+    return [{"module": n, "cumulative_ms": round(us / 1000, 1)} for us, _, n in top_level]
+
+
+def measure_render(env):
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", RENDER_CHILD, APP], cwd=ROOT, env=env,
+                          capture_output=True, text=True, timeout=180)
+    lines = [l for l in proc.stdout.splitlines() if l.startswith("{")]
+    if proc.returncode != 0 or not lines:
+        raise RuntimeError(f"render child failed:\n{proc.stderr[-2000:]}")
+    result = json.loads(lines[-1])
+    result["slowest_imports"] = parse_importtime(proc.stderr)
+    return result
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure_server(env, timeout=60):
+    port = free_port()
+    cmd = [sys.executable, "-m", "streamlit", "run", APP, "--server.headless", "true", "--server.port", str(port),
+           "--server.address", "127.0.0.1", "--browser.gatherUsageStats", "false"]
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - t0 < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1) as r:
+                    if r.status == 200:
+                        return {"server_ready_s": time.perf_counter() - t0, "server_rss_mb": rss_mb(proc.pid)}
+            except OSError:
+                time.sleep(0.05)
+        raise RuntimeError(f"streamlit did not come up within {timeout}s")
+    finally:
+        proc.terminate()
+        proc.wait(10)
+
+
+def profile(runs):
+    samples = []
+    with tempfile.TemporaryDirectory(prefix="rx-startup-") as scratch:
+        env = child_env(scratch)
+        for _ in range(runs):
+            sample = measure_server(env)
+            sample.update(measure_render(env))
+            samples.append(sample)
+    report = {k: round(statistics.median(s[k] for s in samples), 3)
+              for k in ("server_ready_s", "server_rss_mb", "first_render_s", "app_render_s", "render_rss_mb")
+              if all(s.get(k) is not None for s in samples)}
+    report["runs"] = runs
+    report["exceptions"] = sorted({e for s in samples for e in s["exceptions"]})
+    report["slowest_imports"] = samples[-1]["slowest_imports"]
+    report["modules"] = samples[-1]["modules"]
+    return report
+
+
+def check(report, budget):
+    failures = [f"{k}: {report[k]} > budget {limit}" for k, limit in budget.get("max", {}).items()
+                if k in report and report[k] > limit]
+    loaded = set(report["modules"])
+    failures += [f"{m} imported at boot" for m in budget.get("forbidden_at_boot", []) if m in loaded]
+    failures += [f"render raised: {e}" for e in report["exceptions"]]
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rx Assistant cold-start profile")
+    parser.add_argument("--runs", type=int, default=3, help="fresh boots to take the median over")
+    parser.add_argument("--check", action="store_true", help=f"fail if over {BUDGET_PATH}")
+    parser.add_argument("--budget", default=BUDGET_PATH)
+    parser.add_argument("--output", help="write the profile JSON here")
+    args = parser.parse_args(argv)
+
+    report = profile(args.runs)
+    for k in ("server_ready_s", "server_rss_mb", "first_render_s", "app_render_s", "render_rss_mb"):
+        if k in report:
+            print(f"{k:18s} {report[k]:9.3f}")
+    print("slowest imports (first render):")
+    for row in report["slowest_imports"]:
+        print(f"  {row['cumulative_ms']:8.1f} ms  {row['module']}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({k: v for k, v in report.items() if k != "modules"}, f, indent=2)
+            f.write("\n")
+
+    if args.check:
+        with open(args.budget, encoding="utf-8") as f:
+            failures = check(report, json.load(f))
+        if failures:
+            print("OVER BUDGET:\n  " + "\n  ".join(failures))
+            return 1
+        print("Within startup budget.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+import csv
+import os
+import threading
+
+import numpy as np
+
+from data import BUILD_CLASSES, BUILD_TABLE, BUILD_AGE_BANDS, BUILD_SEX_ADJUST, BUILD_DEFAULT_AGE
+
+# =========================================================
+#  BUILD CHART (height / weight / age / sex -> rating class)
+# =========================================================
+# The whole chart lives in one array, max_weight[sex, age band, height, class],
+# so a column of applicants is rated with a few fancy-index lookups and one
+# comparison instead of a Python branch per row.
+#   BUILD_CHART_PATH=carrier.csv   load a carrier chart instead of data.py's
+# CSV columns: sex, age_min, height_in, min_weight, then one max-weight column
+# per class (header = class name), in order from best to worst.
+
+SEXES = ("M", "F")
+DECLINE = ("Decline", "risk-high")
+UNDERWEIGHT = ("Refer (underweight)", "risk-med")
+OFF_CHART = ("Refer (height off chart)", "risk-med")
+UNKNOWN = ("Unknown", None)
+
+
+class BuildChart:
+    def __init__(self, classes, heights, age_mins, min_weight, max_weight, default_age=BUILD_DEFAULT_AGE):
+        """`min_weight` is [sex, age band, height], `max_weight` is [sex, age band, height, class]."""
+        self.classes = list(classes)
+        self.heights = np.asarray(heights, dtype=np.int64)
+        self.age_mins = np.asarray(age_mins, dtype=np.float64)
+        self.min_weight = np.asarray(min_weight, dtype=np.float64)
+        self.max_weight = np.asarray(max_weight, dtype=np.float64)
+        self.default_age = default_age
+        n = len(self.classes)
+        if self.max_weight.shape != (len(SEXES), len(self.age_mins), len(self.heights), n):
+            raise ValueError(f"Build chart shape {self.max_weight.shape} doesn't match its axes")
+        if np.any(np.diff(self.heights) != 1):
+            raise ValueError("Build chart heights must be consecutive inches")
+        # Codes past the real classes: n = Decline, n+1 underweight, n+2 off chart, n+3 unknown
+        labels = [c for c, _ in self.classes] + [DECLINE[0], UNDERWEIGHT[0], OFF_CHART[0], UNKNOWN[0]]
+        styles = [s for _, s in self.classes] + [DECLINE[1], UNDERWEIGHT[1], OFF_CHART[1], UNKNOWN[1]]
+        self.labels = np.array(labels, dtype=object)
+        self.styles = np.array(styles, dtype=object)
+
+    @classmethod
+    def from_data(cls):
+        # data.py holds one standard chart; age and sex scale its max weights
+        heights = [h for h, _, _ in BUILD_TABLE]
+        base_min = np.array([m for _, m, _ in BUILD_TABLE], dtype=np.float64)
+        base_max = np.array([row for _, _, row in BUILD_TABLE], dtype=np.float64)
+        age_mins = [a for a, _ in BUILD_AGE_BANDS]
+        factor = 1.0 + np.add.outer([BUILD_SEX_ADJUST[s] for s in SEXES], [pct for _, pct in BUILD_AGE_BANDS])
+        max_weight = np.floor(factor[:, :, None, None] * base_max[None, None, :, :])
+        min_weight = np.broadcast_to(base_min, (len(SEXES), len(age_mins), len(heights)))
+        return cls(BUILD_CLASSES, heights, age_mins, min_weight, max_weight)
+
+    @classmethod
+    def from_csv(cls, path):
+        with open(path, newline="", encoding="utf-8") as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            rows = [r for r in reader if r]
+        class_names = header[4:]
+        styles = dict(BUILD_CLASSES)
+        classes = [(name, styles.get(name, "risk-med")) for name in class_names]
+        heights = sorted({int(r[2]) for r in rows})
+        age_mins = sorted({float(r[1]) for r in rows})
+        h_at = {h: i for i, h in enumerate(heights)}
+        a_at = {a: i for i, a in enumerate(age_mins)}
+        min_weight = np.full((len(SEXES), len(age_mins), len(heights)), np.nan)
+        max_weight = np.full((len(SEXES), len(age_mins), len(heights), len(classes)), np.nan)
+        for r in rows:
+            s, a, h = SEXES.index(r[0].strip().upper()[:1]), a_at[float(r[1])], h_at[int(r[2])]
+            min_weight[s, a, h] = float(r[3])
+            max_weight[s, a, h] = [float(v) for v in r[4:]]
+        if np.isnan(max_weight).any() or np.isnan(min_weight).any():
+            raise ValueError(f"Build chart {path} doesn't cover every sex / age band / height")
+        return cls(classes, heights, age_mins, min_weight, max_weight)
+
+    def rate(self, height_in, weight, age=None, sex=None):
+        """Rate whole columns at once. Returns arrays: code, build_class, risk, bmi, max_weight.
+
+        Missing ages (None / NaN) use the default age; unknown or missing sex uses the
+        male chart. Heights are rounded to the nearest inch.
+        """
+        h = np.asarray(height_in, dtype=np.float64).reshape(-1)
+        w = np.asarray(weight, dtype=np.float64).reshape(-1)
+        n = len(h)
+        a = np.full(n, np.nan) if age is None else np.asarray(age, dtype=np.float64).reshape(-1)
+        a = np.where(np.isnan(a), self.default_age, a)
+        s = np.zeros(n, dtype=np.int64) if sex is None else self.sex_codes(sex)
+
+        valid = (h > 0) & (w > 0) & ~np.isnan(h) & ~np.isnan(w)
+        hi = np.rint(np.where(valid, h, self.heights[0])).astype(np.int64) - self.heights[0]
+        off_chart = valid & ((hi < 0) | (hi >= len(self.heights)))
+        hi = np.clip(hi, 0, len(self.heights) - 1)
+        band = np.clip(np.searchsorted(self.age_mins, a, side="right") - 1, 0, len(self.age_mins) - 1)
+
+        limits = self.max_weight[s, band, hi]  # (n, classes)
+        k = len(self.classes)
+        code = (w[:, None] > limits).sum(axis=1)  # First class whose max weight isn't exceeded; k = Decline
+        code = np.where(w < self.min_weight[s, band, hi], k + 1, code)
+        code = np.where(off_chart, k + 2, code)
+        code = np.where(valid, code, k + 3)
+
+        rated = code < k
+        max_weight = np.where(rated, limits[np.arange(n), np.minimum(code, k - 1)], np.nan)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            bmi = np.where(valid, np.round(w / (h * h) * 703, 1), 0.0)
+        return {"code": code, "build_class": self.labels[code], "risk": self.styles[code], "bmi": bmi,
+                "max_weight": max_weight}
+
+    def rate_one(self, height_in, weight, age=None, sex=None):
+        r = self.rate([height_in], [weight], None if age is None else [age], None if sex is None else [sex])
+        max_weight = r["max_weight"][0]
+        return {"build_class": r["build_class"][0], "risk": r["risk"][0], "bmi": float(r["bmi"][0]),
+                "max_weight": None if np.isnan(max_weight) else int(max_weight)}
+
+    @staticmethod
+    def sex_codes(sex):
+        # "F" / "female" / "Female" -> 1, anything else -> 0 (male chart)
+        return np.fromiter((1 if str(v).strip()[:1].upper() == "F" else 0 for v in sex), dtype=np.int64)
+
+
+_default_chart = None
+_default_lock = threading.Lock()
+
+
+def get_default_chart():
+    global _default_chart
+    with _default_lock:
+        if _default_chart is None:
+            path = os.environ.get("BUILD_CHART_PATH")
+            _default_chart = BuildChart.from_csv(path) if path else BuildChart.from_data()
+    return _default_chart
+
+
+def set_default_chart(chart):
+    global _default_chart
+    with _default_lock:
+        _default_chart = chart
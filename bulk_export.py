@@ -0,0 +1,180 @@
+"""Bulk PDF export: one Rx / impairment report per client, zipped.
+
+    python bulk_export.py clients.jsonl -o reports.zip
+    python bulk_export.py clients.csv -o reports.zip --workers 8 --offline
+    cat clients.jsonl | python bulk_export.py - > reports.zip
+
+Same input as batch_score.py (meds, conditions, smoker, height/weight or bmi,
+age, sex). Clients are scored and rendered on a process pool, with a bounded
+number in flight, and each PDF is written into the ZIP as soon as it comes
+back, so memory stays flat however big the book is. The archive ends with
+index.csv and index.pdf (file -> client -> overall risk) as its table of
+contents. Progress goes to stderr.
+"""
+import argparse
+import csv
+import io
+import os
+import re
+import sys
+import time
+import zipfile
+from functools import partial
+
+from batch_score import InvalidRecord, _detect_format, bounded_imap, read_records, with_builds, worker_pool
+from data import IMPAIRMENT_DATA
+from engine import create_pdf, score_applicant
+
+RISK_NAMES = {"risk-safe": "Low", "risk-med": "Moderate", "risk-high": "High"}
+INDEX_FIELDS = ["file", "id", "overall_risk", "build_class", "meds_not_found", "error"]
+PROGRESS_EVERY = int(os.environ.get("BULK_EXPORT_PROGRESS_EVERY", "100"))
+
+
+# =========================================================
+#  ONE CLIENT -> ONE PDF (runs in the worker processes)
+# =========================================================
+def report_lines(result):
+    # The three tabs' findings for one client, in the order an agent reads them
+    yes_no = "Yes" if result["smoker"] else "No"
+    lines = [f"Overall Risk: {RISK_NAMES.get(result['overall_risk'], result['overall_risk'])}",
+             f"BMI: {result['bmi']} ({result['bmi_category']}) | Build: {result['build_class']} | Smoker: {yes_no}"]
+    if result["meds"]:
+        lines.append("--- MEDICATIONS ---")
+    for m in result["meds"]:
+        if m["found"] is False:
+            lines.append(f"{m['name']}: not found in the drug database")
+        elif "risk" not in m:
+            lines.append(f"{m['name']}: not checked ({m.get('error', 'lookup failed')})")
+        else:
+            lines.append(f"{m['name']}: {m['category']} | Risk: {m['risk']} | Est. Life Rating: {m['rating']}")
+    if result["combinations"]:
+        lines += ["--- COMBINATIONS ---"] + result["combinations"]
+    if result["warnings"]:
+        lines += ["--- WARNINGS ---"] + result["warnings"]
+    if result["conditions"]:
+        lines.append("--- CONDITIONS ---")
+    for c in result["conditions"]:
+        if not c["known"]:
+            lines.append(f"Condition: {c['name']} | Not in the impairment guide")
+            continue
+        lines.append(f"Condition: {c['name']} | Rating: {c['rating']}")
+        lines.extend(f" - {q}" for q in IMPAIRMENT_DATA[c["name"]]["qs"])
+    return lines
+
+
+def render_client(item, use_fda=True):
+    """(row number, record) + build -> index row and PDF bytes (None when the client failed)."""
+    (n, record), build = item
+    if isinstance(record, InvalidRecord):
+        return {"file": None, "overall_risk": None, "build_class": None, "meds_not_found": "", **record.error_row()}, None
+    client_id = record.get("id")
+    row = {"file": None, "id": client_id, "overall_risk": None, "build_class": None, "meds_not_found": "", "error": ""}
+    try:
+        result = score_applicant(record, use_fda=use_fda, build=build)
+        items = [m["name"] for m in result["meds"]] + [c["name"] for c in result["conditions"]]
+        title = f"Client Report - {client_id if client_id not in (None, '') else n}"
+        pdf_bytes = create_pdf(title, items or ["No meds or conditions listed"], report_lines(result),
+                               risk_level=result["overall_risk"])
+    except Exception as e:
+        row["error"] = f"{type(e).__name__}: {e}"
+        return row, None
+    row.update(file=client_filename(n, client_id), overall_risk=RISK_NAMES.get(result["overall_risk"]),
+               build_class=result["build_class"],
+               meds_not_found="; ".join(m["name"] for m in result["meds"] if m["found"] is False))
+    return row, pdf_bytes
+
+
+def client_filename(n, client_id):
+    # Row number first: unique even with repeated or missing ids, and sorts in input order
+    safe = re.sub(r"[^A-Za-z0-9._-]+", "_", str(client_id if client_id is not None else "")).strip("._")[:60]
+    return f"{n:05d}_{safe}.pdf" if safe else f"{n:05d}.pdf"
+
+
+# =========================================================
+#  EXPORT (parent: stream results into the ZIP)
+# =========================================================
+def count_records(path, fmt):
+    # Only for the progress line; stdin can't be read twice, so it goes without a total
+    if path == "-":
+        return None
+    with open(path, newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            return sum(1 for _ in csv.DictReader(f))
+        return sum(1 for line in f if line.strip())
+
+
+def export_zip(records, dst, workers, use_fda=True, progress=None):
+    """Render every record into the ZIP open on `dst`. Returns (done, errors).
+
+    `progress(done, errors)` is called after every client.
+    """
+    done = errors = 0
+    index = []
+    numbered = ((n, r) for n, r in enumerate(records, 1))
+    # PDFs are already compressed; deflating them again would only slow the writer down
+    with zipfile.ZipFile(dst, "w", compression=zipfile.ZIP_STORED) as zf:
+        with worker_pool(workers) as pool:
+            render = partial(render_client, use_fda=use_fda)
+            for row, pdf_bytes in bounded_imap(pool, render, with_builds(numbered, key=lambda item: item[1]),
+                                               window=workers * 4):
+                if pdf_bytes is None:
+                    errors += 1
+                else:
+                    zf.writestr(row["file"], pdf_bytes)
+                index.append(row)
+                done += 1
+                if progress:
+                    progress(done, errors)
+
+        text = io.StringIO()
+        writer = csv.DictWriter(text, fieldnames=INDEX_FIELDS)
+        writer.writeheader()
+        writer.writerows(index)
+        zf.writestr("index.csv", text.getvalue())
+        entries = [f"{r['file'] or 'FAILED'}  |  {r['id']}  |  {r['overall_risk'] or r['error']}" for r in index]
+        summary = [f"{done} clients, {done - errors} reports, {errors} failed."]
+        zf.writestr("index.pdf", create_pdf("Bulk Export Index", entries, summary))
+    return done, errors
+
+
+def progress_printer(total, every=PROGRESS_EVERY, stream=sys.stderr):
+    started = time.perf_counter()
+
+    def report(done, errors):
+        if done % every and done != total:
+            return
+        elapsed = time.perf_counter() - started
+        rate = done / elapsed if elapsed else 0.0
+        line = f"{done}/{total}" if total else f"{done}"
+        if total and rate:
+            line += f" ({done * 100 // total}%, ~{(total - done) / rate:.0f}s left)"
+        print(f"{line} clients exported, {errors} errors, {rate:.1f}/s", file=stream, flush=True)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export one PDF report per client into a ZIP.")
+    parser.add_argument("input", help="JSONL or CSV file, or - for stdin")
+    parser.add_argument("-o", "--output", default="-", help="ZIP file (default stdout)")
+    parser.add_argument("--in-format", choices=["jsonl", "csv"])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--offline", action="store_true", help="skip openFDA and classify meds by name only")
+    args = parser.parse_args(argv)
+
+    in_fmt = _detect_format(args.input, args.in_format)
+    total = count_records(args.input, in_fmt)
+    src = sys.stdin if args.input == "-" else open(args.input, newline="", encoding="utf-8")
+    dst = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+    started = time.perf_counter()
+    try:
+        done, errors = export_zip(read_records(src, in_fmt), dst, args.workers, use_fda=not args.offline,
+                                  progress=progress_printer(total))
+    finally:
+        if src is not sys.stdin: src.close()
+        if dst is not sys.stdout.buffer: dst.close()
+    print(f"Done: {done - errors} reports in {time.perf_counter() - started:.1f}s ({errors} errors)", file=sys.stderr)
+    return 1 if errors and errors == done else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
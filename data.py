@@ -19,6 +19,66 @@ COMMON_DRUGS_LIST = [
     "Ranolazine", "Imdur", "Bisoprolol", "Carvedilol", "Labetalol"
 ]
 
+# =========================================================
+#  DATA: GENERIC NAMES (for the brands above) & COMMON MISSPELLINGS
+# =========================================================
+# Seeds the "Did you mean" name index (name_index.py). The index also takes every
+# name in the offline label KB (label_kb.py ingest) and a DRUG_NAMES_FILE list.
+GENERIC_NAMES = [
+    "Clopidogrel", "Olmesartan", "Sitagliptin", "Adalimumab", "Etanercept",
+    "Apixaban", "Rivaroxaban", "Dabigatran", "Sacubitril", "Valsartan",
+    "Dapagliflozin", "Empagliflozin", "Semaglutide", "Tirzepatide", "Dulaglutide",
+    "Esomeprazole", "Salmeterol", "Budesonide", "Formoterol", "Albuterol",
+    "Tiotropium", "Pregabalin", "Venlafaxine", "Fluoxetine", "Aripiprazole",
+    "Quetiapine", "Alprazolam", "Clonazepam", "Diazepam", "Lorazepam",
+    "Zolpidem", "Eszopiclone", "Sildenafil", "Tadalafil", "Vardenafil",
+    "Flecainide", "Isosorbide Mononitrate", "Insulin Glargine", "Insulin Lispro",
+    "Glimepiride", "Pioglitazone", "Spironolactone", "Valacyclovir", "Cetirizine",
+    "Propranolol", "Diltiazem", "Verapamil", "Hydralazine", "Buspirone", "Citalopram",
+]
+
+COMMON_MISSPELLINGS = {
+    "metforman": "Metformin", "metformen": "Metformin", "metaformin": "Metformin",
+    "lisinipril": "Lisinopril", "lisinapril": "Lisinopril", "lysinopril": "Lisinopril",
+    "atorvastatine": "Atorvastatin", "atorvistatin": "Atorvastatin",
+    "levothyroxin": "Levothyroxine", "levothyroxene": "Levothyroxine",
+    "amlodapine": "Amlodipine", "amlodopine": "Amlodipine",
+    "metoprolo": "Metoprolol", "metropolol": "Metoprolol",
+    "omeprazol": "Omeprazole", "omeprozole": "Omeprazole",
+    "gabapenton": "Gabapentin", "gabapentine": "Gabapentin",
+    "hydrochlorathiazide": "Hydrochlorothiazide",
+    "sertaline": "Sertraline", "setraline": "Sertraline",
+    "eloquis": "Eliquis", "elliquis": "Eliquis", "xeralto": "Xarelto", "zarelto": "Xarelto",
+    "ozempik": "Ozempic", "ozempick": "Ozempic", "monjaro": "Mounjaro", "manjaro": "Mounjaro",
+    "jardience": "Jardiance", "farxica": "Farxiga", "trulicty": "Trulicity",
+    "plavics": "Plavix", "plavicks": "Plavix", "enteresto": "Entresto",
+    "synthyroid": "Synthroid", "cymbolta": "Cymbalta", "lexipro": "Lexapro",
+    "zanax": "Xanax", "xanex": "Xanax", "klonapin": "Klonopin", "clonopin": "Klonopin",
+    "abilifi": "Abilify", "seraquel": "Seroquel", "wellbutrine": "Wellbutrin",
+    "coumadine": "Coumadin", "warferin": "Warfarin", "amioderone": "Amiodarone",
+    "nitroglycern": "Nitroglycerin", "carvedilal": "Carvedilol", "allopurinal": "Allopurinol",
+}
+
+# What agents type into a med list that is never a drug name (dose and frequency
+# words are also dropped before the pre-flight check in name_index.py)
+NOT_DRUG_WORDS = {
+    "none", "n/a", "na", "nil", "no", "nope", "nothing", "unknown", "unsure", "not sure", "idk", "tbd",
+    "no meds", "no medications", "none reported", "same", "same as above", "see above", "etc", "and", "the",
+    "other", "others", "misc", "med", "meds", "medication", "medications", "pill", "pills",
+    "tablet", "tablets", "capsule", "capsules", "daily", "twice daily", "as needed", "prn", "otc", "test",
+}
+
+# Words in a label's drug names that don't name a drug on their own: salts, release
+# forms and joiners. The offline label KB (label_kb.py) never indexes a part of a
+# name that starts or ends with one, so "sodium" or "and" can't find a label.
+NAME_FILLER_WORDS = {
+    "hydrochloride", "hcl", "sodium", "potassium", "calcium", "magnesium", "tartrate", "succinate",
+    "fumarate", "besylate", "maleate", "mesylate", "citrate", "sulfate", "bisulfate", "acetate",
+    "propionate", "bromide", "oxalate", "phosphate", "dihydrate", "monohydrate", "medoxomil",
+    "etexilate", "xr", "xl", "er", "sr", "cr", "dr", "la", "hfa", "extended", "delayed", "release",
+    "oral", "injection", "solution", "suspension", "and", "with", "of", "in", "for", "plus",
+}
+
 # =========================================================
 #  IMPAIRMENT DATA (Tagged for Universal Logic)
 # =========================================================
@@ -71,3 +131,191 @@ IMPAIRMENT_DATA = {
     "Barrett's Esophagus": {"qs": ["Biopsy results?", "Dysplasia?", "Follow up schedule?"], "rating": "Standard to Table 3.", "risk": "risk-med"},
     "Alcohol History": {"qs": ["Date of last drink?", "AA attendance?", "DUI history?"], "rating": "Postpone (<2yrs sober). Standard (>5yrs sober).", "risk": "risk-high"}
 }
+
+# =========================================================
+#  COMORBIDITY RULES (Impairment Analyst + batch scoring)
+# =========================================================
+# Compiled by rules.py into bitmasks over IMPAIRMENT_DATA. Every test is
+# optional, and a rule fires when all of the ones it has hold:
+#   all_of / any_of          condition names from IMPAIRMENT_DATA
+#   smoker                   True = tobacco / nicotine user
+#   bmi_over / bmi_at_most   BMI range
+# "warning" adds a line to the analysis. "bump" raises the risk of each
+# selected condition ("applies_to" limits which ones) by that many levels;
+# the biggest bump wins, bumps don't add up. "floor" is the lowest overall
+# risk the applicant can score in batch scoring.
+RISK_ORDER = ["risk-safe", "risk-med", "risk-high"]
+
+COMORBIDITY_RULES = [
+    {"id": "smoker", "smoker": True, "warning": "SMOKER STATUS: Rates will be Standard Smoker (Tobacco) at best."},
+    {"id": "build", "bmi_over": 30, "warning": "BUILD RATING: High BMI typically triggers a Table Rating based on build alone."},
+    {"id": "smoker_lungs", "smoker": True, "any_of": ["COPD / Emphysema", "Asthma"],
+     "warning": "DECLINE WARNING: COPD/Asthma + Smoking is a major knockout for most carriers."},
+    {"id": "smoker_heart_attack", "smoker": True, "all_of": ["Heart Attack (History of)"],
+     "warning": "HIGH RISK: Smoking after a Heart Attack is typically Table 4 to Decline."},
+    {"id": "apnea_build", "bmi_over": 35, "all_of": ["Sleep Apnea"],
+     "warning": "BUILD RISK: Sleep Apnea with BMI > 35 requires documented CPAP compliance for best rates."},
+    {"id": "diabetes_heart_attack", "all_of": ["Diabetes Type 2", "Heart Attack (History of)"],
+     "warning": "COMORBIDITY ALERT: Diabetes + Heart History is treated very strictly. Expect Table 4 minimum."},
+    # Risk bump: smokers and BMI over 33 move every condition up one level
+    {"id": "smoker_bump", "smoker": True, "bump": 1, "floor": "risk-med"},
+    {"id": "obese_bump", "bmi_over": 33, "bump": 1, "floor": "risk-med"},
+]
+
+# =========================================================
+#  BUILD CHART (height / weight, sidebar + batch scoring)
+# =========================================================
+# Loaded into NumPy arrays by build_chart.py. Each row is a height in inches,
+# the lowest acceptable weight, then the highest weight for each class in
+# BUILD_CLASSES, for a standard applicant. Heavier than the last column is
+# a Decline. Set BUILD_CHART_PATH to load a carrier's own chart (CSV) instead.
+BUILD_CLASSES = [
+    ("Preferred Plus", "risk-safe"),
+    ("Preferred", "risk-safe"),
+    ("Standard Plus", "risk-safe"),
+    ("Standard", "risk-safe"),
+    ("Table 2", "risk-med"),
+    ("Table 4", "risk-med"),
+]
+
+BUILD_TABLE = [
+    (56, 80, [120, 129, 138, 147, 165, 182]),
+    (57, 83, [124, 134, 143, 152, 171, 189]),
+    (58, 86, [129, 138, 148, 157, 177, 196]),
+    (59, 89, [133, 143, 153, 163, 183, 203]),
+    (60, 92, [138, 148, 158, 168, 189, 209]),
+    (61, 95, [142, 153, 164, 174, 195, 217]),
+    (62, 98, [147, 158, 169, 180, 202, 224]),
+    (63, 102, [152, 163, 175, 186, 208, 231]),
+    (64, 105, [157, 168, 180, 192, 215, 238]),
+    (65, 108, [162, 174, 186, 198, 222, 246]),
+    (66, 112, [167, 179, 192, 204, 229, 254]),
+    (67, 115, [172, 185, 197, 210, 236, 261]),
+    (68, 118, [177, 190, 203, 217, 243, 269]),
+    (69, 122, [182, 196, 209, 223, 250, 277]),
+    (70, 125, [188, 202, 216, 230, 257, 285]),
+    (71, 129, [193, 207, 222, 236, 265, 293]),
+    (72, 133, [199, 213, 228, 243, 272, 302]),
+    (73, 136, [204, 219, 234, 250, 280, 310]),
+    (74, 140, [210, 225, 241, 257, 288, 319]),
+    (75, 144, [216, 232, 248, 264, 296, 328]),
+    (76, 148, [221, 238, 254, 271, 304, 336]),
+    (77, 152, [227, 244, 261, 278, 312, 345]),
+    (78, 156, [233, 250, 268, 285, 320, 354]),
+    (79, 160, [239, 257, 275, 292, 328, 363]),
+    (80, 164, [245, 264, 282, 300, 336, 373]),
+]
+
+# Extra allowance on every max weight, as a fraction: older applicants get a
+# little more room, and female applicants a little less. Ages are band starts.
+BUILD_AGE_BANDS = [(0, 0.0), (50, 0.02), (60, 0.04), (70, 0.06)]
+BUILD_SEX_ADJUST = {"M": 0.0, "F": -0.03}
+BUILD_DEFAULT_AGE = 40  # Used when a record has no age
+
+# =========================================================
+#  RX RULES (compiled by rules.py into one-pass matchers)
+# =========================================================
+# Lower priority number wins when several rules match the same drug.
+# "name_terms" are matched against the drug name typed in, "text_terms"
+# against the FDA indications text. Matching is case-insensitive substring.
+DRUG_RISK_RULES = [
+    {"priority": 10, "name_terms": ["metformin"],
+     "risk": "Diabetes Type 2", "style": "risk-med", "questions": ["Is this for Pre-Diabetes or Type 2?", "What is your A1C?", "Any neuropathy?"], "rating": "Standard (if A1C < 7.0) to Table 2."},
+    {"priority": 20, "name_terms": ["lisinopril", "amlodipine"],
+     "risk": "Hypertension (High BP)", "style": "risk-safe", "questions": ["Is BP controlled?", "Last reading?", "Do you take >2 BP meds?"], "rating": "Preferred Best possible."},
+    {"priority": 30, "name_terms": ["plavix", "clopidogrel"],
+     "risk": "Heart Disease / Stroke", "style": "risk-high", "questions": ["History of TIA/Stroke?", "Stent placement?"], "rating": "Standard to Decline."},
+    {"priority": 40, "name_terms": ["abilify", "aripiprazole"],
+     "risk": "Bipolar / Depression / Schizophrenia", "style": "risk-high", "questions": ["Hospitalizations in last 5 years?", "Suicide attempts?"], "rating": "Complex. Bipolar = Table Rating."},
+    {"priority": 50, "name_terms": ["entresto"],
+     "risk": "Heart Failure (CHF)", "style": "risk-high", "questions": ["What is your Ejection Fraction?", "Any hospitalizations recently?"], "rating": "Likely Decline."},
+    {"priority": 60, "text_terms": ["metastatic"],
+     "risk": "FLAGGED: Cancer (Severe)", "style": "risk-high", "questions": ["Diagnosis date?", "Treatment status?"], "rating": "Likely Decline."},
+    {"priority": 70, "text_terms": ["hiv"],
+     "risk": "FLAGGED: HIV/AIDS", "style": "risk-high", "questions": ["Current Viral Load?", "CD4 Count?"], "rating": "Table Rating to Decline."},
+]
+DEFAULT_DRUG_RISK = {"risk": "General / Maintenance", "style": "risk-safe", "questions": ["Why was this prescribed?", "Any symptoms?"], "rating": "Depends on condition."}
+
+CATEGORY_RULES = [
+    {"priority": 10, "category": "Diabetes", "text_terms": ["diabetes"], "name_terms": ["metformin"]},
+    {"priority": 20, "category": "Hypertension", "text_terms": ["hypertension"], "name_terms": ["lisinopril"]},
+    {"priority": 30, "category": "Cholesterol", "text_terms": ["cholesterol"], "name_terms": ["statin"]},
+    {"priority": 40, "category": "Cardiac", "text_terms": ["heart failure"], "name_terms": ["plavix"]},
+]
+DEFAULT_CATEGORY = "Other"
+
+# =========================================================
+#  DATA: DRUG TAGS & INTERACTION RULES (Multi-Med Combo Check)
+# =========================================================
+# A drug gets every tag whose terms match (same matching as the rules above),
+# so one med can carry several. The four category names are tags too.
+# A rule with "category" instead of terms tags only meds whose primary category
+# (CATEGORY_RULES) is that one: BP meds and diuretics mention heart failure and
+# angina too, and must not count as the "Heart" in Diabetes + Heart.
+DRUG_TAG_RULES = [
+    {"tag": "diabetes", "text_terms": ["diabetes", "glycemic control"],
+     "name_terms": ["metformin", "glipizide", "glimepiride", "insulin", "sitagliptin", "januvia", "pioglitazone"]},
+    {"tag": "hypertension", "text_terms": ["hypertension"],
+     "name_terms": ["lisinopril", "amlodipine", "losartan", "olmesartan", "benicar", "valsartan", "hydrochlorothiazide"]},
+    {"tag": "cholesterol", "text_terms": ["cholesterol", "hyperlipidemia"], "name_terms": ["statin"]},
+    {"tag": "cardiac", "category": "Cardiac"},
+    {"tag": "anticoagulant", "text_terms": ["factor xa inhibitor", "thrombin inhibitor", "vitamin k antagonist"],
+     "name_terms": ["eliquis", "apixaban", "xarelto", "rivaroxaban", "pradaxa", "dabigatran", "warfarin", "coumadin"]},
+    {"tag": "antiplatelet", "text_terms": ["platelet inhibitor"],
+     "name_terms": ["plavix", "clopidogrel", "aspirin", "brilinta", "ticagrelor", "prasugrel"]},
+    {"tag": "nsaid", "text_terms": ["nonsteroidal anti-inflammatory"],
+     "name_terms": ["meloxicam", "ibuprofen", "naproxen", "celecoxib", "diclofenac"]},
+    {"tag": "nitrate", "name_terms": ["nitroglycerin", "imdur", "isosorbide"]},
+    {"tag": "pde5", "text_terms": ["erectile dysfunction"],
+     "name_terms": ["viagra", "sildenafil", "cialis", "tadalafil", "levitra", "vardenafil"]},
+    {"tag": "opioid", "text_terms": ["opioid agonist"],
+     "name_terms": ["tramadol", "oxycodone", "hydrocodone", "morphine", "fentanyl", "methadone", "buprenorphine"]},
+    {"tag": "benzodiazepine", "text_terms": ["benzodiazepine"],
+     "name_terms": ["xanax", "alprazolam", "klonopin", "clonazepam", "valium", "diazepam", "ativan", "lorazepam"]},
+    {"tag": "sleep_aid", "text_terms": ["insomnia"], "name_terms": ["ambien", "zolpidem", "lunesta", "eszopiclone"]},
+    {"tag": "antidepressant", "text_terms": ["major depressive disorder"],
+     "name_terms": ["sertraline", "zoloft", "escitalopram", "lexapro", "citalopram", "fluoxetine", "prozac", "duloxetine",
+                    "cymbalta", "venlafaxine", "effexor", "bupropion", "wellbutrin", "trazodone"]},
+    {"tag": "antipsychotic", "text_terms": ["antipsychotic", "schizophrenia"],
+     "name_terms": ["abilify", "aripiprazole", "seroquel", "quetiapine"]},
+    {"tag": "respiratory", "text_terms": ["asthma", "copd", "chronic obstructive pulmonary"],
+     "name_terms": ["advair", "symbicort", "ventolin", "proair", "spiriva", "albuterol", "tiotropium", "montelukast"]},
+    {"tag": "immunosuppressant", "text_terms": ["tumor necrosis factor"],
+     "name_terms": ["humira", "adalimumab", "enbrel", "etanercept"]},
+    {"tag": "cancer", "text_terms": ["metastatic", "carcinoma", "melanoma", "lymphoma"], "name_terms": ["keytruda"]},
+    {"tag": "hiv", "text_terms": ["hiv-1 infection"], "name_terms": ["biktarvy"]},
+]
+
+# "needs" is {tag: how many different meds must carry it}. A finding is dropped
+# when a more specific one fires (it needs everything this one does, and more)
+# or when a fired rule lists it under "suppresses". Lower priority shows first;
+# "style" feeds the overall risk in batch scoring.
+INTERACTION_RULES = [
+    {"id": "metabolic_syndrome", "priority": 10, "style": "risk-high", "needs": {"diabetes": 1, "hypertension": 1, "cholesterol": 1},
+     "suppresses": ["diabetes_cardiac"],
+     "finding": "METABOLIC SYNDROME: Client has the 'Trifecta'. Look for carriers with Metabolic Syndrome credits."},
+    {"id": "diabetes_cardiac", "priority": 20, "style": "risk-high", "needs": {"diabetes": 1, "cardiac": 1},
+     "finding": "HIGH RISK (Diabetes + Heart): Compounded mortality risk. Expect Table 4+ or Decline."},
+    {"id": "triple_antithrombotic", "priority": 30, "style": "risk-high", "needs": {"anticoagulant": 1, "antiplatelet": 2},
+     "finding": "TRIPLE ANTITHROMBOTIC THERAPY: Usually within a year of a stent or heart attack. Expect Postpone or Table rating."},
+    {"id": "anticoagulant_antiplatelet", "priority": 40, "style": "risk-med", "needs": {"anticoagulant": 1, "antiplatelet": 1},
+     "finding": "BLEEDING RISK (Blood thinner + Antiplatelet): Typical after a stent. Ask for the stent date and cardiology notes."},
+    {"id": "duplicate_anticoagulants", "priority": 45, "style": "risk-med", "needs": {"anticoagulant": 2},
+     "finding": "TWO BLOOD THINNERS: Confirm which one is current; if both, ask about bleeding history."},
+    {"id": "anticoagulant_nsaid", "priority": 50, "style": "risk-med", "needs": {"anticoagulant": 1, "nsaid": 1},
+     "finding": "BLEEDING RISK (Blood thinner + NSAID): Ask about GI bleeds and how often the NSAID is taken."},
+    {"id": "pde5_nitrate", "priority": 55, "style": "risk-high", "needs": {"pde5": 1, "nitrate": 1},
+     "finding": "CONTRAINDICATED (ED med + Nitrate): Nitrates mean active angina. Ask about chest pain and recent cardiology visits."},
+    {"id": "opioid_benzo_sleep", "priority": 60, "style": "risk-high", "needs": {"opioid": 1, "benzodiazepine": 1, "sleep_aid": 1},
+     "finding": "HIGH RISK (Opioid + Benzodiazepine + Sleep aid): Several sedatives together. Likely Decline."},
+    {"id": "opioid_benzo", "priority": 65, "style": "risk-high", "needs": {"opioid": 1, "benzodiazepine": 1},
+     "finding": "HIGH RISK (Opioid + Benzodiazepine): FDA boxed-warning combination. Ask about dose, duration and any overdose history."},
+    {"id": "antidepressant_antipsychotic", "priority": 70, "style": "risk-high", "needs": {"antidepressant": 1, "antipsychotic": 1},
+     "finding": "PSYCH COMBINATION (Antidepressant + Antipsychotic): Points to bipolar or treatment-resistant depression. Ask about hospitalizations. Table Rating likely."},
+    {"id": "multiple_antidepressants", "priority": 75, "style": "risk-med", "needs": {"antidepressant": 2},
+     "finding": "MULTIPLE ANTIDEPRESSANTS: Suggests treatment-resistant depression. Ask about hospitalizations and suicide attempts."},
+    {"id": "resistant_hypertension", "priority": 80, "style": "risk-med", "needs": {"hypertension": 3},
+     "finding": "3+ BP MEDS: Possible resistant hypertension. Ask for recent readings before quoting Preferred."},
+    {"id": "diabetes_multi_drug", "priority": 85, "style": "risk-med", "needs": {"diabetes": 3},
+     "finding": "3+ DIABETES MEDS: Suggests hard-to-control diabetes. Get the latest A1C."},
+]
@@ -0,0 +1,433 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import fda_api
+import metrics
+from data import IMPAIRMENT_DATA, RISK_ORDER
+from label_cache import CACHEABLE_STATUSES, get_default_cache
+from label_kb import get_default_kb
+from name_index import get_default_index, normalize
+from rules import classify_drug_risk, classify_category, classify_tags, match_interactions, assess_comorbidities
+
+# =========================================================
+#  UNDERWRITING ENGINE (no Streamlit, safe to import anywhere)
+# =========================================================
+# Used by med_decoder.py (the Streamlit page) and batch_score.py (the
+# overnight CLI). Nothing in here may touch st.* or read session state.
+
+# =========================================================
+#  LOGIC ENGINES
+# =========================================================
+@metrics.timed("analyze_single_med")
+def analyze_single_med(indication_text, brand_name):
+    # Rules live in data.py (DRUG_RISK_RULES); rules.py compiles them into one matcher
+    return classify_drug_risk(indication_text, brand_name)
+
+def check_med_combinations(drug_tags):
+    # One tag set per distinct med (see drug_tags); rules live in data.py (INTERACTION_RULES)
+    return [rule["finding"] for rule in match_interactions(drug_tags)]
+
+def drug_tags(text, name):
+    return classify_tags(text, name)
+
+def simple_category_check(text, name):
+    return classify_category(text, name)
+
+def check_comorbidities(selected_conditions, is_smoker, current_bmi):
+    # Rules live in data.py (COMORBIDITY_RULES); use assess_comorbidities to get the bumped risks too
+    return assess_comorbidities(selected_conditions, is_smoker, current_bmi)["warnings"]
+
+def get_product_matrix(risk_level):
+    if risk_level == "risk-safe":
+        return [
+            {"Category": "Term (10-30yr)", "Outlook": "💎 Best", "Note": "Preferred Potential"},
+            {"Category": "Perm (IUL/UL/WL)", "Outlook": "💎 Best", "Note": "Standard/Preferred"},
+            {"Category": "Final Expense", "Outlook": "💎 Best", "Note": "Preferred Rates"},
+            {"Category": "Disability (DI)", "Outlook": "✅ Good", "Note": "Subject to Occupation"},
+            {"Category": "Long-Term Care", "Outlook": "💎 Best", "Note": "Standard/Preferred"}
+        ]
+    
+    elif risk_level == "risk-med":
+        return [
+            {"Category": "Term (10-30yr)", "Outlook": "✅ Good", "Note": "Standard Likely"},
+            {"Category": "Perm (IUL/UL/WL)", "Outlook": "✅ Good", "Note": "Standard Likely"},
+            {"Category": "Final Expense", "Outlook": "💎 Best", "Note": "Preferred Available"},
+            {"Category": "Disability (DI)", "Outlook": "⚠️ Rated", "Note": "Possible Exclusions"},
+            {"Category": "Long-Term Care", "Outlook": "✅ Good", "Note": "Standard Available"}
+        ]
+    
+    else: # risk-high (BMI > 33 or Smoker)
+        return [
+            {"Category": "Term (10-30yr)", "Outlook": "⚠️ Rated", "Note": "Table 2 to Table 4"},
+            {"Category": "Perm (IUL/UL/WL)", "Outlook": "✅ Good", "Note": "Standard to Table 2"}, # More lenient!
+            {"Category": "Final Expense", "Outlook": "💎 Best", "Note": "Preferred Available"},
+            {"Category": "Disability (DI)", "Outlook": "❌ Poor", "Note": "Decline"},
+            {"Category": "Long-Term Care", "Outlook": "⚠️ Rated", "Note": "Standard to Class 2"}
+        ]
+# =========================================================
+#  FDA LOOKUPS (offline knowledge base, then memory + on-disk cache, then api.fda.gov)
+# =========================================================
+def kb_record(drug_name):
+    # Labels ingested from the openFDA bulk dumps (label_kb.py); None when there is no KB or no such name
+    kb = get_default_kb()
+    if kb is None:
+        return None
+    record = kb.lookup(drug_name)
+    metrics.inc("rx_label_kb_total", result="hit" if record is not None else "miss")
+    return record
+
+def fetch_fda_single_drug(drug_name):
+    record = kb_record(drug_name)
+    if record is not None:
+        return 200, record
+    key = f"single:{drug_name.strip().lower()}"
+    return get_default_cache().get_or_fetch(key, lambda: fda_api.fetch_single_drug(drug_name))
+
+def fetch_fda_multi_drug(drug_name):
+    record = kb_record(drug_name)
+    if record is not None:
+        return 200, record
+    key = f"multi:{drug_name.strip().lower()}"
+    return get_default_cache().get_or_fetch(key, lambda: fda_api.fetch_multi_drug(drug_name))
+
+def preflight(name):
+    # Local junk / typo check (name_index.NameIndex.preflight). Junk and known misspellings skip
+    # openFDA; the index doesn't know every drug, so a "typo" guess is just the suggestion to
+    # show if openFDA 404s too
+    verdict, suggestion = get_default_index().preflight(name)
+    metrics.inc("rx_preflight_total", result=verdict)
+    return verdict, suggestion
+
+def resolve_fda_multi_drugs(meds):
+    # Junk and known misspellings as 404s without a call, KB and cached names (confirmed misses
+    # included) right away, the rest go out as batched openFDA queries
+    cache = get_default_cache()
+    pending = []
+    for i, med in enumerate(meds):
+        if preflight(med)[0] in ("junk", "misspelling"):
+            yield i, 404, None, None
+            continue
+        record = kb_record(med)
+        if record is not None:
+            yield i, 200, record, None
+            continue
+        key = f"multi:{med.strip().lower()}"
+        cached = cache.get(key, refresh=lambda m=med: fda_api.fetch_multi_drug(m))
+        if cached is not None:
+            yield (i, *cached, None)
+        else:
+            pending.append(i)
+    for j, status_code, record, err in fda_api.resolve_batch([meds[i] for i in pending]):
+        i = pending[j]
+        if status_code in CACHEABLE_STATUSES:
+            cache.put(f"multi:{meds[i].strip().lower()}", status_code, record)
+        yield i, status_code, record, err
+
+
+# =========================================================
+#  PAGE RESULTS (plain dicts, shared by the tabs and scoring_api.py)
+# =========================================================
+def decode_drug(drug_name, force=False):
+    """Tab 1: the label and risk insight for one drug, or a spelling suggestion if openFDA has nothing.
+
+    Input that isn't a drug name at all, or is a known misspelling, is answered locally
+    ("preflight" in the result says which) unless `force` is set, i.e. the agent insists
+    the name is right. A likely typo still goes to the KB and openFDA; its suggestion is
+    only shown if they miss too.
+    """
+    verdict, suggestion = preflight(drug_name)
+    if verdict in ("junk", "misspelling") and not force:
+        return {"found": False, "suggestion": suggestion, "preflight": verdict}
+    status_code, record = fetch_fda_single_drug(drug_name)
+    if status_code == 200:
+        brand = record.brand or drug_name
+        indications = record.indications or "No text found"
+        return {"found": True, "brand": brand, "indications": indications, "insight": analyze_single_med(indications, drug_name)}
+    if suggestion is None:
+        matches = [m for m, _ in get_default_index().suggest(drug_name, n=2) if normalize(m) != normalize(drug_name)]
+        suggestion = matches[0] if matches else None
+    return {"found": False, "suggestion": suggestion}
+
+def med_entry(med, status_code, record):
+    # What tab 2 keeps per drug: category, the generic name it dedupes on, and its interaction tags
+    if status_code != 200:
+        # Misses say whether the name was skipped as junk or looks like a known drug misspelled
+        verdict, suggestion = get_default_index().preflight(med)
+        return {"found": False, "junk": verdict == "junk", "suggestion": suggestion}
+    ind = record.indications
+    return {"found": True, "category": simple_category_check(ind, med), "drug_key": (record.generic or med).lower(),
+            "tags": sorted(drug_tags(ind, med))}
+
+def med_entries(meds):
+    """Tab 2 lookups: yields (i, entry, err) as each med resolves; entry is None when the lookup failed."""
+    for i, status_code, record, err in resolve_fda_multi_drugs(meds):
+        if err is not None:
+            yield i, None, err
+            continue
+        try:
+            entry = med_entry(meds[i], status_code, record)
+        except Exception as e:
+            yield i, None, e
+            continue
+        yield i, entry, None
+
+def combo_verdict(entries):
+    # Keyed by generic name, so "Plavix, Clopidogrel" counts as one antiplatelet
+    tags_by_drug = {}
+    for entry in entries:
+        if entry and entry["found"]:
+            tags_by_drug.setdefault(entry["drug_key"], set()).update(entry["tags"])
+    return check_med_combinations(list(tags_by_drug.values()))
+
+def analyze_impairments(conditions, is_smoker, bmi):
+    # --- UNIVERSAL RISK LOGIC (warnings + bumped risks from COMORBIDITY_RULES in one pass) ---
+    analysis = assess_comorbidities(conditions, is_smoker, bmi)
+    warnings = analysis["warnings"]
+    pdf_lines = []
+    if warnings: pdf_lines = ["--- WARNINGS ---"] + warnings + ["--- DETAILS ---"]
+    for cond in conditions:
+        data = IMPAIRMENT_DATA[cond]
+        # Keep the PDF lines logic behind the scenes
+        pdf_lines.append(f"Condition: {cond} | Rating: {data['rating']}")
+        for q in data['qs']: pdf_lines.append(f" - {q}")
+    return {"warnings": warnings, "risks": analysis["risks"], "pdf_lines": pdf_lines}
+
+# =========================================================
+#  BUILD (BMI)
+# =========================================================
+def bmi_category(bmi):
+    if bmi < 18.5: return "Underweight"
+    elif bmi < 27.5: return "Normal"
+    elif bmi <= 33.0: return "Overweight"  # Stays Overweight up to 33.0
+    else: return "Obese"
+
+def calculate_bmi(feet, inches, weight):
+    total_inches = (feet * 12) + inches
+    if total_inches <= 0:
+        return 0.0, "Normal"
+    bmi = round((weight / (total_inches ** 2)) * 703, 1)
+    return bmi, bmi_category(bmi)
+
+def rate_build(height_in, weight, age=None, sex=None):
+    """Build-chart class for one applicant: {"build_class", "risk", "bmi", "max_weight"}."""
+    from build_chart import get_default_chart  # NumPy is only needed once someone is rated
+    return get_default_chart().rate_one(height_in, weight, age, sex)
+
+def condition_risk(condition, is_smoker, current_bmi):
+    # Base 'risk' tag from IMPAIRMENT_DATA, bumped by the COMORBIDITY_RULES that fire for this one condition
+    return assess_comorbidities([condition], is_smoker, current_bmi)["risks"][condition]
+
+# =========================================================
+#  PDF REPORTS
+# =========================================================
+@metrics.timed("create_pdf")
+def create_pdf(title, items_list, analysis_text, risk_level=None, fda_text_content=None):
+    from fpdf import FPDF  # Loaded on the first report, not at boot
+    pdf = FPDF()
+    pdf.add_page()
+    
+    # This helper function strips emojis/non-latin characters that crash PDFs
+    def clean_text(text):
+        if not text: return ""
+        # Remove the specific emojis used in your matrix
+        safe_text = str(text).replace("💎", "").replace("✅", "").replace("⚠️", "").replace("❌", "")
+        # Remove any other non-standard characters
+        return safe_text.encode('ascii', 'ignore').decode('ascii')
+
+    # Title
+    pdf.set_font("Arial", 'B', 16)
+    pdf.cell(200, 10, txt=clean_text(f"Rx Assistant - {title}"), ln=True, align='C')
+    pdf.ln(10)
+
+    # Items Analyzed Section
+    pdf.set_font("Arial", 'B', 12)
+    pdf.cell(200, 10, txt="Items Analyzed:", ln=True)
+    pdf.set_font("Arial", size=11)
+    for item in items_list:
+        pdf.cell(200, 8, txt=clean_text(f"- {item}"), ln=True)
+    pdf.ln(5)
+
+    # Underwriting Analysis Section
+    pdf.set_font("Arial", 'B', 12)
+    pdf.cell(200, 10, txt="Underwriting Analysis:", ln=True)
+    pdf.set_font("Arial", size=11)
+    if isinstance(analysis_text, list):
+        for line in analysis_text:
+            pdf.multi_cell(0, 8, txt=clean_text(line))
+    else:
+        pdf.multi_cell(0, 8, txt=clean_text(analysis_text))
+
+    # --- PURE TEXT PRODUCT OUTLOOK (STABLE VERSION) ---
+    if risk_level:
+        pdf.ln(5)
+        pdf.set_font("Arial", 'B', 12)
+        pdf.set_text_color(230, 81, 0) # Professional Orange
+        pdf.cell(200, 10, txt="PRODUCT SUITABILITY OUTLOOK:", ln=True)
+        pdf.set_text_color(0, 0, 0) # Reset to Black
+        
+        pdf.set_font("Arial", size=10)
+        # Pull the data from your matrix function
+        matrix_data = get_product_matrix(risk_level)
+        for row in matrix_data:
+            # Format: PRODUCT: OUTLOOK -- NOTE
+            cat = clean_text(row['Category']).upper()
+            out = clean_text(row['Outlook']).strip()
+            note = clean_text(row['Note'])
+            pdf.multi_cell(0, 7, txt=f"{cat}: {out} -- {note}")
+            pdf.ln(1)
+
+    # FDA Text (Optional)
+    if fda_text_content:
+        pdf.ln(5)
+        pdf.set_font("Arial", 'B', 12)
+        pdf.cell(200, 10, txt="Official FDA Indications (Excerpt):", ln=True)
+        pdf.set_font("Arial", size=9)
+        pdf.multi_cell(0, 5, txt=clean_text(fda_text_content[:1500] + "..."))
+
+    return pdf.output(dest='S').encode('latin-1')
+
+# --- RENDERED PDF CACHE (content-addressed, shared by every session) ---
+PDF_CACHE_MAX_BYTES = int(float(os.environ.get("PDF_CACHE_MAX_MB", "32")) * 1024 * 1024)
+_pdf_cache = OrderedDict()  # sha256 of report content -> PDF bytes
+_pdf_cache_bytes = 0
+_pdf_lock = threading.Lock()
+
+def report_key(title, items_list, analysis_text, risk_level=None, fda_text_content=None):
+    content = [title, list(items_list), analysis_text, risk_level, fda_text_content]
+    return hashlib.sha256(json.dumps(content, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def clear_pdf_cache():
+    global _pdf_cache_bytes
+    with _pdf_lock:
+        _pdf_cache.clear()
+        _pdf_cache_bytes = 0
+
+def render_pdf(title, items_list, analysis_text, risk_level=None, fda_text_content=None):
+    """create_pdf, memoized by a hash of the report content in a byte-bounded LRU."""
+    global _pdf_cache_bytes
+    key = report_key(title, items_list, analysis_text, risk_level, fda_text_content)
+    with _pdf_lock:
+        if key in _pdf_cache:
+            _pdf_cache.move_to_end(key)
+            metrics.inc("rx_pdf_cache_total", result="hit")
+            return _pdf_cache[key]
+    metrics.inc("rx_pdf_cache_total", result="miss")
+    pdf_bytes = create_pdf(title, items_list, analysis_text, risk_level=risk_level, fda_text_content=fda_text_content)
+    with _pdf_lock:
+        if key not in _pdf_cache:
+            _pdf_cache[key] = pdf_bytes
+            _pdf_cache_bytes += len(pdf_bytes)
+            while _pdf_cache_bytes > PDF_CACHE_MAX_BYTES and len(_pdf_cache) > 1:
+                _, evicted = _pdf_cache.popitem(last=False)
+                _pdf_cache_bytes -= len(evicted)
+    return pdf_bytes
+
+# =========================================================
+#  APPLICANT SCORING (one client record in, one result out)
+# =========================================================
+def _as_list(value):
+    if not value: return []
+    if isinstance(value, str): value = value.replace(";", ",").split(",")
+    return [str(v).strip() for v in value if str(v).strip()]
+
+def _as_bool(value):
+    if isinstance(value, str): return value.strip().lower() in ("1", "y", "yes", "true", "t", "smoker")
+    return bool(value)
+
+def _as_number(value, default=0.0):
+    try: return float(value) if value not in (None, "") else default
+    except (TypeError, ValueError): return default
+
+def applicant_height(record):
+    if record.get("height_in") not in (None, ""):
+        return _as_number(record["height_in"])
+    return _as_number(record.get("feet")) * 12 + _as_number(record.get("inches"))
+
+def applicant_bmi(record):
+    if record.get("weight") not in (None, ""):
+        return calculate_bmi(0, applicant_height(record), _as_number(record["weight"]))
+    bmi = _as_number(record.get("bmi"))
+    return bmi, (bmi_category(bmi) if bmi > 0 else "Normal")
+
+def rate_builds(records):
+    """Build-chart ratings for a list of applicant records, in one vectorized pass over the chart."""
+    from build_chart import get_default_chart
+    heights = [applicant_height(r) for r in records]
+    weights = [_as_number(r.get("weight")) for r in records]
+    ages = [_as_number(r.get("age"), float("nan")) for r in records]
+    rated = get_default_chart().rate(heights, weights, ages, [r.get("sex") or r.get("gender") for r in records])
+    return [{"build_class": c, "risk": s} for c, s in zip(rated["build_class"].tolist(), rated["risk"].tolist())]
+
+def score_applicant(record, use_fda=True, build=None):
+    """Score one applicant dict (meds, conditions, smoker, feet/inches or height_in, weight, age, sex).
+
+    Mirrors what the three tabs show for the same inputs. With use_fda=False meds are
+    classified from their names alone (no network). `build` is this record's entry from
+    rate_builds() when the caller has already rated a whole batch.
+    """
+    meds = [m for m in _as_list(record.get("meds")) if len(m) >= 3]
+    conditions = _as_list(record.get("conditions"))
+    is_smoker = _as_bool(record.get("smoker"))
+    bmi, bmi_category = applicant_bmi(record)
+
+    lookups = {}
+    if use_fda:
+        lookups = {i: (status_code, label, err) for i, status_code, label, err in resolve_fda_multi_drugs(meds)}
+    med_results = []
+    for i, med in enumerate(meds):
+        ind, brand, found = "", med, None
+        if use_fda:
+            status_code, label, err = lookups.get(i, (None, None, None))
+            if isinstance(err, fda_api.RateLimited):
+                # Unknown rather than not found, so a re-run can pick it up
+                med_results.append({"name": med, "found": None, "error": "rate limited"})
+                continue
+            if err is not None or status_code != 200:
+                med_results.append({"name": med, "found": False, "error": str(err) if err else f"HTTP {status_code}"})
+                continue
+            ind = label.indications
+            brand = label.brand or med
+            found = True
+        insight = analyze_single_med(ind, med)
+        # Same drug typed twice (or as brand and generic) only counts once toward a combination
+        drug_key = ((label.generic if found else None) or med).lower()
+        med_results.append({"name": med, "found": found, "brand": brand, "category": simple_category_check(ind, med),
+                            "tags": sorted(drug_tags(ind, med)), "drug_key": drug_key,
+                            "risk": insight["risk"], "style": insight["style"], "rating": insight["rating"]})
+
+    tags_by_drug = {}
+    for m in med_results:
+        if "tags" in m:
+            tags_by_drug.setdefault(m.pop("drug_key"), set()).update(m["tags"])
+    interactions = match_interactions(list(tags_by_drug.values()))
+    combinations = [rule["finding"] for rule in interactions]
+    assessment = assess_comorbidities(conditions, is_smoker, bmi)
+    warnings = assessment["warnings"]
+
+    cond_results = []
+    for cond in conditions:
+        if cond not in IMPAIRMENT_DATA:
+            cond_results.append({"name": cond, "known": False})
+            continue
+        cond_results.append({"name": cond, "known": True, "rating": IMPAIRMENT_DATA[cond]["rating"],
+                             "risk": assessment["risks"][cond]})
+
+    styles = [m["style"] for m in med_results if m.get("style")] + [c["risk"] for c in cond_results if c.get("risk")]
+    styles += [rule["style"] for rule in interactions]
+    styles.append(assessment["floor"])
+    if build is None:
+        build = rate_builds([record])[0]
+    if build["risk"]:
+        styles.append(build["risk"])
+    overall = max(styles, key=RISK_ORDER.index) if styles else "risk-safe"
+
+    return {
+        "id": record.get("id"),
+        "bmi": bmi, "bmi_category": bmi_category, "build_class": build["build_class"], "smoker": is_smoker,
+        "meds": med_results, "combinations": combinations,
+        "conditions": cond_results, "warnings": warnings,
+        "overall_risk": overall, "product_matrix": get_product_matrix(overall),
+    }
@@ -0,0 +1,338 @@
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+from label_record import LabelRecord
+
+# =========================================================
+#  OPENFDA HTTP CLIENT (no Streamlit in here)
+# =========================================================
+FDA_LABEL_URL = os.environ.get("OPENFDA_LABEL_URL", "https://api.fda.gov/drug/label.json")
+FDA_TIMEOUT = 10
+MAX_LOOKUP_WORKERS = int(os.environ.get("FDA_MAX_WORKERS", "8"))
+
+# Batched lookups: how many names one OR'ed query may carry
+BATCH_MAX_TERMS = 20
+BATCH_MAX_SEARCH_CHARS = 1500
+BATCH_RESULTS_PER_NAME = 3
+FDA_MAX_LIMIT = 1000
+
+# Upstream quota. openFDA allows 240 requests/minute per IP without a key; 0 turns the limiter off
+FDA_RATE_PER_MIN = float(os.environ.get("FDA_RATE_PER_MIN", "240"))
+FDA_RATE_BURST = int(os.environ.get("FDA_RATE_BURST", "20"))
+FDA_MAX_QUEUE_WAIT = float(os.environ.get("FDA_MAX_QUEUE_WAIT", "15"))  # seconds a lookup may wait for a slot
+FDA_429_RETRIES = 2
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    # One keep-alive session per process, shared by every lookup thread
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=MAX_LOOKUP_WORKERS)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+    return _session
+
+
+# =========================================================
+#  UPSTREAM GATEWAY (single-flight + token bucket + 429 backoff)
+# =========================================================
+# Every openFDA request in the process goes through one gateway:
+#   - identical requests already in flight are shared, not repeated
+#   - a token bucket keeps us under the quota; callers queue for a slot
+#   - a 429 pauses the whole bucket for Retry-After, then the call retries
+# A request that is still throttled raises RateLimited. It is never turned
+# into a 404, so nothing downstream caches it or reports the drug as missing.
+
+class RateLimited(requests.exceptions.RequestException):
+    def __init__(self, retry_after=None):
+        super().__init__(f"openFDA rate limit hit (retry after {retry_after or '?'}s)")
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    def __init__(self, rate_per_sec, burst):
+        self.rate = rate_per_sec
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout=None):
+        """Wait for a slot; False (without taking one) if it is further away than `timeout`."""
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._paused_until)
+            if not self.rate:
+                wait = start - now
+            else:
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                # Tokens may go negative: each caller books the next free slot, so waiters go in arrival order
+                wait = start - now + max(0.0, 1 - self._tokens) / self.rate
+            if timeout is not None and wait > timeout:
+                return False
+            if self.rate:
+                self._tokens -= 1
+        if wait > 0:
+            time.sleep(wait)
+        return True
+
+    def pause(self, seconds):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = min(self._tokens, 0.0)
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """Run fn() once for every caller asking for `key` while it is in flight."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            metrics.inc("rx_openfda_coalesced_total")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+def _retry_after(response, attempt):
+    value = response.headers.get("Retry-After", "")
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        from email.utils import parsedate_to_datetime
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return 2.0 ** attempt  # No usable header: plain exponential backoff
+
+
+class UpstreamGateway:
+    def __init__(self, rate_per_min=FDA_RATE_PER_MIN, burst=FDA_RATE_BURST, max_queue_wait=FDA_MAX_QUEUE_WAIT,
+                 max_retries=FDA_429_RETRIES):
+        self.bucket = TokenBucket(rate_per_min / 60.0, burst)
+        self.flight = SingleFlight()
+        self.max_queue_wait = max_queue_wait
+        self.max_retries = max_retries
+
+    def fetch(self, search, limit=1):
+        return self.flight.do((search, limit), lambda: self._fetch(search, limit))
+
+    def _fetch(self, search, limit):
+        url = f'{FDA_LABEL_URL}?search={search}&limit={limit}'
+        for attempt in range(self.max_retries + 1):
+            with metrics.timer("openfda_queue_wait"):
+                got_slot = self.bucket.acquire(self.max_queue_wait)
+            if not got_slot:
+                metrics.inc("rx_openfda_responses_total", status="local_throttle")
+                raise RateLimited()
+            try:
+                with metrics.timer("openfda_request"):
+                    r = get_session().get(url, timeout=FDA_TIMEOUT)
+            except requests.exceptions.RequestException:
+                metrics.inc("rx_openfda_responses_total", status="network_error")
+                raise
+            metrics.inc("rx_openfda_responses_total", status=r.status_code)
+            if r.status_code != 429:
+                break
+            wait = _retry_after(r, attempt)
+            self.bucket.pause(wait)
+            if attempt == self.max_retries or wait > self.max_queue_wait:
+                raise RateLimited(wait)
+        if r.status_code != 200:
+            return r.status_code, None
+        with metrics.timer("json_parse"):
+            return r.status_code, r.json()
+
+
+_default_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_default_gateway():
+    global _default_gateway
+    with _gateway_lock:
+        if _default_gateway is None:
+            _default_gateway = UpstreamGateway()
+    return _default_gateway
+
+
+def set_default_gateway(gateway):
+    global _default_gateway
+    with _gateway_lock:
+        _default_gateway = gateway
+
+
+def fetch_label(search, limit=1):
+    return get_default_gateway().fetch(search, limit)
+
+
+def fetch_record(search):
+    # openFDA has no field selection, so the label is trimmed to a LabelRecord right after parsing
+    status_code, payload = fetch_label(search)
+    record = LabelRecord.from_payload(payload) if status_code == 200 else None
+    return (status_code, record) if record is not None or status_code != 200 else (404, None)
+
+
+def fetch_single_drug(drug_name):
+    return fetch_record(f'openfda.brand_name:"{drug_name}"+openfda.generic_name:"{drug_name}"')
+
+
+def fetch_multi_drug(drug_name):
+    return fetch_record(f'openfda.brand_name:"{drug_name}"')
+
+
+def lookup_many(names, fetch=fetch_multi_drug, max_workers=MAX_LOOKUP_WORKERS, initializer=None):
+    """Run `fetch` for every name on a bounded thread pool.
+
+    Yields (index, status_code, payload, error) as each lookup finishes, so the
+    caller can render in completion order while slotting results back into input order.
+    """
+    if not names:
+        return
+    workers = max(1, min(max_workers, len(names)))
+    with ThreadPoolExecutor(max_workers=workers, initializer=initializer) as pool:
+        futures = {pool.submit(fetch, name): i for i, name in enumerate(names)}
+        for fut in as_completed(futures):
+            i = futures[fut]
+            try:
+                status_code, payload = fut.result()
+                yield i, status_code, payload, None
+            except Exception as e:
+                yield i, None, None, e
+
+
+# =========================================================
+#  BATCH RESOLVER (many names per openFDA request)
+# =========================================================
+def _brand_term(name):
+    return f'openfda.brand_name:"{name}"'
+
+
+def chunk_names(names, max_terms=BATCH_MAX_TERMS, max_chars=BATCH_MAX_SEARCH_CHARS):
+    chunks, current, size = [], [], 0
+    for name in names:
+        term_len = len(_brand_term(name)) + 1
+        if current and (len(current) >= max_terms or size + term_len > max_chars):
+            chunks.append(current)
+            current, size = [], 0
+        current.append(name)
+        size += term_len
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def fetch_batch(names):
+    search = "+".join(_brand_term(n) for n in names)
+    return fetch_label(search, limit=min(FDA_MAX_LIMIT, BATCH_RESULTS_PER_NAME * len(names)))
+
+
+def match_label(name, results):
+    """Pick the label in `results` that best belongs to `name`.
+
+    Exact brand > brand phrase > exact generic > generic phrase; None if nothing fits.
+    """
+    n = name.strip().lower()
+    phrase = re.compile(rf"\b{re.escape(n)}\b")
+    best, best_rank = None, 4
+    for label in results:
+        ofda = label.get("openfda", {})
+        brands = [b.lower() for b in ofda.get("brand_name", [])]
+        generics = [g.lower() for g in ofda.get("generic_name", [])]
+        if n in brands: rank = 0
+        elif any(phrase.search(b) for b in brands): rank = 1
+        elif n in generics: rank = 2
+        elif any(phrase.search(g) for g in generics): rank = 3
+        else: continue
+        if rank < best_rank:
+            best, best_rank = label, rank
+            if rank == 0:
+                break
+    return best
+
+
+def resolve_batch(names, max_workers=MAX_LOOKUP_WORKERS):
+    """Resolve a med list with as few openFDA calls as possible.
+
+    Same contract as lookup_many: yields (index, status_code, record, error) per
+    input name as results arrive. Names the batch answer can't be attributed to
+    fall back to one fetch_multi_drug call each.
+    """
+    positions = {}
+    for i, name in enumerate(names):
+        positions.setdefault(name.strip().lower(), []).append(i)
+    unique = list(positions)
+    chunks = chunk_names(unique)
+
+    leftovers = []
+    for ci, status_code, payload, err in lookup_many(chunks, fetch_batch, max_workers):
+        chunk = chunks[ci]
+        if isinstance(err, RateLimited):
+            # Splitting the chunk into single lookups would only queue more throttled calls
+            for name in chunk:
+                for i in positions[name]:
+                    yield i, None, None, err
+            continue
+        if err is not None or status_code not in (200, 404):
+            leftovers.extend(chunk)
+            continue
+        results = payload.get("results", []) if status_code == 200 else []
+        for name in chunk:
+            label = match_label(name, results)
+            if label is not None:
+                record = LabelRecord.from_label(label)
+                for i in positions[name]:
+                    yield i, 200, record, None
+            elif status_code == 404:
+                # Nothing in the whole OR query matched, so no single lookup would either
+                for i in positions[name]:
+                    yield i, 404, None, None
+            else:
+                leftovers.append(name)
+
+    for li, status_code, payload, err in lookup_many(leftovers, fetch_multi_drug, max_workers):
+        for i in positions[leftovers[li]]:
+            yield i, status_code, payload, err
@@ -0,0 +1,377 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import metrics
+from label_record import LabelRecord
+
+# =========================================================
+#  TWO-TIER LABEL CACHE (memory LRU over an on-disk SQLite LRU)
+# =========================================================
+# Entries older than the TTL are still served ("stale hit") while a background
+# refresh runs. A failed refresh keeps the old entry, so if api.fda.gov is down
+# the last good label keeps being served.
+#
+# Confirmed misses (404: openFDA has no label for the name) are kept too, but
+# only for negative_ttl and never served stale, so a typo costs one round trip
+# per window instead of one per keystroke.
+#
+# Values are LabelRecords. The memory tier is bounded in bytes, not entries.
+#
+# The SQLite file is shared by every worker process. It runs in WAL mode so reads
+# never wait for another process's write, and each thread borrows its own
+# connection from a pool, so nothing holds the in-process lock while SQLite is
+# busy. A write that can't get the file within the (short) busy timeout is
+# skipped; the memory tier still has the entry.
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "fda_labels.sqlite3")
+
+
+# A label, or openFDA's confirmed "no such drug"
+CACHEABLE_STATUSES = (200, 404)
+
+# Seconds a write waits for another process's write before giving up
+BUSY_TIMEOUT = float(os.environ.get("LABEL_CACHE_BUSY_TIMEOUT", "0.25"))
+# Disk hits only note their last_used in memory; the notes are written in one
+# batch once there are TOUCH_BATCH of them or the oldest is TOUCH_FLUSH_SECONDS old
+TOUCH_BATCH = 64
+TOUCH_FLUSH_SECONDS = 5.0
+# The disk tier's size is tracked from this process's own writes; the real SUM is
+# only taken when that says it's over the limit, or after DISK_RESYNC_SECONDS
+# (other processes write to the same file)
+DISK_RESYNC_SECONDS = 60.0
+
+# OrderedDict node + entry tuple + key object, roughly
+_ENTRY_OVERHEAD = 200
+
+
+def _dump(record):
+    return json.dumps(record.to_dict() if record is not None else None, separators=(",", ":"))
+
+
+def _load(blob):
+    return LabelRecord.from_dict(json.loads(blob))
+
+
+class LabelCache:
+    def __init__(self, path=DEFAULT_PATH, ttl=86400, max_disk_bytes=50 * 1024 * 1024,
+                 max_memory_bytes=16 * 1024 * 1024, negative_ttl=900):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_disk_bytes = max_disk_bytes
+        self.max_memory_bytes = max_memory_bytes
+        self._mem = OrderedDict()  # key -> (stored_at, status_code, record)
+        self._mem_sizes = {}
+        self._mem_bytes = 0
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix="label-refresh")
+        self._stats = {"hits": 0, "memory_hits": 0, "disk_hits": 0, "stale_hits": 0, "negative_hits": 0, "misses": 0,
+                       "refreshes": 0, "refresh_errors": 0, "evictions": 0}
+        self._path = None
+        self._pool = queue.SimpleQueue()  # idle sqlite connections
+        self._touched = {}  # key -> last_used not yet written to disk
+        self._touched_since = 0.0
+        self._disk_bytes = 0
+        self._disk_synced = 0.0
+        if path:
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                db = sqlite3.connect(path, check_same_thread=False, timeout=30)  # Setup only, once per process
+                db.execute("PRAGMA journal_mode=WAL")
+                db.execute("CREATE TABLE IF NOT EXISTS labels (key TEXT PRIMARY KEY, status INTEGER, payload TEXT,"
+                           " size INTEGER, stored_at REAL, last_used REAL)")
+                db.execute("CREATE INDEX IF NOT EXISTS labels_last_used ON labels (last_used)")
+                db.commit()
+                self._disk_bytes = db.execute("SELECT COALESCE(SUM(size), 0) FROM labels").fetchone()[0]
+                self._disk_synced = time.monotonic()
+                db.close()
+                self._path = path
+            except sqlite3.Error as e:
+                # A read-only dyno filesystem shouldn't take the app down; run memory-only
+                print(f"Label cache disk tier disabled ({path}): {e}")
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            path=os.environ.get("LABEL_CACHE_PATH", DEFAULT_PATH),
+            ttl=float(os.environ.get("LABEL_CACHE_TTL", "86400")),
+            max_disk_bytes=int(float(os.environ.get("LABEL_CACHE_MAX_MB", "50")) * 1024 * 1024),
+            max_memory_bytes=int(float(os.environ.get("LABEL_CACHE_MEMORY_MB", "16")) * 1024 * 1024),
+            negative_ttl=float(os.environ.get("LABEL_CACHE_NEGATIVE_TTL", "900")),
+        )
+
+    # ---------- public API ----------
+    def get(self, key, refresh=None):
+        """Cached (status_code, record) for `key`, or None on a miss.
+
+        A stale entry is still returned; if `refresh` is given it is re-fetched in the background.
+        An expired 404 is a miss, so the caller asks openFDA again.
+        """
+        entry = self._get(key)
+        if entry is None:
+            self._bump("misses")
+            return None
+        stored_at, status_code, record = entry
+        if status_code == 404:
+            if time.time() - stored_at >= self.negative_ttl:
+                self._bump("misses")
+                return None
+            self._bump("negative_hits")
+        elif time.time() - stored_at < self.ttl:
+            self._bump("hits")
+        else:
+            self._bump("stale_hits")
+            if refresh is not None:
+                self._schedule_refresh(key, refresh)
+        return status_code, record
+
+    def get_or_fetch(self, key, fetch):
+        """Return (status_code, record) for `key`, calling `fetch()` on a miss.
+
+        200s and 404s are stored; anything else (5xx, 400...) is passed straight through.
+        """
+        cached = self.get(key, refresh=fetch)
+        if cached is not None:
+            return cached
+        status_code, record = fetch()
+        if status_code in CACHEABLE_STATUSES:
+            self.put(key, status_code, record)
+        return status_code, record
+
+    def put(self, key, status_code, record, stored_at=None):
+        stored_at = stored_at or time.time()
+        self._remember(key, (stored_at, status_code, record))
+        if self._path is None:
+            return
+        blob = _dump(record)
+        with self._conn() as db:
+            try:
+                old = db.execute("SELECT size FROM labels WHERE key = ?", (key,)).fetchone()
+                db.execute("INSERT OR REPLACE INTO labels VALUES (?, ?, ?, ?, ?, ?)",
+                           (key, status_code, blob, len(blob), stored_at, time.time()))
+                self._flush_touches(db)
+                self._evict_disk(db, len(blob) - (old[0] if old else 0))
+                db.commit()
+            except sqlite3.Error as e:
+                # Another worker process holding the write lock; the memory tier still has it
+                db.rollback()
+                print(f"Label cache disk write skipped for {key}: {e}")
+
+    def put_many(self, entries):
+        """Bulk-load [(key, status_code, record, stored_at)] in one transaction.
+
+        An entry never replaces one that was stored more recently.
+        """
+        loaded = 0
+        for key, status_code, record, stored_at in entries:
+            current = self.peek(key)
+            if current is None or current[0] < stored_at:
+                self._remember(key, (stored_at, status_code, record))
+                loaded += 1
+        if self._path is None:
+            return loaded
+        now = time.time()
+        rows = []
+        for key, status_code, record, stored_at in entries:
+            blob = _dump(record)
+            rows.append((key, status_code, blob, len(blob), stored_at, now))
+        with self._conn() as db:
+            try:
+                db.executemany("INSERT INTO labels VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(key) DO UPDATE SET"
+                               " status = excluded.status, payload = excluded.payload, size = excluded.size,"
+                               " stored_at = excluded.stored_at WHERE excluded.stored_at > labels.stored_at", rows)
+                self._evict_disk(db, resync=True)
+                db.commit()
+            except sqlite3.Error as e:
+                db.rollback()
+                print(f"Label cache bulk load skipped: {e}")
+        return loaded
+
+    def peek(self, key):
+        """(stored_at, status_code, record) or None, without counting a hit or touching LRU order."""
+        with self._lock:
+            entry = self._mem.get(key)
+        if entry is not None or self._path is None:
+            return entry
+        with self._conn() as db:
+            row = db.execute("SELECT stored_at, status, payload FROM labels WHERE key = ?", (key,)).fetchone()
+        return None if row is None else (row[0], row[1], _load(row[2]))
+
+    def recent_keys(self, n, prefix=""):
+        """Up to n keys starting with `prefix`, most recently used first."""
+        if self._path is not None:
+            with self._conn() as db:
+                self._flush_touches(db, force=True)
+                rows = db.execute("SELECT key FROM labels WHERE substr(key, 1, ?) = ? ORDER BY last_used DESC LIMIT ?",
+                                  (len(prefix), prefix, n)).fetchall()
+            return [r[0] for r in rows]
+        with self._lock:
+            return [k for k in reversed(self._mem) if k.startswith(prefix)][:n]
+
+    def stats(self):
+        with self._lock:
+            out = dict(self._stats)
+            out["memory_entries"] = len(self._mem)
+            out["memory_bytes"] = self._mem_bytes
+        if self._path is not None:
+            with self._conn() as db:
+                out["disk_entries"], out["disk_bytes"] = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM labels").fetchone()
+        served = out["hits"] + out["stale_hits"] + out["negative_hits"]
+        lookups = served + out["misses"]
+        out["hit_ratio"] = round(served / lookups, 3) if lookups else 0.0
+        return out
+
+    # ---------- internals ----------
+    @contextmanager
+    def _conn(self):
+        # A connection of our own for as long as we need it; never used by two threads at once
+        try:
+            db = self._pool.get_nowait()
+        except queue.Empty:
+            db = sqlite3.connect(self._path, check_same_thread=False, timeout=BUSY_TIMEOUT)
+            db.execute("PRAGMA synchronous=NORMAL")  # Safe with WAL; a crash can only lose cache entries
+        try:
+            yield db
+        finally:
+            self._pool.put(db)
+
+    def _bump(self, name, n=1):
+        with self._lock:
+            self._stats[name] += n
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._mem.get(key)
+            if entry is not None:
+                self._mem.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return entry
+        if self._path is None:
+            return None
+        with self._conn() as db:
+            row = db.execute("SELECT stored_at, status, payload FROM labels WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            with self._lock:
+                if not self._touched:
+                    self._touched_since = time.monotonic()
+                self._touched[key] = time.time()
+                self._stats["disk_hits"] += 1
+            self._flush_touches(db)
+        entry = (row[0], row[1], _load(row[2]))
+        self._remember(key, entry)
+        return entry
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._mem[key] = entry
+            self._mem.move_to_end(key)
+            size = _ENTRY_OVERHEAD + len(key) + (entry[2].nbytes() if entry[2] is not None else 0)
+            self._mem_bytes += size - self._mem_sizes.get(key, 0)
+            self._mem_sizes[key] = size
+            while self._mem_bytes > self.max_memory_bytes and len(self._mem) > 1:
+                old, _ = self._mem.popitem(last=False)
+                self._mem_bytes -= self._mem_sizes.pop(old)
+
+    def _flush_touches(self, db, force=False):
+        # Writes the pending last_used notes in one statement. Losing them (busy file, exit)
+        # only makes the LRU order a little less exact
+        with self._lock:
+            due = self._touched and (force or len(self._touched) >= TOUCH_BATCH
+                                     or time.monotonic() - self._touched_since >= TOUCH_FLUSH_SECONDS)
+            if not due:
+                return
+            touched, self._touched = self._touched, {}
+        in_transaction = db.in_transaction
+        try:
+            db.executemany("UPDATE labels SET last_used = ? WHERE key = ?", [(t, k) for k, t in touched.items()])
+            if not in_transaction:
+                db.commit()
+        except sqlite3.Error:
+            if not in_transaction:
+                db.rollback()
+
+    def _evict_disk(self, db, grown=0, resync=False):
+        # Inside the caller's write transaction on `db`
+        with self._lock:
+            self._disk_bytes += grown
+            resync = (resync or self._disk_bytes > self.max_disk_bytes
+                      or time.monotonic() - self._disk_synced >= DISK_RESYNC_SECONDS)
+        if not resync:
+            return
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM labels").fetchone()[0]
+        with self._lock:
+            self._disk_bytes, self._disk_synced = total, time.monotonic()
+        if total <= self.max_disk_bytes:
+            return
+        self._flush_touches(db, force=True)
+        evicted = 0
+        for key, size in db.execute("SELECT key, size FROM labels ORDER BY last_used").fetchall():
+            db.execute("DELETE FROM labels WHERE key = ?", (key,))
+            evicted += 1
+            total -= size
+            if total <= self.max_disk_bytes:
+                break
+        with self._lock:
+            self._disk_bytes = total
+            self._stats["evictions"] += evicted
+
+    def _schedule_refresh(self, key, fetch):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        self._refresher.submit(self._refresh, key, fetch)
+
+    def _refresh(self, key, fetch):
+        try:
+            status_code, record = fetch()
+            if status_code == 200:
+                self.put(key, status_code, record)
+                self._bump("refreshes")
+            else:
+                self._bump("refresh_errors")
+        except Exception:
+            # Upstream unreachable: keep serving the last good label
+            self._bump("refresh_errors")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_default_cache():
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = LabelCache.from_env()
+    return _default_cache
+
+
+def set_default_cache(cache):
+    """Swap the process-wide cache (benchmarks and load tests start from a known state)."""
+    global _default_cache
+    with _default_lock:
+        _default_cache = cache
+
+
+def _export_stats():
+    if _default_cache is None:
+        return {}
+    stats = _default_cache.stats()
+    out = {f"rx_label_cache_{k}_total": stats[k] for k in ("hits", "stale_hits", "negative_hits", "misses", "refreshes", "refresh_errors", "evictions")}
+    out.update({f"rx_label_cache_{k}": v for k, v in stats.items() if k in ("memory_entries", "memory_bytes", "disk_entries", "disk_bytes")})
+    return out
+
+
+metrics.register_collector(_export_stats)
@@ -0,0 +1,461 @@
+"""Offline label knowledge base built from openFDA's bulk drug-label downloads.
+
+    python label_kb.py ingest drug-label-0001-of-0013.json.zip drug-label-0002-of-0013.json.zip ...
+    python label_kb.py ingest newer-dump/*.json.zip                 # incremental: newer labels replace older ones
+    python label_kb.py ingest --replace drug-label-*.json.zip       # start over from a full dump
+    python label_kb.py lookup Eliquis "Metformin Hydrochloride"
+    python label_kb.py stats
+
+The dumps (https://open.fda.gov/apis/downloads/, .json.zip, .json.gz or plain
+.json) are read as a stream, one label at a time, so a 1 GB file never has to
+fit in memory. benchmarks/fixtures/openfda_labels.json is a small sample dump.
+With a knowledge base in place engine.py answers lookups from it and only goes
+to api.fda.gov for names it doesn't have.
+"""
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+import time
+import zipfile
+import zlib
+
+from data import NAME_FILLER_WORDS, NOT_DRUG_WORDS
+from label_record import LabelRecord
+
+# =========================================================
+#  ON-DISK LAYOUT
+# =========================================================
+# Everything lives in one directory (LABEL_KB_PATH), one "generation" per ingest:
+#   <gen>.records  one entry per label: 4-byte length + zlib'd JSON {set_id, time, record}
+#   <gen>.names    fixed-width slots (8-byte name hash, 8-byte offset, 4-byte length),
+#                  sorted by hash and binary-searched through mmap
+#   <gen>.json     sources and counts
+#   <gen>.txt      every brand and generic name, one per line (feeds name_index.py)
+#   CURRENT        the live generation's name, swapped atomically when an ingest finishes
+# Readers only ever mmap finished files, so every worker process shares the same
+# page cache and an ingest never blocks (or half-updates) a running app. Only run
+# one ingest at a time.
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "label_kb")
+FORMAT_VERSION = 1
+RECHECK_SECONDS = float(os.environ.get("LABEL_KB_RECHECK", "30"))
+MAX_PHRASE_WORDS = 4
+MIN_PHRASE_LEN = 4
+_FILLER = NAME_FILLER_WORDS | NOT_DRUG_WORDS
+
+_SLOT = struct.Struct("<QQI")
+_LEN = struct.Struct("<I")
+
+
+def name_key(name):
+    # Words only, so "Metformin HCl Extended-Release" and "metformin hcl extended release" meet
+    return " ".join(re.findall(r"[a-z0-9]+", name.lower()))
+
+
+def name_hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def phrases(key):
+    # Every run of up to MAX_PHRASE_WORDS words, like match_label's \bname\b phrase match,
+    # minus the ones that aren't a drug on their own ("hydrochloride", "and valsartan", "xr")
+    words = key.split()
+    for n in range(1, min(MAX_PHRASE_WORDS, len(words)) + 1):
+        for i in range(len(words) - n + 1):
+            run = words[i:i + n]
+            if n == len(words) or (run[0] not in _FILLER and run[-1] not in _FILLER
+                                   and len(" ".join(run)) >= MIN_PHRASE_LEN):
+                yield " ".join(run)
+
+
+def name_keys(record):
+    """(key, rank) pairs a label is found under; ranks follow fda_api.match_label."""
+    for names, exact, phrase in ((record.brand_names, 0, 1), (record.generic_names, 2, 3)):
+        for name in names:
+            key = name_key(name)
+            for p in phrases(key):
+                yield p, exact if p == key else phrase
+            if key.count(" ") >= MAX_PHRASE_WORDS:
+                yield key, exact
+
+
+# =========================================================
+#  STREAMING DUMP READER
+# =========================================================
+def open_dump(path):
+    if path.endswith(".zip"):
+        archive = zipfile.ZipFile(path)
+        member = next(n for n in archive.namelist() if n.endswith(".json"))
+        return io.TextIOWrapper(archive.open(member), encoding="utf-8")
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+
+def iter_results(stream, meta=None, chunk_size=1 << 20):
+    """Yield the labels in an openFDA download's top-level "results" array one at a time.
+
+    Other top-level keys ("meta") are small and go into `meta` if given.
+    """
+    decoder = json.JSONDecoder()
+    buf, pos = "", 0
+
+    def fill():
+        nonlocal buf, pos
+        data = stream.read(chunk_size)
+        if not data:
+            return False
+        buf, pos = buf[pos:] + data, 0
+        return True
+
+    def peek():
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n":
+                pos += 1
+            if pos < len(buf) or not fill():
+                return buf[pos:pos + 1]
+
+    def expect(ch):
+        nonlocal pos
+        if peek() != ch:
+            raise ValueError(f"Not an openFDA download: expected {ch!r} at {buf[pos:pos + 20]!r}")
+        pos += 1
+
+    def value():
+        nonlocal pos
+        peek()
+        while True:
+            try:
+                v, pos = decoder.raw_decode(buf, pos)
+                return v
+            except json.JSONDecodeError:
+                if not fill():  # Truncated file
+                    raise
+
+    expect("{")
+    while peek() != "}":
+        key = value()
+        expect(":")
+        if key != "results":
+            v = value()
+            if meta is not None:
+                meta[key] = v
+        else:
+            expect("[")
+            if peek() == "]":
+                pos += 1
+            else:
+                while True:
+                    yield value()
+                    if peek() == "]":
+                        pos += 1
+                        break
+                    expect(",")
+        if peek() == ",":
+            pos += 1
+
+
+# =========================================================
+#  READER (memory-mapped, shared by every worker process)
+# =========================================================
+class LabelKB:
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.generation = None
+        self.info = {}
+        self._names = self._records = None
+        self._slots = 0
+        self._checked = 0.0
+        self._current_mtime = None
+        self._lock = threading.Lock()
+        self._maybe_reload(force=True)
+
+    def __bool__(self):
+        return self._slots > 0
+
+    def lookup(self, name):
+        """LabelRecord for `name` (brand or generic, whole name or phrase), or None."""
+        self._maybe_reload()
+        key = name_key(name)
+        if not key:
+            return None
+        with self._lock:
+            names, records, slots = self._names, self._records, self._slots
+        if not slots:
+            return None
+        h = name_hash(key)
+        lo, hi = 0, slots
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if struct.unpack_from("<Q", names, mid * _SLOT.size)[0] < h:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == slots:
+            return None
+        slot_hash, offset, length = _SLOT.unpack_from(names, lo * _SLOT.size)
+        if slot_hash != h:
+            return None
+        entry = json.loads(zlib.decompress(records[offset + _LEN.size:offset + length]))
+        record = LabelRecord.from_dict(entry["record"])
+        # A 64-bit hash collision would hand back some other drug; the names say for sure
+        return record if any(k == key for k, _ in name_keys(record)) else None
+
+    def names_path(self):
+        """The live generation's name list (one per line), or None before the first ingest."""
+        self._maybe_reload()
+        return os.path.join(self.path, f"{self.generation}.txt") if self.generation else None
+
+    def stats(self):
+        self._maybe_reload()
+        return {"path": self.path, "generation": self.generation, **self.info}
+
+    def _maybe_reload(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._checked < RECHECK_SECONDS:
+            return
+        self._checked = now
+        current = os.path.join(self.path, "CURRENT")
+        try:
+            mtime = os.stat(current).st_mtime_ns
+            if mtime == self._current_mtime:
+                return
+            with open(current, encoding="utf-8") as f:
+                generation = f.read().strip()
+            with open(os.path.join(self.path, f"{generation}.json"), encoding="utf-8") as f:
+                info = json.load(f)
+            names = _map(os.path.join(self.path, f"{generation}.names"))
+            records = _map(os.path.join(self.path, f"{generation}.records"))
+        except FileNotFoundError:
+            return  # Nothing ingested yet (or mid-swap; the next check picks it up)
+        with self._lock:
+            self._names, self._records = names, records
+            self._slots = len(names) // _SLOT.size
+            self.generation, self.info, self._current_mtime = generation, info, mtime
+
+
+def _map(path):
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def iter_records(path):
+    """(offset, length, entry) for every label in a .records file, in file order."""
+    with open(path, "rb") as f:
+        offset = 0
+        while True:
+            head = f.read(_LEN.size)
+            if not head:
+                return
+            (size,) = _LEN.unpack(head)
+            yield offset, _LEN.size + size, json.loads(zlib.decompress(f.read(size)))
+            offset += _LEN.size + size
+
+
+# =========================================================
+#  INGEST (dumps in, new generation out)
+# =========================================================
+def label_entry(label):
+    # What one label keeps: who it is, how new it is, and the compact record
+    record = LabelRecord.from_label(label)
+    if not record.brand_names and not record.generic_names:
+        return None
+    set_id = label.get("set_id") or label.get("id")
+    return {"set_id": set_id, "time": str(label.get("effective_time") or ""), "record": record.to_dict()}
+
+
+def _write_entry(f, entry):
+    blob = zlib.compress(json.dumps(entry, separators=(",", ":")).encode("utf-8"), 6)
+    f.write(_LEN.pack(len(blob)))
+    f.write(blob)
+    return _LEN.size + len(blob)
+
+
+def ingest(paths, kb_path=DEFAULT_PATH, replace=False, progress=None):
+    """Stream `paths` into a new generation of the knowledge base at `kb_path` and make it live.
+
+    Per label (set_id) the newest effective_time wins, across the dumps and, unless
+    `replace`, the labels already in the knowledge base. Returns the new generation's info.
+    """
+    os.makedirs(kb_path, exist_ok=True)
+    old = LabelKB(kb_path)
+    generation = f"g{time.time_ns()}"
+    base = os.path.join(kb_path, generation)
+    staging = f"{base}.staging"
+    winners = {}  # set_id -> (time, file, offset, length)
+    sources = [] if replace or not old.generation else list(old.info.get("sources", []))
+    counts = {"read": 0, "skipped": 0, "added": 0, "updated": 0, "kept": 0}
+
+    # New labels go to a staging file first; only the winners are copied into the generation
+    with open(staging, "wb") as out:
+        offset = 0
+        for path in paths:
+            meta, n = {}, 0
+            with open_dump(path) as stream:
+                for label in iter_results(stream, meta):
+                    counts["read"] += 1
+                    n += 1
+                    entry = label_entry(label)
+                    if entry is None:
+                        counts["skipped"] += 1
+                        continue
+                    length = _write_entry(out, entry)
+                    best = winners.get(entry["set_id"])
+                    if best is None or entry["time"] >= best[0]:
+                        winners[entry["set_id"]] = (entry["time"], staging, offset, length)
+                    offset += length
+                    if progress and counts["read"] % 10000 == 0:
+                        progress(counts["read"], path)
+            sources.append({"file": os.path.basename(path), "labels": n,
+                            "last_updated": (meta.get("meta") or {}).get("last_updated")})
+
+    old_records = None
+    if old.generation and not replace:
+        old_records = os.path.join(kb_path, f"{old.generation}.records")
+        for offset, length, entry in iter_records(old_records):
+            best = winners.get(entry["set_id"])
+            if best is None:
+                winners[entry["set_id"]] = (entry["time"], old_records, offset, length)
+                counts["kept"] += 1
+            elif best[0] > entry["time"]:
+                counts["updated"] += 1
+            else:
+                # Same label, same version (a re-ingested dump): keep the old copy
+                winners[entry["set_id"]] = (entry["time"], old_records, offset, length)
+                counts["kept"] += 1
+    counts["added"] = len(winners) - counts["kept"] - counts["updated"]
+
+    # Copy winners in source order (sequential reads), and pick the best label per name
+    best_for_key = {}  # name hash -> (rank, no indications, -newest, offset, length)
+    display_names = {}  # name key -> how to show it
+    with open(f"{base}.records", "wb") as out:
+        offset = 0
+        for src in dict.fromkeys(w[1] for w in winners.values()):
+            picks = sorted((w[2], w[3]) for w in winners.values() if w[1] == src)
+            with open(src, "rb") as f:
+                for src_offset, length in picks:
+                    f.seek(src_offset)
+                    raw = f.read(length)
+                    out.write(raw)
+                    entry = json.loads(zlib.decompress(raw[_LEN.size:]))
+                    record = LabelRecord.from_dict(entry["record"])
+                    newest = -int(entry["time"]) if entry["time"].isdigit() else 0
+                    for name in record.brand_names + record.generic_names:
+                        # Generic names come in all caps; a brand's own casing wins
+                        display_names.setdefault(name_key(name), name.title() if name.isupper() else name)
+                    for key, rank in name_keys(record):
+                        h = name_hash(key)
+                        candidate = (rank, not record.indications, newest, offset, length)
+                        if h not in best_for_key or candidate < best_for_key[h]:
+                            best_for_key[h] = candidate
+                    offset += length
+    os.remove(staging)
+
+    with open(f"{base}.names", "wb") as out:
+        for h in sorted(best_for_key):
+            _, _, _, rec_offset, length = best_for_key[h]
+            out.write(_SLOT.pack(h, rec_offset, length))
+
+    with open(f"{base}.txt", "w", encoding="utf-8") as out:
+        out.writelines(f"{name}\n" for key, name in sorted(display_names.items()) if key)
+
+    info = {"version": FORMAT_VERSION, "created": round(time.time(), 3), "labels": len(winners),
+            "names": len(best_for_key), "records_bytes": os.path.getsize(f"{base}.records"),
+            "sources": sources, "last_ingest": counts}
+    with open(f"{base}.json", "w", encoding="utf-8") as f:
+        json.dump(info, f, indent=1)
+    tmp = os.path.join(kb_path, f"CURRENT.{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(generation)
+    os.replace(tmp, os.path.join(kb_path, "CURRENT"))  # Readers switch on their next check
+
+    # Older generations: processes that still have them mapped keep reading them until they reload
+    for name in os.listdir(kb_path):
+        if name.startswith("g") and not name.startswith(generation) and name.split(".")[-1] in ("records", "names", "json", "txt"):
+            os.remove(os.path.join(kb_path, name))
+    return info
+
+
+_DISABLED = object()
+_default_kb = None
+_default_lock = threading.Lock()
+
+
+def get_default_kb():
+    """The process-wide knowledge base, or None when LABEL_KB_PATH is set to an empty string.
+
+    An empty or not-yet-ingested KB is still returned (it is falsy): it picks up
+    a later `label_kb ingest` on its own, so it must not be cached as "no KB".
+    """
+    global _default_kb
+    with _default_lock:
+        if _default_kb is None:
+            path = os.environ.get("LABEL_KB_PATH", DEFAULT_PATH)
+            _default_kb = LabelKB(path) if path else _DISABLED
+    return None if _default_kb is _DISABLED else _default_kb
+
+
+def set_default_kb(kb):
+    global _default_kb
+    with _default_lock:
+        _default_kb = kb
+
+
+# =========================================================
+#  CLI
+# =========================================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and query the offline openFDA label knowledge base")
+    parser.add_argument("--path", default=os.environ.get("LABEL_KB_PATH") or DEFAULT_PATH, help="knowledge base directory")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_ingest = sub.add_parser("ingest", help="add openFDA drug-label dumps (.json.zip, .json.gz, .json)")
+    p_ingest.add_argument("dumps", nargs="+")
+    p_ingest.add_argument("--replace", action="store_true", help="drop the labels already in the knowledge base")
+    p_lookup = sub.add_parser("lookup", help="look names up")
+    p_lookup.add_argument("names", nargs="+")
+    sub.add_parser("stats", help="print what's in the knowledge base")
+    args = parser.parse_args(argv)
+
+    if args.command == "ingest":
+        started = time.perf_counter()
+        info = ingest(args.dumps, args.path, replace=args.replace,
+                      progress=lambda n, path: print(f"{n} labels read ({os.path.basename(path)})", file=sys.stderr))
+        c = info["last_ingest"]
+        print(f"Ingested {c['read']} labels in {time.perf_counter() - started:.1f}s: {c['added']} new, {c['updated']} updated,"
+              f" {c['kept']} kept, {c['skipped']} without names. Now {info['labels']} labels under {info['names']} names.")
+        return 0
+
+    kb = LabelKB(args.path)
+    if not kb:
+        print(f"No knowledge base at {args.path}; run `python label_kb.py ingest <dump>` first.", file=sys.stderr)
+        return 1
+    if args.command == "stats":
+        print(json.dumps(kb.stats(), indent=2))
+        return 0
+    missing = 0
+    for name in args.names:
+        t0 = time.perf_counter()
+        record = kb.lookup(name)
+        ms = (time.perf_counter() - t0) * 1000
+        if record is None:
+            missing += 1
+            print(f"{name}: not in the knowledge base ({ms:.3f} ms)")
+        else:
+            print(f"{name}: {record.brand} / {record.generic} / {', '.join(record.routes) or '-'} ({ms:.3f} ms)\n"
+                  f"    {record.indications[:200]}")
+    return 1 if missing == len(args.names) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
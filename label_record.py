@@ -0,0 +1,64 @@
+import sys
+
+# =========================================================
+#  COMPACT LABEL RECORD
+# =========================================================
+# openFDA returns the whole package insert, often 50-300 KB of JSON per label.
+# The app only reads the brand/generic names, routes and the first
+# indications paragraph, so that is all a lookup keeps. Strings are interned: the same
+# names (and the same indications text under the single: and multi: keys)
+# repeat across cache entries and sessions.
+
+
+class LabelRecord:
+    __slots__ = ("brand_names", "generic_names", "indications", "routes")
+
+    def __init__(self, brand_names=(), generic_names=(), indications="", routes=()):
+        self.brand_names = tuple(sys.intern(b) for b in brand_names)
+        self.generic_names = tuple(sys.intern(g) for g in generic_names)
+        self.indications = sys.intern(indications or "")
+        self.routes = tuple(sys.intern(r) for r in routes)
+
+    @property
+    def brand(self):
+        return self.brand_names[0] if self.brand_names else None
+
+    @property
+    def generic(self):
+        return self.generic_names[0] if self.generic_names else None
+
+    @classmethod
+    def from_label(cls, label):
+        ofda = label.get("openfda", {})
+        indications = label.get("indications_and_usage") or [""]
+        return cls(ofda.get("brand_name", ()), ofda.get("generic_name", ()), indications[0], ofda.get("route", ()))
+
+    @classmethod
+    def from_payload(cls, payload):
+        # First hit of a raw openFDA response
+        results = (payload or {}).get("results") or []
+        return cls.from_label(results[0]) if results else None
+
+    def to_dict(self):
+        return {"b": list(self.brand_names), "g": list(self.generic_names), "i": self.indications, "r": list(self.routes)}
+
+    @classmethod
+    def from_dict(cls, d):
+        if d is None:
+            return None
+        if "results" in d:  # Cache rows written before records existed hold the whole payload
+            return cls.from_payload(d)
+        return cls(d.get("b", ()), d.get("g", ()), d.get("i", ""), d.get("r", ()))
+
+    def nbytes(self):
+        # Footprint for the memory budget (shared interned strings are counted in every record)
+        names = self.brand_names + self.generic_names + self.routes
+        return (sys.getsizeof(self) + sys.getsizeof(self.brand_names) + sys.getsizeof(self.generic_names)
+                + sys.getsizeof(self.routes) + sum(map(sys.getsizeof, names)) + sys.getsizeof(self.indications))
+
+    def __eq__(self, other):
+        return isinstance(other, LabelRecord) and (self.brand_names, self.generic_names, self.indications, self.routes) == \
+            (other.brand_names, other.generic_names, other.indications, other.routes)
+
+    def __repr__(self):
+        return f"LabelRecord(brand={self.brand!r}, generic={self.generic!r}, indications={len(self.indications)} chars)"
@@ -1,23 +1,38 @@
 import streamlit as st
-import gspread
-from google.oauth2.service_account import Credentials
-import pandas as pd
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 from datetime import datetime
 import requests
-from fpdf import FPDF
-import difflib
 import os
 import json
-from data import COMMON_DRUGS_LIST, IMPAIRMENT_DATA
+import time
+from functools import partial
+from data import IMPAIRMENT_DATA
+import metrics
+from label_cache import get_default_cache
+from registration_log import RegistrationLogger, backend_from_env
+from fda_api import RateLimited
+from prewarm import start_prewarm
+from engine import get_product_matrix, render_pdf, calculate_bmi
+from scoring_client import RemoteEngine, get_default_backend
 
 # THIS MUST BE THE FIRST STREAMLIT LINE
 st.set_page_config(page_title="Rx Field Assistant Pro", page_icon="🛡️", layout="wide")
+rerun_started = time.perf_counter()
+metrics.maybe_start_exporter()
+backend = get_default_backend()  # The engine itself, or scoring_api.py if SCORING_API_URL is set
+# Once per process; serving doesn't wait for it. A thin client never reads its local label
+# cache, so warming it would only spend the openFDA quota it shares with the API process
+prewarm = None if isinstance(backend, RemoteEngine) else start_prewarm()
 
 # ==========================================
 # 🔐 SECRETS & CLOUD HANDSHAKE
 # ==========================================
 
+@st.cache_resource(show_spinner=False)  # One authorized client per process, not per login
 def get_gspread_client():
+    # Imported here: the Google auth stack is only needed on the login submit path
+    import gspread
+    from google.oauth2.service_account import Credentials
     scopes = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
 
     # 1. Single JSON blob (Railway's GCP_SERVICE_ACCOUNT var)
@@ -52,6 +67,12 @@ def get_gspread_client():
         return gspread.authorize(creds)
 
     return None
+
+@st.cache_resource(show_spinner=False)
+def get_registration_logger():
+    backend = backend_from_env(get_gspread_client)
+    return RegistrationLogger(backend) if backend is not None else None
+
 # ==========================================
 # 🔐 REGISTRATION & LOGGING SECTION
 # ==========================================
@@ -73,15 +94,13 @@ if not st.session_state.logged_in:
                 st.error("⚠️ Please fill in BOTH Name and Email.")
             else:
                 try:
-                    client = get_gspread_client()
-                    if client is None:
+                    reg_logger = get_registration_logger()
+                    if reg_logger is None:
                         st.error("🚨 Google Sheets credentials are not configured. Please contact support.")
                     else:
-                        s_id = os.environ.get("sheet_id") or os.environ.get("SHEET_ID")
-                        sheet = client.open_by_key(s_id).sheet1
-
+                        # Queued for the background writer; the sheet append happens after we move on
                         current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                        sheet.append_row([current_time, user_name, user_email])
+                        reg_logger.log(current_time, user_name, user_email)
 
                         st.session_state.logged_in = True
                         st.success("✅ Success! Entering app...")
@@ -105,6 +124,10 @@ def fix_spelling_callback():
     if "suggestion" in st.session_state:
         st.session_state.single_input = st.session_state.suggestion
 
+def search_anyway_callback():
+    # The agent says the name is right: skip the local typo check for exactly this input
+    st.session_state.force_single = st.session_state.single_input
+
 def clear_single(): st.session_state.single_input = ""
 def clear_multi(): st.session_state.multi_input = ""
 
@@ -176,196 +199,86 @@ div.stButton > button { width: 100%; }
 
 st.markdown(css_style, unsafe_allow_html=True)
 
+# =========================================================
+#  FRAGMENT HELPERS
+# =========================================================
+# Each page section below is an st.fragment: interacting with a widget inside
+# it reruns only that section. On a full-page rerun every fragment replays its
+# last result from session state unless its own inputs changed.
+def memo(slot, inputs, compute):
+    cached = st.session_state.get(slot)
+    if cached is not None and cached[0] == inputs:
+        return cached[1]
+    value = compute()
+    st.session_state[slot] = (inputs, value)
+    return value
+
+def in_fragment_rerun():
+    ctx = get_script_run_ctx()
+    return bool(ctx and ctx.fragment_ids_this_run)
+
+def impairment_active(bmi):
+    # Tab 3 analyses (and so depends on the BMI) once a condition or tobacco is picked, or the BMI is over 30
+    return bool(st.session_state.get("cond_select") or st.session_state.get("smoker_check") or bmi > 30)
+
 # =========================================================
 #  GLOBAL STATE: BMI CALCULATOR (SIDEBAR)
 # =========================================================
-with st.sidebar:
+@st.fragment
+@metrics.timed("fragment_bmi_sidebar")
+def bmi_calculator():
     st.header("⚖️ BMI Calculator")
-    feet = st.number_input("Height (Feet)", 4, 8, 5)
-    inches = st.number_input("Height (Inches)", 0, 11, 9)
-    weight = st.number_input("Weight (lbs)", 80, 500, 165) # Restored to 165 default
+    feet = st.number_input("Height (Feet)", 4, 8, 5, key="bmi_feet")
+    inches = st.number_input("Height (Inches)", 0, 11, 9, key="bmi_inches")
+    weight = st.number_input("Weight (lbs)", 80, 500, 165, key="bmi_weight") # Restored to 165 default
+    age = st.number_input("Age", 18, 90, 45, key="bmi_age")
+    sex = st.radio("Sex", ["Male", "Female"], horizontal=True, key="bmi_sex")
     
-    total_inches = (feet * 12) + inches
-    bmi = 0.0
-    bmi_category = "Normal"
+    bmi, bmi_category = calculate_bmi(feet, inches, weight)
+    try:
+        build = backend.rate_build(feet * 12 + inches, weight, age, sex)
+    except Exception as e:
+        # Only a side note under the BMI; never worth breaking the page over (e.g. scoring API down)
+        print(f"Build rating unavailable: {e}")
+        build = {"build_class": None, "max_weight": None}
     
-    if total_inches > 0:
-        bmi = round((weight / (total_inches ** 2)) * 703, 1)
-        
-        if bmi < 18.5: 
-            st.info(f"BMI: {bmi} (Underweight)")
-            bmi_category = "Underweight"
-        elif bmi < 27.5: 
-            # Normal range (Green)
-            st.success(f"BMI: {bmi} (Normal)")
-            bmi_category = "Normal"
-        elif bmi <= 33.0: 
-            # Overweight range (Yellow) - Now stays Yellow up to 33.0
-            st.warning(f"BMI: {bmi} (Overweight)")
-            bmi_category = "Overweight"
-        else: 
-            # Obese range (Red) - Only triggers above 33.0
-            st.error(f"BMI: {bmi} (Obese)")
-            bmi_category = "Obese"
-            
+    if bmi > 0:
+        if bmi_category == "Underweight": st.info(f"BMI: {bmi} (Underweight)")
+        elif bmi_category == "Normal": st.success(f"BMI: {bmi} (Normal)")  # Green
+        elif bmi_category == "Overweight": st.warning(f"BMI: {bmi} (Overweight)")  # Yellow up to 33.0
+        else: st.error(f"BMI: {bmi} (Obese)")  # Red only above 33.0
+        limit = f" (up to {build['max_weight']} lbs)" if build["max_weight"] else ""
+        if build["build_class"]: st.caption(f"📏 Build chart: **{build['build_class']}**{limit}")
+
+    was_bmi = st.session_state.get("bmi", 0.0)
+    changed = was_bmi != bmi or st.session_state.get("build_class") != build["build_class"]
+    st.session_state.bmi, st.session_state.bmi_category = bmi, bmi_category
+    st.session_state.build_class = build["build_class"]
+    # The Impairment Analyst reads the BMI from session state, so it only needs a
+    # redraw when it is actually showing an analysis that uses it (the same test
+    # it makes below); every other fragment replays its cached result on that rerun
+    if changed and in_fragment_rerun() and impairment_active(max(bmi, was_bmi)):
+        st.rerun(scope="app")
+
+with st.sidebar:
+    bmi_calculator()
     st.markdown("---")
     st.caption("Rx Field Assistant v9.4")
+    if os.environ.get("RX_DEBUG"):
+        with st.expander("🗄️ Label Cache Stats"):
+            st.json(get_default_cache().stats())
+            if prewarm is not None:
+                p = prewarm.progress()
+                st.progress(p["percent"] / 100, text=f"Prewarm {p['state']}: {p['done'] + p['failed']}/{p['total']}")
 
 st.title("🛡️ Life Insurance Rx Assistant Pro")
 
-# --- PDF GENERATOR FUNCTION (REPLACEMENT) ---
-def create_pdf(title, items_list, analysis_text, risk_level=None, fda_text_content=None):
-    pdf = FPDF()
-    pdf.add_page()
-    
-    # This helper function strips emojis/non-latin characters that crash PDFs
-    def clean_text(text):
-        if not text: return ""
-        # Remove the specific emojis used in your matrix
-        safe_text = str(text).replace("💎", "").replace("✅", "").replace("⚠️", "").replace("❌", "")
-        # Remove any other non-standard characters
-        return safe_text.encode('ascii', 'ignore').decode('ascii')
-
-    # Title
-    pdf.set_font("Arial", 'B', 16)
-    pdf.cell(200, 10, txt=clean_text(f"Rx Assistant - {title}"), ln=True, align='C')
-    pdf.ln(10)
-
-    # Items Analyzed Section
-    pdf.set_font("Arial", 'B', 12)
-    pdf.cell(200, 10, txt="Items Analyzed:", ln=True)
-    pdf.set_font("Arial", size=11)
-    for item in items_list:
-        pdf.cell(200, 8, txt=clean_text(f"- {item}"), ln=True)
-    pdf.ln(5)
-
-    # Underwriting Analysis Section
-    pdf.set_font("Arial", 'B', 12)
-    pdf.cell(200, 10, txt="Underwriting Analysis:", ln=True)
-    pdf.set_font("Arial", size=11)
-    if isinstance(analysis_text, list):
-        for line in analysis_text:
-            pdf.multi_cell(0, 8, txt=clean_text(line))
-    else:
-        pdf.multi_cell(0, 8, txt=clean_text(analysis_text))
-
-    # --- PURE TEXT PRODUCT OUTLOOK (STABLE VERSION) ---
-    if risk_level:
-        pdf.ln(5)
-        pdf.set_font("Arial", 'B', 12)
-        pdf.set_text_color(230, 81, 0) # Professional Orange
-        pdf.cell(200, 10, txt="PRODUCT SUITABILITY OUTLOOK:", ln=True)
-        pdf.set_text_color(0, 0, 0) # Reset to Black
-        
-        pdf.set_font("Arial", size=10)
-        # Pull the data from your matrix function
-        matrix_data = get_product_matrix(risk_level)
-        for row in matrix_data:
-            # Format: PRODUCT: OUTLOOK -- NOTE
-            cat = clean_text(row['Category']).upper()
-            out = clean_text(row['Outlook']).strip()
-            note = clean_text(row['Note'])
-            pdf.multi_cell(0, 7, txt=f"{cat}: {out} -- {note}")
-            pdf.ln(1)
-
-    # FDA Text (Optional)
-    if fda_text_content:
-        pdf.ln(5)
-        pdf.set_font("Arial", 'B', 12)
-        pdf.cell(200, 10, txt="Official FDA Indications (Excerpt):", ln=True)
-        pdf.set_font("Arial", size=9)
-        pdf.multi_cell(0, 5, txt=clean_text(fda_text_content[:1500] + "..."))
-
-    return pdf.output(dest='S').encode('latin-1')
-
-# =========================================================
-#  LOGIC ENGINES
-# =========================================================
-def analyze_single_med(indication_text, brand_name):
-    text = indication_text.lower(); name = brand_name.lower()
-    if "metformin" in name: return {"risk": "Diabetes Type 2", "style": "risk-med", "questions": ["Is this for Pre-Diabetes or Type 2?", "What is your A1C?", "Any neuropathy?"], "rating": "Standard (if A1C < 7.0) to Table 2."}
-    elif "lisinopril" in name or "amlodipine" in name: return {"risk": "Hypertension (High BP)", "style": "risk-safe", "questions": ["Is BP controlled?", "Last reading?", "Do you take >2 BP meds?"], "rating": "Preferred Best possible."}
-    elif "plavix" in name or "clopidogrel" in name: return {"risk": "Heart Disease / Stroke", "style": "risk-high", "questions": ["History of TIA/Stroke?", "Stent placement?"], "rating": "Standard to Decline."}
-    elif "abilify" in name or "aripiprazole" in name: return {"risk": "Bipolar / Depression / Schizophrenia", "style": "risk-high", "questions": ["Hospitalizations in last 5 years?", "Suicide attempts?"], "rating": "Complex. Bipolar = Table Rating."}
-    elif "entresto" in name: return {"risk": "Heart Failure (CHF)", "style": "risk-high", "questions": ["What is your Ejection Fraction?", "Any hospitalizations recently?"], "rating": "Likely Decline."}
-    if "metastatic" in text: return {"risk": "FLAGGED: Cancer (Severe)", "style": "risk-high", "questions": ["Diagnosis date?", "Treatment status?"], "rating": "Likely Decline."}
-    if "hiv" in text: return {"risk": "FLAGGED: HIV/AIDS", "style": "risk-high", "questions": ["Current Viral Load?", "CD4 Count?"], "rating": "Table Rating to Decline."}
-    return {"risk": "General / Maintenance", "style": "risk-safe", "questions": ["Why was this prescribed?", "Any symptoms?"], "rating": "Depends on condition."}
-
-def check_med_combinations(found_categories):
-    unique_cats = set(found_categories)
-    insights = []
-    if "Diabetes" in unique_cats and "Hypertension" in unique_cats and "Cholesterol" in unique_cats: insights.append("METABOLIC SYNDROME: Client has the 'Trifecta'. Look for carriers with Metabolic Syndrome credits.")
-    elif "Diabetes" in unique_cats and "Cardiac" in unique_cats: insights.append("HIGH RISK (Diabetes + Heart): Compounded mortality risk. Expect Table 4+ or Decline.")
-    return insights
-
-def simple_category_check(text, name):
-    t = text.lower(); n = name.lower()
-    if "diabetes" in t or "metformin" in n: return "Diabetes"
-    if "hypertension" in t or "lisinopril" in n: return "Hypertension"
-    if "cholesterol" in t or "statin" in n: return "Cholesterol"
-    if "heart failure" in t or "plavix" in n: return "Cardiac"
-    return "Other"
-
-def check_comorbidities(selected_conditions, is_smoker, current_bmi):
-    warnings = []
-    if is_smoker: warnings.append("SMOKER STATUS: Rates will be Standard Smoker (Tobacco) at best.")
-    if current_bmi > 30: warnings.append("BUILD RATING: High BMI typically triggers a Table Rating based on build alone.")
-    if is_smoker:
-        if "COPD / Emphysema" in selected_conditions or "Asthma" in selected_conditions: warnings.append("DECLINE WARNING: COPD/Asthma + Smoking is a major knockout for most carriers.")
-        if "Heart Attack (History of)" in selected_conditions: warnings.append("HIGH RISK: Smoking after a Heart Attack is typically Table 4 to Decline.")
-    if current_bmi > 35:
-        if "Sleep Apnea" in selected_conditions: warnings.append("BUILD RISK: Sleep Apnea with BMI > 35 requires documented CPAP compliance for best rates.")
-    if "Diabetes Type 2" in selected_conditions and "Heart Attack (History of)" in selected_conditions: warnings.append("COMORBIDITY ALERT: Diabetes + Heart History is treated very strictly. Expect Table 4 minimum.")
-    return warnings
-def get_product_matrix(risk_level):
-    if risk_level == "risk-safe":
-        return [
-            {"Category": "Term (10-30yr)", "Outlook": "💎 Best", "Note": "Preferred Potential"},
-            {"Category": "Perm (IUL/UL/WL)", "Outlook": "💎 Best", "Note": "Standard/Preferred"},
-            {"Category": "Final Expense", "Outlook": "💎 Best", "Note": "Preferred Rates"},
-            {"Category": "Disability (DI)", "Outlook": "✅ Good", "Note": "Subject to Occupation"},
-            {"Category": "Long-Term Care", "Outlook": "💎 Best", "Note": "Standard/Preferred"}
-        ]
-    
-    elif risk_level == "risk-med":
-        return [
-            {"Category": "Term (10-30yr)", "Outlook": "✅ Good", "Note": "Standard Likely"},
-            {"Category": "Perm (IUL/UL/WL)", "Outlook": "✅ Good", "Note": "Standard Likely"},
-            {"Category": "Final Expense", "Outlook": "💎 Best", "Note": "Preferred Available"},
-            {"Category": "Disability (DI)", "Outlook": "⚠️ Rated", "Note": "Possible Exclusions"},
-            {"Category": "Long-Term Care", "Outlook": "✅ Good", "Note": "Standard Available"}
-        ]
-    
-    else: # risk-high (BMI > 33 or Smoker)
-        return [
-            {"Category": "Term (10-30yr)", "Outlook": "⚠️ Rated", "Note": "Table 2 to Table 4"},
-            {"Category": "Perm (IUL/UL/WL)", "Outlook": "✅ Good", "Note": "Standard to Table 2"}, # More lenient!
-            {"Category": "Final Expense", "Outlook": "💎 Best", "Note": "Preferred Available"},
-            {"Category": "Disability (DI)", "Outlook": "❌ Poor", "Note": "Decline"},
-            {"Category": "Long-Term Care", "Outlook": "⚠️ Rated", "Note": "Standard to Class 2"}
-        ]
-# =========================================================
-# FDA LOOKUPS (cached so repeat searches skip the API)
-# =========================================================
-@st.cache_data(show_spinner=False, ttl=3600)
-def fetch_fda_single_drug(drug_name):
-    url = f'https://api.fda.gov/drug/label.json?search=openfda.brand_name:"{drug_name}"+openfda.generic_name:"{drug_name}"&limit=1'
-    r = requests.get(url, timeout=10)
-    return r.status_code, (r.json() if r.status_code == 200 else None)
-
-@st.cache_data(show_spinner=False, ttl=3600)
-def fetch_fda_multi_drug(drug_name):
-    url = f'https://api.fda.gov/drug/label.json?search=openfda.brand_name:"{drug_name}"&limit=1'
-    r = requests.get(url, timeout=10)
-    return r.status_code, (r.json() if r.status_code == 200 else None)
-
 # =========================================================
 # APP TABS (Rx Assistant Pro Edition)
 # =========================================================
-tab1, tab2, tab3 = st.tabs(["🔍 Drug Decoder (FDA)", "💊 Multi-Med Combo Check", "🩺 Impairment Analyst (Conditions)"])
-
-with tab1:
+@st.fragment
+@metrics.timed("fragment_drug_decoder")
+def drug_decoder():
     col_a, col_b = st.columns([4, 1])
     with col_a: st.markdown("### 🔍 Search by Medication Name")
     with col_b: st.button("🔄 Clear", on_click=clear_single, key="clear_1")
@@ -374,12 +287,10 @@ with tab1:
     if single_drug:
         with st.spinner("Accessing FDA Database..."):
             try:
-                status_code, payload = fetch_fda_single_drug(single_drug)
-                if status_code == 200:
-                    data = payload['results'][0]
-                    brand = data['openfda'].get('brand_name', [single_drug])[0]
-                    indications = data.get('indications_and_usage', ["No text found"])[0]
-                    insight = analyze_single_med(indications, single_drug)
+                force = st.session_state.get("force_single") == single_drug
+                result = memo("tab1_result", (single_drug, force), lambda: backend.decode_drug(single_drug, force=force))
+                if result["found"]:
+                    brand, indications, insight = result["brand"], result["indications"], result["insight"]
                     
                     st.success(f"**Found:** {brand}")
                     
@@ -390,7 +301,8 @@ with tab1:
                         
                         # --- PDF BUTTON ---
                         report_text = [f"Risk: {insight['risk']}", f"Est. Life Rating: {insight['rating']}"] + [f"Ask: {q}" for q in insight['questions']]
-                        pdf_data = create_pdf(f"Report - {brand}", [brand], report_text, risk_level=insight['style'], fda_text_content=indications)
+                        # Built only when clicked; identical reports are rendered once per process
+                        pdf_data = partial(render_pdf, f"Report - {brand}", [brand], report_text, risk_level=insight['style'], fda_text_content=indications)
                         st.download_button("📄 Download PDF Report", data=pdf_data, file_name=f"{brand}_report.pdf", mime="application/pdf", key=f"pdf_btn_{brand}")
 
                     with c2:
@@ -404,55 +316,117 @@ with tab1:
                         
                         with st.expander("Show FDA Official Text"): st.write(indications)
                 else:
-                    matches = difflib.get_close_matches(single_drug, COMMON_DRUGS_LIST, n=1, cutoff=0.6)
-                    st.error(f"❌ '{single_drug}' not found.")
-                    if matches:
-                        suggested_word = matches[0]
+                    if result.get("preflight") == "junk":
+                        st.warning(f"🤔 '{single_drug}' doesn't look like a drug name.")
+                    elif result.get("preflight"):
+                        st.warning(f"🤔 '{single_drug}' is a common misspelling.")
+                    else:
+                        st.error(f"❌ '{single_drug}' not found.")
+                    if result["suggestion"]:
+                        suggested_word = result["suggestion"]
                         st.info(f"💡 Did you mean: **{suggested_word}**?")
                         st.session_state.suggestion = suggested_word
                         st.button(f"Yes, search for {suggested_word}", on_click=fix_spelling_callback, key="spell_check")
+                    if result.get("preflight"):
+                        st.button(f"No, search the FDA database for '{single_drug}'", on_click=search_anyway_callback, key="search_anyway")
+            except RateLimited:
+                st.warning("⏳ The drug database is busy right now, please try again in a moment.")
             except requests.exceptions.RequestException:
                 st.error("⚠️ Couldn't reach the drug database right now, please try again.")
             except Exception:
                 st.error("⚠️ Something went wrong while processing that result. Please try again.")
 
-with tab2:
+def combo_line(med, entry):
+    if entry["found"]: return ("write", f"✅ **{med}** identified as *{entry['category']}*")
+    if entry.get("junk"): return ("info", f"➖ Skipped **{med}**, it doesn't look like a drug name.")
+    if entry.get("suggestion"): return ("warning", f"⚠️ Couldn't find **{med}**. Did you mean **{entry['suggestion']}**?")
+    return ("warning", f"⚠️ Couldn't find **{med}** in the drug database.")
+
+def combo_error_line(med, err):
+    # Failed lookups aren't kept in the session, so the next click retries them
+    if isinstance(err, RateLimited):
+        return ("warning", f"⏳ The drug database is busy, **{med}** wasn't checked. Please try again in a moment.")
+    if isinstance(err, requests.exceptions.RequestException):
+        return ("error", f"⚠️ Couldn't reach the drug database right now for **{med}**. Please try again.")
+    return ("warning", f"⚠️ Something went wrong looking up **{med}**.")
+
+@st.fragment
+@metrics.timed("fragment_combo_check")
+def combo_check():
     col_x, col_y = st.columns([4, 1])
     with col_x: st.markdown("### 💊 Multi-Medication Combo Check")
     with col_y: st.button("🔄 Clear List", on_click=clear_multi, key="clear_2")
     multi_input = st.text_area("Paste Med List (comma separated):", key="multi_input", placeholder="Metformin, Lisinopril, Plavix")
     
-    if st.button("Analyze Combinations", key="analyze_btn"):
-        if multi_input:
-            meds = [m.strip() for m in multi_input.split(',')]
-            cats = []; valid_meds = []
-            for med in meds:
-                if len(med) < 3: continue
-                try:
-                    status_code, payload = fetch_fda_multi_drug(med)
-                    if status_code == 200:
-                        ind = payload['results'][0].get('indications_and_usage', [""])[0]
-                        cat = simple_category_check(ind, med)
-                        cats.append(cat); valid_meds.append(med)
-                        st.write(f"✅ **{med}** identified as *{cat}*")
-                    else:
-                        st.warning(f"⚠️ Couldn't find **{med}** in the drug database.")
-                except requests.exceptions.RequestException:
-                    st.error(f"⚠️ Couldn't reach the drug database right now for **{med}**. Please try again.")
-                except Exception:
-                    st.warning(f"⚠️ Something went wrong looking up **{med}**.")
-            
-            combos = check_med_combinations(cats)
-            if combos:
-                for c in combos: st.error(c)
-            else: st.success("No major negative combinations detected.")
-            
-            if valid_meds:
-                combo_text = combos if combos else ["No high-risk combinations found."]
-                pdf_bytes = create_pdf("Multi-Med Analysis", valid_meds, combo_text)
-                st.download_button("📄 Download Combo Report", data=pdf_bytes, file_name="combo_report.pdf", key="pdf_multi")
-
-with tab3:
+    clicked = st.button("Analyze Combinations", key="analyze_btn")
+    last = st.session_state.get("combo_result")
+    if clicked and multi_input:
+        meds = [m.strip() for m in multi_input.split(',')]
+        meds = [m for m in meds if len(m) >= 3]
+        # Per-session, per-drug results from earlier clicks: only meds added (or edited) since then are looked up
+        known = st.session_state.setdefault("combo_drugs", {})
+        for med in [m for m in known if m not in meds]: del known[med]
+        # One placeholder per med keeps the input order while lookups finish out of order
+        slots = [st.empty() for _ in meds]
+        lines = [None] * len(meds)
+        for i, med in enumerate(meds):
+            if med in known:
+                lines[i] = combo_line(med, known[med])
+                getattr(slots[i], lines[i][0])(lines[i][1])
+        todo = list(dict.fromkeys(m for m in meds if m not in known))
+        positions = {}
+        for i, med in enumerate(meds): positions.setdefault(med, []).append(i)
+        metrics.inc("rx_combo_meds_total", len(meds) - len(todo), source="session")
+        metrics.inc("rx_combo_meds_total", len(todo), source="lookup")
+        try:
+            for j, entry, err in backend.med_entries(todo):
+                if entry is not None: known[todo[j]] = entry
+                line = combo_line(todo[j], entry) if entry is not None else combo_error_line(todo[j], err)
+                for i in positions[todo[j]]:
+                    lines[i] = line
+                    getattr(slots[i], line[0])(line[1])
+        except Exception as e:
+            # The whole batch failed (e.g. the scoring API is down): every med still waiting says so
+            for i, med in enumerate(meds):
+                if lines[i] is None:
+                    lines[i] = combo_error_line(med, e)
+                    getattr(slots[i], lines[i][0])(lines[i][1])
+        # The verdict only depends on the per-drug tags, so an edit that doesn't change them reuses it
+        entries = [known[m] for m in dict.fromkeys(meds) if known.get(m, {}).get("found")]
+        verdict_key = tuple(sorted({(e["drug_key"], tuple(e["tags"])) for e in entries}))
+        try:
+            combos = memo("combo_verdict", verdict_key, lambda: backend.combo_verdict(entries))
+        except Exception as e:
+            print(f"Combination check failed: {e}")
+            combos = None  # Not memoised, so the next click tries again
+        valid_meds = [m for m in meds if known.get(m, {}).get("found")]
+        last = {"input": multi_input, "lines": lines, "combos": combos, "valid_meds": valid_meds, "replay": False}
+        st.session_state.combo_result = dict(last, replay=True)
+    elif last is not None and last["input"] == multi_input and last["replay"]:
+        # Full-page rerun (e.g. a BMI tweak): show the last analysis again without re-running it
+        for kind, text in last["lines"]: getattr(st, kind)(text)
+    else:
+        return
+    
+    combos = last["combos"]
+    if combos is None:
+        st.warning("⚠️ Couldn't check the combinations right now, please try again.")
+        return
+    if combos:
+        for c in combos: st.error(c)
+    else: st.success("No major negative combinations detected.")
+    
+    if last["valid_meds"]:
+        combo_text = combos if combos else ["No high-risk combinations found."]
+        pdf_bytes = partial(render_pdf, "Multi-Med Analysis", last["valid_meds"], combo_text)
+        st.download_button("📄 Download Combo Report", data=pdf_bytes, file_name="combo_report.pdf", key="pdf_multi")
+
+@st.fragment
+@metrics.timed("fragment_impairment_analyst")
+def impairment_analyst():
+    bmi = st.session_state.get("bmi", 0.0)
+    bmi_category = st.session_state.get("bmi_category", "Normal")
+    build_class = st.session_state.get("build_class")
     st.markdown("### 🩺 Condition & Impairment Search")
     col_i1, col_i2 = st.columns(2)
     with col_i1:
@@ -460,32 +434,29 @@ with tab3:
         conditions = st.multiselect("Select Conditions:", sorted_conditions, key="cond_select")
     with col_i2:
         st.write("Risk Factors:")
-        is_smoker = st.checkbox("🚬 Tobacco / Nicotine User")
-        st.write(f"⚖️ Current BMI: **{bmi}** ({bmi_category})")
-    
-    if conditions or is_smoker or bmi > 30:
+        is_smoker = st.checkbox("🚬 Tobacco / Nicotine User", key="smoker_check")
+        if impairment_active(bmi):
+            st.write(f"⚖️ Current BMI: **{bmi}** ({bmi_category})")
+            if build_class: st.write(f"📏 Build Chart: **{build_class}**")
+        else:
+            # Not redrawn on every sidebar change while nothing here uses it, so no number to go stale
+            st.caption("⚖️ BMI and build come from the sidebar calculator.")
+
+    if impairment_active(bmi):
         st.divider()
         st.subheader("📝 Underwriting Analysis")
-        warnings = check_comorbidities(conditions, is_smoker, bmi)
-        for w in warnings: st.error(w)
+        try:
+            analysis = memo("tab3_result", (tuple(conditions), is_smoker, bmi), lambda: backend.analyze_impairments(conditions, is_smoker, bmi))
+        except Exception as e:
+            print(f"Impairment analysis failed: {e}")
+            st.error("⚠️ Couldn't run the analysis right now, please try again.")
+            return
+        for w in analysis["warnings"]: st.error(w)
         
-        pdf_lines = []
-        if warnings: pdf_lines = ["--- WARNINGS ---"] + warnings + ["--- DETAILS ---"]
         if conditions:
             for cond in conditions:
                 data = IMPAIRMENT_DATA[cond]
-                
-               # --- UNIVERSAL RISK LOGIC ---
-                # Pulls the risk directly from the 'risk' tag in your dictionary
-                # Defaults to 'risk-med' if a tag is missing
-                risk_lv = data.get('risk', 'risk-med') 
-                
-                # Risk Bump: Upgrades risk if they smoke or are obese
-                if is_smoker or bmi > 33:
-                    if risk_lv == "risk-safe": 
-                        risk_lv = "risk-med"
-                    elif risk_lv == "risk-med": 
-                        risk_lv = "risk-high"
+                risk_lv = analysis["risks"][cond]
 
                 st.markdown(f"### {cond}")
                 
@@ -510,15 +481,22 @@ with tab3:
                     st.markdown("#### 🎯 Product Suitability Matrix")
                     st.caption("💡 *Ratings are estimates based on clinical control and co-morbidities.*")
                     st.table(get_product_matrix(risk_lv))
-
-                # Keep the PDF lines logic behind the scenes
-                pdf_lines.append(f"Condition: {cond} | Rating: {data['rating']}")
-                for q in data['qs']: pdf_lines.append(f" - {q}")
             
             st.divider()
-            imp_pdf = create_pdf("Impairment Analysis", conditions, pdf_lines, risk_level=risk_lv)
+            imp_pdf = partial(render_pdf, "Impairment Analysis", conditions, analysis["pdf_lines"], risk_level=risk_lv)
             st.download_button("📄 Download Impairment Report", data=imp_pdf, file_name="imp_report.pdf", key="pdf_imp")
 
+tab1, tab2, tab3 = st.tabs(["🔍 Drug Decoder (FDA)", "💊 Multi-Med Combo Check", "🩺 Impairment Analyst (Conditions)"])
+
+with tab1:
+    drug_decoder()
+
+with tab2:
+    combo_check()
+
+with tab3:
+    impairment_analyst()
+
 # --- FOOTER ---
 st.markdown("---")
 
@@ -548,3 +526,5 @@ st.markdown(
     """, 
     unsafe_allow_html=True
 )
+
+metrics.observe("rx_phase_duration_seconds", time.perf_counter() - rerun_started, phase="streamlit_rerun")
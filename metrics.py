@@ -0,0 +1,204 @@
+import json
+import os
+import threading
+import time
+from functools import wraps
+
+# =========================================================
+#  IN-PROCESS METRICS (timers, counters, histograms)
+# =========================================================
+# Off unless RX_METRICS=1. When off, timer() hands back a shared no-op and
+# timed() returns the function untouched, so instrumented code pays nothing.
+#   RX_METRICS=1          collect
+#   RX_METRICS_LOG=1      also print one JSON line per timed phase
+#   RX_METRICS_PORT=9464  serve /metrics (Prometheus text) and /metrics.json
+
+ENABLED = os.environ.get("RX_METRICS", "").lower() in ("1", "true", "yes", "on")
+LOG_JSON = ENABLED and os.environ.get("RX_METRICS_LOG", "").lower() in ("1", "true", "yes", "on")
+
+# Seconds, Prometheus-style
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+_counters = {}    # (name, labels) -> value
+_histograms = {}  # (name, labels) -> [bucket counts..., +Inf count, sum]
+_collectors = []  # callables returning {metric name: value} at export time
+_exporter = None
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items())) if labels else ()
+
+
+def inc(name, n=1, **labels):
+    if not ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + n
+
+
+def observe(name, seconds, **labels):
+    if not ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        h = _histograms.get(key)
+        if h is None:
+            h = _histograms[key] = [0] * (len(BUCKETS) + 1) + [0.0]
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                h[i] += 1
+                break
+        else:
+            h[len(BUCKETS)] += 1
+        h[-1] += seconds
+    if LOG_JSON:
+        print(json.dumps({"ts": round(time.time(), 3), "metric": name, "ms": round(seconds * 1000, 3), **labels}), flush=True)
+
+
+class _Timer:
+    __slots__ = ("phase", "labels", "start")
+
+    def __init__(self, phase, labels):
+        self.phase = phase
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe("rx_phase_duration_seconds", time.perf_counter() - self.start, phase=self.phase, **self.labels)
+        return False
+
+
+class _NoopTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopTimer()
+
+
+def timer(phase, **labels):
+    """`with timer("openfda_request"):` records the block into rx_phase_duration_seconds{phase=...}."""
+    return _Timer(phase, labels) if ENABLED else _NOOP
+
+
+def timed(phase):
+    def decorate(fn):
+        if not ENABLED:
+            return fn
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _Timer(phase, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def register_collector(fn):
+    """`fn()` -> {metric name: number}, read at export time (for gauges such as cache sizes)."""
+    _collectors.append(fn)
+
+
+# =========================================================
+#  EXPORT
+# =========================================================
+def _collected():
+    out = {}
+    for fn in list(_collectors):
+        try:
+            out.update(fn())
+        except Exception as e:
+            print(f"Metrics collector failed: {e}")
+    return out
+
+
+def snapshot():
+    with _lock:
+        counters = [{"name": n, "labels": dict(l), "value": v} for (n, l), v in _counters.items()]
+        histograms = []
+        for (n, l), h in _histograms.items():
+            count = sum(h[:-1])
+            histograms.append({"name": n, "labels": dict(l), "count": count, "sum": round(h[-1], 6),
+                               "buckets": dict(zip([str(b) for b in BUCKETS] + ["+Inf"], h[:-1]))})
+    return {"enabled": ENABLED, "counters": counters, "histograms": histograms, "gauges": _collected()}
+
+
+def _fmt_labels(labels, extra=None):
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{str(v).replace(chr(34), chr(39))}"' for k, v in items) + "}"
+
+
+def render_prometheus():
+    lines = []
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted(_histograms.items())
+    for name in sorted({n for (n, _), _ in counters}):
+        lines.append(f"# TYPE {name} counter")
+        lines.extend(f"{name}{_fmt_labels(l)} {v}" for (n, l), v in counters if n == name)
+    for name in sorted({n for (n, _), _ in histograms}):
+        lines.append(f"# TYPE {name} histogram")
+        for (n, l), h in histograms:
+            if n != name:
+                continue
+            running = 0
+            for bound, c in zip([str(b) for b in BUCKETS] + ["+Inf"], h[:-1]):
+                running += c
+                lines.append(f"{name}_bucket{_fmt_labels(l, ('le', bound))} {running}")
+            lines.append(f"{name}_sum{_fmt_labels(l)} {h[-1]:.6f}")
+            lines.append(f"{name}_count{_fmt_labels(l)} {running}")
+    for name, value in sorted(_collected().items()):
+        lines.append(f"# TYPE {name} {'counter' if name.endswith('_total') else 'gauge'}")
+        lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def maybe_start_exporter():
+    """Serve /metrics on RX_METRICS_PORT once per process (no-op if unset or metrics are off)."""
+    global _exporter
+    port = os.environ.get("RX_METRICS_PORT")
+    if not ENABLED or not port:
+        return None
+    with _lock:
+        if _exporter is not None:
+            return _exporter
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.startswith("/metrics.json"):
+                    body, ctype = json.dumps(snapshot()).encode(), "application/json"
+                elif self.path.startswith("/metrics"):
+                    body, ctype = render_prometheus().encode(), "text/plain; version=0.0.4"
+                else:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        try:
+            _exporter = ThreadingHTTPServer(("0.0.0.0", int(port)), Handler)
+        except OSError as e:
+            print(f"Metrics exporter not started on port {port}: {e}")
+            return None
+        threading.Thread(target=_exporter.serve_forever, name="metrics-exporter", daemon=True).start()
+    return _exporter
@@ -0,0 +1,207 @@
+import os
+import re
+import threading
+
+from data import COMMON_DRUGS_LIST, GENERIC_NAMES, COMMON_MISSPELLINGS, NOT_DRUG_WORDS
+from label_kb import get_default_kb
+
+# =========================================================
+#  DRUG NAME INDEX ("Did you mean" without a network call)
+# =========================================================
+# SymSpell-style deletion index: every known name is stored under all the
+# strings you get by deleting up to MAX_EDITS characters from its first
+# PREFIX_LEN letters. A query generates the same deletes and only the names
+# sharing one of them are ever compared, so lookup cost doesn't grow with
+# the size of the name list.
+
+MAX_EDITS = 2
+PREFIX_LEN = 7
+# Pre-flight: an unknown name this close to a known one is flagged as a likely typo of it
+# (1 edit, or 2 from TYPO_LONG_WORD letters up); shorter words are too ambiguous to call
+TYPO_MIN_LEN = 5
+TYPO_LONG_WORD = 8
+
+# Doses, strengths and frequencies around a name: "500mg", "10 mg", "1 tab bid", "2x daily"
+_NOISE = re.compile(r"\d+(?:[.,/]\d+)*\s*(?:mg|mcg|ug|g|ml|iu|units?|%|x)?\b|\b(?:tabs?|caps?|qd|qhs|bid|tid|qid|po|daily|weekly|prn)\b")
+
+
+def normalize(name):
+    return " ".join(name.lower().split())
+
+
+def looks_like_drug_name(name):
+    """False for tokens that clearly aren't a drug: numbers, bare doses, "none", "n/a", "as needed"..."""
+    key = normalize(name)
+    if key in NOT_DRUG_WORDS:
+        return False
+    rest = " ".join(_NOISE.sub(" ", key).split())
+    return sum(c.isalpha() for c in rest) >= 3 and rest not in NOT_DRUG_WORDS
+
+
+def _deletes(word, max_edits):
+    out = {word}
+    frontier = {word}
+    for _ in range(max_edits):
+        nxt = set()
+        for w in frontier:
+            for i in range(len(w)):
+                nxt.add(w[:i] + w[i + 1:])
+        out |= nxt
+        frontier = nxt
+    return out
+
+
+def edit_distance(a, b, limit):
+    """Optimal-string-alignment distance (adjacent swaps count as 1); limit + 1 if over `limit`."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev2 = None
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        row_min = cur[0]
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                cur[j] = min(cur[j], prev2[j - 2] + 1)
+            row_min = min(row_min, cur[j])
+        if row_min > limit:
+            return limit + 1
+        prev2, prev = prev, cur
+    return prev[-1] if prev[-1] <= limit else limit + 1
+
+
+class NameIndex:
+    def __init__(self, max_edits=MAX_EDITS, prefix_len=PREFIX_LEN):
+        self.max_edits = max_edits
+        self.prefix_len = prefix_len
+        self._keys = []        # normalized spelling, by id
+        self._canonical = []   # display name it should suggest, by id
+        self._ids = {}         # normalized spelling -> id
+        self._postings = {}    # delete string -> [ids]
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, name, canonical=None):
+        key = normalize(name)
+        if not key or key in self._ids:
+            return
+        idx = len(self._keys)
+        self._ids[key] = idx
+        self._keys.append(key)
+        self._canonical.append(canonical or name)
+        for d in _deletes(key[:self.prefix_len], self.max_edits):
+            self._postings.setdefault(d, []).append(idx)
+
+    def add_file(self, path):
+        # One name per line, or "misspelling<TAB>Canonical Name"
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                parts = line.rstrip("\n").split("\t")
+                if parts[0].strip():
+                    self.add(parts[0].strip(), parts[1].strip() if len(parts) > 1 and parts[1].strip() else None)
+
+    def canonical(self, name):
+        """Canonical spelling if `name` is a known name or known misspelling, else None."""
+        idx = self._ids.get(normalize(name))
+        return None if idx is None else self._canonical[idx]
+
+    def preflight(self, name):
+        """Classify `name` locally before an openFDA lookup: (verdict, suggestion).
+
+        "junk"        not a drug name at all, not worth a lookup
+        "misspelling" a known misspelling (COMMON_MISSPELLINGS); suggestion is the right
+                      spelling, no lookup needed
+        "typo"        an unknown name a typo away from a known one; suggestion is the known
+                      name. The index isn't every drug, so this is what to offer if openFDA
+                      has nothing, not a reason to skip the lookup
+        "lookup"      a known name, or nothing close to one (only openFDA can tell)
+        """
+        if not looks_like_drug_name(name):
+            return "junk", None
+        query = normalize(name)
+        canon = self.canonical(query)
+        if canon is not None:
+            return ("lookup", None) if normalize(canon) == query else ("misspelling", canon)
+        if len(query) < TYPO_MIN_LEN:
+            return "lookup", None
+        close = self.suggest(query, n=1, max_edits=2 if len(query) >= TYPO_LONG_WORD else 1)
+        return ("typo", close[0][0]) if close else ("lookup", None)
+
+    def suggest(self, name, n=3, max_edits=None):
+        """Ranked list of (canonical name, distance), closest first."""
+        query = normalize(name)
+        if not query:
+            return []
+        if max_edits is None:
+            # Short words get fewer edits, otherwise "Axe" would match half the list
+            max_edits = 1 if len(query) <= 4 else self.max_edits
+        max_edits = min(max_edits, self.max_edits)
+
+        seen = set()
+        best = {}
+        for d in _deletes(query[:self.prefix_len], max_edits):
+            for idx in self._postings.get(d, ()):
+                if idx in seen:
+                    continue
+                seen.add(idx)
+                dist = edit_distance(query, self._keys[idx], max_edits)
+                if dist > max_edits:
+                    continue
+                canon = self._canonical[idx]
+                if canon not in best or dist < best[canon]:
+                    best[canon] = dist
+        return sorted(best.items(), key=lambda kv: (kv[1], kv[0]))[:n]
+
+
+def kb_names_path():
+    # The live KB generation's name list, or None without a KB (changes with every ingest)
+    kb = get_default_kb()
+    return kb.names_path() if kb is not None else None
+
+
+def build_default_index(kb_names=None):
+    index = NameIndex()
+    for name in COMMON_DRUGS_LIST + GENERIC_NAMES:
+        index.add(name)
+    for wrong, right in COMMON_MISSPELLINGS.items():
+        index.add(wrong, right)
+    names_file = os.environ.get("DRUG_NAMES_FILE")
+    if names_file and os.path.exists(names_file):
+        index.add_file(names_file)
+    # Every brand and generic name in the offline label KB (label_kb.py), when one is ingested
+    kb_names = kb_names or kb_names_path()
+    if kb_names and os.path.exists(kb_names):
+        index.add_file(kb_names)
+    return index
+
+
+_default_index = None
+_default_index_kb = None  # the KB name list the default index was built from
+_default_lock = threading.Lock()
+_build_lock = threading.Lock()
+
+
+def get_default_index():
+    """The process-wide index; rebuilt when a KB ingest makes a new generation live."""
+    global _default_index, _default_index_kb
+    kb_names = kb_names_path()
+    with _default_lock:
+        current, current_kb = _default_index, _default_index_kb
+    if current is not None and current_kb == kb_names:
+        return current
+    # With a full KB a rebuild takes a moment; meanwhile other threads keep using the old index
+    if not _build_lock.acquire(blocking=current is None):
+        return current
+    try:
+        with _default_lock:
+            if _default_index is not None and _default_index_kb == kb_names:
+                return _default_index
+        index = build_default_index(kb_names)
+        with _default_lock:
+            _default_index, _default_index_kb = index, kb_names
+        return index
+    finally:
+        _build_lock.release()
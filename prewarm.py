@@ -0,0 +1,223 @@
+"""Warm the label cache with the drugs agents look up most.
+
+    python prewarm.py                       # fetch everything, write the snapshot
+    python prewarm.py --top-n 300 --workers 4 --usage-file lookups.txt
+
+The app calls start_prewarm() once per process (not as a thin client of
+scoring_api.py, which does its own lookups). It loads the last snapshot
+(milliseconds), then re-fetches anything missing or stale on a background
+thread while pages are already being served, and rewrites the snapshot.
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+import fda_api
+import metrics
+from data import COMMON_DRUGS_LIST
+from label_cache import CACHEABLE_STATUSES, get_default_cache
+from label_kb import get_default_kb
+from label_record import LabelRecord
+
+# Bump when the cached payload shape changes; older snapshots are then ignored
+SNAPSHOT_VERSION = 2
+DEFAULT_SNAPSHOT_PATH = os.environ.get(
+    "LABEL_SNAPSHOT_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "label_snapshot.json.gz"))
+PREWARM_TOP_N = int(os.environ.get("PREWARM_TOP_N", "100"))
+# Kept low so the warm-up leaves most of the openFDA quota to real lookups
+PREWARM_WORKERS = int(os.environ.get("PREWARM_WORKERS", "2"))
+KINDS = ("multi", "single")  # tab 2 and tab 1 cache keys
+
+
+# =========================================================
+#  WHICH NAMES
+# =========================================================
+def usage_names(cache, top_n, usage_file=None):
+    """Most-used drug names: counted from a usage log (one name per line) if given, else the cache's own recency order."""
+    if top_n <= 0:
+        return []
+    if usage_file and os.path.exists(usage_file):
+        with open(usage_file, encoding="utf-8") as f:
+            counts = Counter(line.strip().lower() for line in f if line.strip())
+        return [name for name, _ in counts.most_common(top_n)]
+    names = []
+    for key in cache.recent_keys(top_n * len(KINDS)):
+        kind, _, name = key.partition(":")
+        if kind in KINDS and name not in names:
+            names.append(name)
+    return names[:top_n]
+
+
+def prewarm_names(cache, top_n=PREWARM_TOP_N, usage_file=None):
+    seen, out = set(), []
+    for name in COMMON_DRUGS_LIST + usage_names(cache, top_n, usage_file):
+        key = name.strip().lower()
+        if key and key not in seen:
+            seen.add(key)
+            out.append(name.strip())
+    return out
+
+
+# =========================================================
+#  SNAPSHOT FILE (gzipped JSON, versioned)
+# =========================================================
+def write_snapshot(cache, keys, path=DEFAULT_SNAPSHOT_PATH):
+    entries = {}
+    for key in keys:
+        entry = cache.peek(key)
+        if entry is not None and entry[1] == 200:
+            entries[key] = [entry[0], entry[2].to_dict()]
+    doc = {"version": SNAPSHOT_VERSION, "created": round(time.time(), 3), "source": fda_api.FDA_LABEL_URL, "entries": entries}
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with gzip.open(tmp, "wt", encoding="utf-8") as f:
+        json.dump(doc, f, separators=(",", ":"))
+    os.replace(tmp, path)  # Readers never see a half-written file
+    return len(entries)
+
+
+def load_snapshot(cache, path=DEFAULT_SNAPSHOT_PATH):
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            doc = json.load(f)
+    except FileNotFoundError:
+        return 0
+    except (OSError, ValueError) as e:
+        print(f"Label snapshot unreadable ({path}): {e}")
+        return 0
+    if doc.get("version") != SNAPSHOT_VERSION or doc.get("source") != fda_api.FDA_LABEL_URL:
+        print(f"Label snapshot {path} is from another version or endpoint, ignoring it")
+        return 0
+    return cache.put_many([(key, 200, LabelRecord.from_dict(d), stored_at) for key, (stored_at, d) in doc["entries"].items()])
+
+
+# =========================================================
+#  PREWARMER
+# =========================================================
+class Prewarmer:
+    def __init__(self, cache, names=None, top_n=PREWARM_TOP_N, usage_file=None,
+                 snapshot_path=DEFAULT_SNAPSHOT_PATH, workers=PREWARM_WORKERS):
+        self.cache = cache
+        self.names = names
+        self.top_n = top_n
+        self.usage_file = usage_file
+        self.snapshot_path = snapshot_path
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._thread = None
+        self._progress = {"state": "idle", "names": 0, "from_snapshot": 0, "total": 0, "done": 0, "failed": 0,
+                          "snapshot_entries": 0, "started": None, "finished": None}
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.run, name="label-prewarm", daemon=True)
+                self._thread.start()
+        return self
+
+    def progress(self):
+        with self._lock:
+            out = dict(self._progress)
+        out["percent"] = round(100.0 * (out["done"] + out["failed"]) / out["total"], 1) if out["total"] else 100.0
+        return out
+
+    def run(self):
+        self._set(state="loading_snapshot", started=time.time())
+        try:
+            self._set(from_snapshot=load_snapshot(self.cache, self.snapshot_path))
+            if self.names is None:
+                self.names = prewarm_names(self.cache, self.top_n, self.usage_file)
+            kb = get_default_kb()
+            if kb:
+                # The offline knowledge base already answers these without openFDA
+                self.names = [n for n in self.names if kb.lookup(n) is None]
+            todo = {kind: [n for n in self.names if self._needs_fetch(f"{kind}:{n.lower()}")] for kind in KINDS}
+            self._set(state="fetching", names=len(self.names), total=sum(len(v) for v in todo.values()))
+            p = self.progress()
+            print(f"Prewarm: {p['from_snapshot']} labels from snapshot, fetching {p['total']}")
+
+            multi, single = todo["multi"], todo["single"]
+            for i, status_code, payload, err in fda_api.resolve_batch(multi, max_workers=self.workers):
+                self._record(f"multi:{multi[i].lower()}", status_code, payload, err)
+            for i, status_code, payload, err in fda_api.lookup_many(single, fda_api.fetch_single_drug, self.workers):
+                self._record(f"single:{single[i].lower()}", status_code, payload, err)
+
+            keys = [f"{kind}:{n.lower()}" for kind in KINDS for n in self.names]
+            self._set(snapshot_entries=write_snapshot(self.cache, keys, self.snapshot_path))
+            self._set(state="done", finished=time.time())
+            p = self.progress()
+            print(f"Prewarm done in {p['finished'] - p['started']:.1f}s: {p['done']} fetched, {p['failed']} failed,"
+                  f" {p['snapshot_entries']} labels in snapshot")
+        except Exception as e:
+            # Never worth taking the app down over; lookups just stay cold
+            self._set(state="failed", finished=time.time())
+            print(f"Prewarm failed: {e}")
+
+    def _needs_fetch(self, key):
+        entry = self.cache.peek(key)
+        ttl = self.cache.negative_ttl if entry is not None and entry[1] == 404 else self.cache.ttl
+        return entry is None or time.time() - entry[0] >= ttl
+
+    def _record(self, key, status_code, payload, err):
+        # A 404 is a real answer (the drug isn't in openFDA), not a failed warm-up
+        ok = err is None and status_code in CACHEABLE_STATUSES
+        if ok:
+            self.cache.put(key, status_code, payload)
+        with self._lock:
+            self._progress["done" if ok else "failed"] += 1
+            finished = self._progress["done"] + self._progress["failed"]
+            total = self._progress["total"]
+        if finished % 25 == 0 and finished < total:
+            print(f"Prewarm: {finished}/{total}")
+
+    def _set(self, **fields):
+        with self._lock:
+            self._progress.update(fields)
+
+
+_default_prewarmer = None
+_default_lock = threading.Lock()
+
+
+def start_prewarm():
+    """Start the process-wide warm-up once and return it (None when PREWARM=0)."""
+    global _default_prewarmer
+    if os.environ.get("PREWARM", "1").lower() in ("0", "false", "no", "off"):
+        return None
+    with _default_lock:
+        if _default_prewarmer is None:
+            _default_prewarmer = Prewarmer(get_default_cache(), usage_file=os.environ.get("PREWARM_USAGE_FILE")).start()
+    return _default_prewarmer
+
+
+def _export_progress():
+    if _default_prewarmer is None:
+        return {}
+    p = _default_prewarmer.progress()
+    return {f"rx_prewarm_{k}": p[k] for k in ("total", "done", "failed", "from_snapshot", "percent")}
+
+
+metrics.register_collector(_export_progress)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fetch the common drug labels into the cache and write a snapshot.")
+    parser.add_argument("--top-n", type=int, default=PREWARM_TOP_N, help="extra names from usage on top of COMMON_DRUGS_LIST")
+    parser.add_argument("--usage-file", default=os.environ.get("PREWARM_USAGE_FILE"), help="usage log, one drug name per line")
+    parser.add_argument("--snapshot", default=DEFAULT_SNAPSHOT_PATH)
+    parser.add_argument("--workers", type=int, default=PREWARM_WORKERS)
+    args = parser.parse_args(argv)
+
+    warmer = Prewarmer(get_default_cache(), top_n=args.top_n, usage_file=args.usage_file,
+                       snapshot_path=args.snapshot, workers=args.workers)
+    warmer.run()
+    return 0 if warmer.progress()["state"] == "done" else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
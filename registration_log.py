@@ -0,0 +1,262 @@
+import atexit
+import glob
+import itertools
+import json
+import os
+import queue
+import random
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: the spill file is only guarded within this process
+    fcntl = None
+
+# =========================================================
+#  WRITE-BEHIND REGISTRATION LOGGER
+# =========================================================
+# Login drops a row on an in-process queue and returns right away. A
+# background worker sends queued rows to the sheet in batches with
+# append_rows, retrying with exponential backoff. If the sheet stays
+# unreachable the batch is spilled to a local JSONL file, which is replayed
+# ahead of the next successful flush.
+#
+# The spill file is shared by every process on the host. Appends and claims
+# take an flock on "<spill>.lock"; a replay first renames the file to a claim
+# of its own ("<spill>.replaying.<pid>.<n>"), so no two processes send the
+# same rows and nothing spilled during the send is deleted with it. Claims
+# left behind by a process that died mid-replay are taken over by the next one.
+
+DEFAULT_SPILL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "registrations_pending.jsonl")
+
+
+class SheetsBackend:
+    def __init__(self, client, sheet_id):
+        self._client = client
+        self._sheet_id = sheet_id
+        self._sheet = None
+
+    def append_rows(self, rows):
+        if self._sheet is None:
+            self._sheet = self._client.open_by_key(self._sheet_id).sheet1
+        try:
+            self._sheet.append_rows(rows, value_input_option="RAW")
+        except Exception:
+            self._sheet = None  # Re-open on the next attempt in case the handle went bad
+            raise
+
+
+class FakeSheetBackend:
+    """Local stand-in for the Google sheet (REGISTRATION_BACKEND=fake).
+
+    Rows are kept in `rows` and, if `path` is set, appended to that file as JSON lines.
+    `fail_next` makes the next N append calls raise, to exercise retry and spill.
+    """
+
+    def __init__(self, path=None, latency=0.0, fail_next=0):
+        self.path = path
+        self.latency = latency
+        self.fail_next = fail_next
+        self.rows = []
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def append_rows(self, rows):
+        with self._lock:
+            self.calls += 1
+            if self.latency:
+                time.sleep(self.latency)
+            if self.fail_next > 0:
+                self.fail_next -= 1
+                raise ConnectionError("fake sheet unavailable")
+            self.rows.extend(rows)
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    for row in rows:
+                        f.write(json.dumps(row) + "\n")
+
+
+class RegistrationLogger:
+    def __init__(self, backend, spill_path=DEFAULT_SPILL_PATH, batch_size=50, flush_interval=2.0,
+                 max_retries=4, base_backoff=1.0):
+        self.backend = backend
+        self.spill_path = spill_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self._queue = queue.Queue()
+        self._worker = None
+        self._start_lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        self._claims = itertools.count()
+        self._stats_lock = threading.Lock()
+        self._stats = {"queued": 0, "sent": 0, "batches": 0, "retries": 0, "spilled": 0, "replayed": 0}
+
+    def log(self, *row):
+        self._ensure_worker()
+        self._bump("queued")
+        self._queue.put(list(row))
+
+    def flush(self, timeout=10.0):
+        """Block until everything queued so far has been sent or spilled."""
+        if self._worker is None:
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def stats(self):
+        with self._stats_lock:
+            out = dict(self._stats)
+        out["pending"] = self._queue.qsize()
+        return out
+
+    def _bump(self, name, n=1):
+        with self._stats_lock:
+            self._stats[name] += n
+
+    # ---------- worker ----------
+    def _ensure_worker(self):
+        with self._start_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="registration-writer", daemon=True)
+                self._worker.start()
+                atexit.register(self.flush, 5.0)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            batch, waiters = [], []
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    batch.append(item)
+                if len(batch) >= self.batch_size or waiters:
+                    break
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+            if batch:
+                self._send(batch)
+            for w in waiters:
+                w.set()
+
+    def _send(self, batch):
+        claims, replay = self._claim_spill()
+        rows = replay + batch
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.backend.append_rows(rows)
+                with self._stats_lock:
+                    self._stats["sent"] += len(rows)
+                    self._stats["batches"] += 1
+                    self._stats["replayed"] += len(replay)
+                self._drop_claims(claims)
+                return
+            except Exception as e:
+                if attempt == self.max_retries:
+                    print(f"Registration sheet unavailable, spilling {len(batch)} rows to disk: {e}")
+                    break
+                self._bump("retries")
+                time.sleep(self.base_backoff * (2 ** attempt) * (0.5 + random.random()))
+        # Claimed rows go back first, then the claims are dropped: a crash in between
+        # can duplicate a sheet row but never lose one
+        self._spill(replay, count=False)
+        self._spill(batch)
+        self._drop_claims(claims)
+
+    # ---------- spill file ----------
+    def _file_lock(self):
+        # Held only around appends and claims, never across a send
+        os.makedirs(os.path.dirname(self.spill_path) or ".", exist_ok=True)
+        return _FileLock(f"{self.spill_path}.lock", self._spill_lock)
+
+    def _spill(self, rows, count=True):
+        if not rows:
+            return
+        with self._file_lock():
+            with open(self.spill_path, "a", encoding="utf-8") as f:
+                for row in rows:
+                    f.write(json.dumps(row) + "\n")
+        if count:
+            self._bump("spilled", len(rows))
+
+    def _claim_spill(self):
+        """Move the spill file, and any claim whose process died, to claims of our own: (paths, rows)."""
+        claims = []
+        with self._file_lock():
+            sources = [p for p in sorted(glob.glob(f"{glob.escape(self.spill_path)}.replaying.*")) if _claim_is_orphan(p)]
+            sources.append(self.spill_path)
+            for src in sources:
+                claim = f"{self.spill_path}.replaying.{os.getpid()}.{next(self._claims)}"
+                try:
+                    os.rename(src, claim)
+                except FileNotFoundError:
+                    continue  # Nothing spilled, or another process took it over first
+                claims.append(claim)
+        rows = []
+        for claim in claims:
+            with open(claim, encoding="utf-8") as f:
+                rows.extend(json.loads(line) for line in f if line.strip())
+        return claims, rows
+
+    def _drop_claims(self, claims):
+        for claim in claims:
+            try:
+                os.remove(claim)
+            except FileNotFoundError:
+                pass
+
+
+class _FileLock:
+    # flock on `path` plus `thread_lock` (flock doesn't order threads that share one process)
+    def __init__(self, path, thread_lock):
+        self.path = path
+        self.thread_lock = thread_lock
+        self._f = None
+
+    def __enter__(self):
+        self.thread_lock.acquire()
+        if fcntl is not None:
+            self._f = open(self.path, "a")
+            fcntl.flock(self._f, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self._f is not None:
+            self._f.close()  # Releases the flock
+            self._f = None
+        self.thread_lock.release()
+
+
+def _claim_is_orphan(path):
+    # "<spill>.replaying.<pid>.<n>": orphaned when that process no longer exists
+    try:
+        pid = int(path.rsplit(".", 2)[-2])
+    except ValueError:
+        return False
+    if pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        pass  # Alive, just not ours to signal
+    return False
+
+
+def backend_from_env(client_factory):
+    """Fake sheet if REGISTRATION_BACKEND=fake, else the Google sheet; None if no credentials."""
+    if os.environ.get("REGISTRATION_BACKEND", "").lower() == "fake":
+        return FakeSheetBackend(path=os.environ.get("FAKE_SHEET_PATH"))
+    client = client_factory()
+    if client is None:
+        return None
+    sheet_id = os.environ.get("sheet_id") or os.environ.get("SHEET_ID")
+    return SheetsBackend(client, sheet_id)
@@ -0,0 +1,232 @@
+from collections import Counter, deque
+from functools import lru_cache
+
+from data import (DRUG_RISK_RULES, DEFAULT_DRUG_RISK, CATEGORY_RULES, DEFAULT_CATEGORY, DRUG_TAG_RULES,
+                  INTERACTION_RULES, IMPAIRMENT_DATA, COMORBIDITY_RULES, RISK_ORDER)
+
+# =========================================================
+#  RULE COMPILER (Aho-Corasick keyword matcher)
+# =========================================================
+# Every term of every rule goes into one automaton, so a label is classified
+# in a single pass over its text no matter how many rules there are.
+
+
+class KeywordMatcher:
+    def __init__(self, keywords):
+        """`keywords` is an iterable of (term, value); find() returns the values of every term present."""
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+        for term, value in keywords:
+            state = 0
+            for ch in term.lower():
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                state = nxt
+            self._out[state] = self._out[state] + (value,)
+
+        # Breadth-first pass: fail links, and each state inherits its fail state's outputs
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = self._fail[state]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find(self, text):
+        goto, fail, out = self._goto, self._fail, self._out
+        found = set()
+        state = 0
+        for ch in text.lower():
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                found.update(out[state])
+        return found
+
+
+class RuleSet:
+    def __init__(self, rules):
+        self.rules = sorted(rules, key=lambda r: r.get("priority", 0))
+        self._name_matcher = KeywordMatcher((t, i) for i, r in enumerate(self.rules) for t in r.get("name_terms", ()))
+        self._text_matcher = KeywordMatcher((t, i) for i, r in enumerate(self.rules) for t in r.get("text_terms", ()))
+
+    def matches(self, text, name):
+        """All matching rules, highest priority first."""
+        hits = self._name_matcher.find(name) | self._text_matcher.find(text)
+        return [self.rules[i] for i in sorted(hits)]
+
+    def best(self, text, name):
+        hits = self._name_matcher.find(name) | self._text_matcher.find(text)
+        return self.rules[min(hits)] if hits else None
+
+
+# =========================================================
+#  INTERACTION INDEX (n-way rules over drug tags)
+# =========================================================
+# Each rule is filed under its rarest tag, so a med list only looks at rules
+# anchored on a tag it actually has. A tag bitmask rejects most of those
+# before the exact check (enough *different* meds for every tag the rule needs).
+
+
+class InteractionIndex:
+    def __init__(self, rules):
+        self.rules = sorted(rules, key=lambda r: r["priority"])
+        self._needs = [dict(r["needs"]) for r in self.rules]
+        tags = sorted({t for needs in self._needs for t in needs})
+        self._bit = {t: 1 << i for i, t in enumerate(tags)}
+        self._masks = [sum(self._bit[t] for t in needs) for needs in self._needs]
+
+        self._with_tag = {}  # tag -> every rule needing it
+        for i, needs in enumerate(self._needs):
+            for t in needs:
+                self._with_tag.setdefault(t, []).append(i)
+        freq = Counter({t: len(rules) for t, rules in self._with_tag.items()})
+        self._anchor = [min(needs, key=lambda t: (freq[t], t)) for needs in self._needs]
+        self._by_anchor = {}
+        for i, anchor in enumerate(self._anchor):
+            self._by_anchor.setdefault(anchor, []).append(i)
+
+        # Rules that knock rule i out when they fire alongside it
+        ids = {r["id"]: i for i, r in enumerate(self.rules)}
+        self._beaten_by = [set() for _ in self.rules]
+        for j, r in enumerate(self.rules):
+            for rid in r.get("suppresses", ()):
+                self._beaten_by[ids[rid]].add(j)
+        for i, small in enumerate(self._needs):
+            # A more specific rule needs every tag of this one, so it is on this rule's anchor list
+            for j in self._with_tag[self._anchor[i]]:
+                big = self._needs[j]
+                if (j != i and self._masks[j] & self._masks[i] == self._masks[i] and small != big
+                        and all(big.get(t, 0) >= n for t, n in small.items())):
+                    self._beaten_by[i].add(j)
+
+    def match(self, drug_tags):
+        """Rules fired by a med list (one tag collection per distinct med), most specific only, by priority."""
+        holders = {}
+        for pos, tags in enumerate(drug_tags):
+            for t in tags:
+                holders.setdefault(t, set()).add(pos)
+        present = sum(self._bit.get(t, 0) for t in holders)
+        fired = set()
+        for tag in holders:
+            for i in self._by_anchor.get(tag, ()):
+                if self._masks[i] & present == self._masks[i] and self._satisfied(self._needs[i], holders):
+                    fired.add(i)
+        return [self.rules[i] for i in sorted(fired) if not self._beaten_by[i] & fired]
+
+    @staticmethod
+    def _satisfied(needs, holders):
+        if any(len(holders[t]) < n for t, n in needs.items()):
+            return False
+        # Give every required slot its own med; one med tagged twice can't fill two slots
+        slots = sorted((t for t, n in needs.items() for _ in range(n)), key=lambda t: len(holders[t]))
+
+        def assign(k, used):
+            if k == len(slots):
+                return True
+            for pos in holders[slots[k]]:
+                if pos not in used and assign(k + 1, used | {pos}):
+                    return True
+            return False
+        return assign(0, frozenset())
+
+
+# =========================================================
+#  COMORBIDITY ENGINE (bitset rules over condition IDs)
+# =========================================================
+# Each IMPAIRMENT_DATA condition gets a bit; a rule's condition tests become
+# two masks, so checking a rule is a couple of integer ANDs however many
+# conditions are selected.
+
+
+class ComorbidityEngine:
+    def __init__(self, rules, conditions):
+        names = list(conditions)
+        self._bit = {name: 1 << i for i, name in enumerate(names)}
+        self._base = {name: RISK_ORDER.index(conditions[name].get("risk", "risk-med")) for name in names}
+        self._rules = []
+        for r in rules:
+            for name in list(r.get("all_of", ())) + list(r.get("any_of", ())) + list(r.get("applies_to", ())):
+                if name not in self._bit:
+                    raise ValueError(f"Comorbidity rule {r['id']!r} names unknown condition {name!r}")
+            self._rules.append((self.mask(r.get("all_of", ())), self.mask(r.get("any_of", ())), r.get("smoker"),
+                                r.get("bmi_over"), r.get("bmi_at_most"), self.mask(r.get("applies_to", ())) or -1, r))
+
+    def mask(self, conditions):
+        # Names that aren't in IMPAIRMENT_DATA (free text from batch files) just don't set a bit
+        m = 0
+        for name in conditions:
+            m |= self._bit.get(name, 0)
+        return m
+
+    def evaluate(self, conditions, is_smoker, bmi):
+        """{"warnings": [...], "risks": {condition: risk level}, "floor": lowest overall risk level}"""
+        selected = self.mask(conditions)
+        warnings, bumps, floor = [], [], 0
+        for all_mask, any_mask, smoker, bmi_over, bmi_at_most, applies, r in self._rules:
+            if all_mask & selected != all_mask or (any_mask and not any_mask & selected):
+                continue
+            if smoker is not None and bool(is_smoker) != smoker:
+                continue
+            if (bmi_over is not None and not bmi > bmi_over) or (bmi_at_most is not None and not bmi <= bmi_at_most):
+                continue
+            if "warning" in r:
+                warnings.append(r["warning"])
+            if r.get("bump"):
+                bumps.append((applies, r["bump"]))
+            if "floor" in r:
+                floor = max(floor, RISK_ORDER.index(r["floor"]))
+        risks = {}
+        for name in conditions:
+            if name in self._base:
+                bit = self._bit[name]
+                step = max((n for applies, n in bumps if applies & bit), default=0)
+                risks[name] = RISK_ORDER[min(len(RISK_ORDER) - 1, self._base[name] + step)]
+        return {"warnings": warnings, "risks": risks, "floor": RISK_ORDER[floor]}
+
+
+DRUG_RISK_RULESET = RuleSet(DRUG_RISK_RULES)
+CATEGORY_RULESET = RuleSet(CATEGORY_RULES)
+DRUG_TAG_RULESET = RuleSet([r for r in DRUG_TAG_RULES if "category" not in r])
+CATEGORY_TAGS = {r["category"]: r["tag"] for r in DRUG_TAG_RULES if "category" in r}
+INTERACTION_INDEX = InteractionIndex(INTERACTION_RULES)
+COMORBIDITY_ENGINE = ComorbidityEngine(COMORBIDITY_RULES, IMPAIRMENT_DATA)
+
+
+def classify_drug_risk(indication_text, brand_name):
+    rule = DRUG_RISK_RULESET.best(indication_text, brand_name) or DEFAULT_DRUG_RISK
+    return {"risk": rule["risk"], "style": rule["style"], "questions": list(rule["questions"]), "rating": rule["rating"]}
+
+
+# Labels are shared, immutable records, so the same (text, name) comes back on every rerun
+@lru_cache(maxsize=4096)
+def classify_category(text, name):
+    rule = CATEGORY_RULESET.best(text, name)
+    return rule["category"] if rule else DEFAULT_CATEGORY
+
+
+@lru_cache(maxsize=4096)
+def classify_tags(text, name):
+    tags = {r["tag"] for r in DRUG_TAG_RULESET.matches(text, name)}
+    category_tag = CATEGORY_TAGS.get(classify_category(text, name))
+    return frozenset(tags | {category_tag} if category_tag else tags)
+
+
+def match_interactions(drug_tags):
+    # A bare string is one tag, so old-style category lists ("Diabetes", ...) still work
+    return INTERACTION_INDEX.match([{t.lower()} if isinstance(t, str) else t for t in drug_tags])
+
+
+def assess_comorbidities(conditions, is_smoker, bmi):
+    return COMORBIDITY_ENGINE.evaluate(conditions, is_smoker, bmi)
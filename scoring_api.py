@@ -0,0 +1,290 @@
+"""JSON scoring API: the same engine the Streamlit tabs use, over HTTP.
+
+    python scoring_api.py --port 8600 --workers 4
+    SCORING_API_URL=http://127.0.0.1:8600 streamlit run med_decoder.py   # app as a thin client
+
+    POST /v1/drug          {"name": "Eliquis", "force": false}              tab 1 (force skips the typo check)
+    POST /v1/meds          {"meds": ["Metformin", ...], "stream": false}    tab 2 (stream -> NDJSON per med)
+    POST /v1/combinations  {"drugs": [{"drug_key", "tags"}, ...]}           tab 2 verdict from per-drug entries
+    POST /v1/conditions    {"conditions": [...], "smoker": true, "bmi": 31} tab 3
+    POST /v1/build         {"height_in", "weight", "age", "sex"} or {"applicants": [...]}
+    POST /v1/score         {"applicants": [...], "use_fda": true}           batch_score.py's scoring
+    GET  /healthz, /metrics
+
+Drug lookups that arrive within BATCH_WINDOW_MS of each other, from any
+number of requests, go out together as batched openFDA queries. Every worker
+process keeps its own memory cache in front of the shared on-disk label cache
+(LABEL_CACHE_PATH), and the openFDA quota is split evenly between workers.
+Names in the offline label knowledge base (label_kb.py) never reach the
+batcher's openFDA calls; all workers map the same knowledge base files.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+import engine
+import fda_api
+import metrics
+from data import IMPAIRMENT_DATA
+
+API_PORT = int(os.environ.get("SCORING_API_PORT", "8600"))
+API_WORKERS = int(os.environ.get("SCORING_API_WORKERS", "1"))
+API_KEY = os.environ.get("SCORING_API_KEY")
+API_LOOKUP_THREADS = int(os.environ.get("SCORING_API_THREADS", "16"))
+BATCH_WINDOW_MS = float(os.environ.get("SCORING_API_BATCH_MS", "5"))
+MAX_MEDS = 200
+MAX_APPLICANTS = 1000
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# =========================================================
+#  LOOKUP BATCHER (coalesces drug lookups across requests)
+# =========================================================
+class LookupBatcher:
+    def __init__(self, executor, window_ms=BATCH_WINDOW_MS, max_names=fda_api.BATCH_MAX_TERMS):
+        self.executor = executor
+        self.window = window_ms / 1000.0
+        self.max_names = max_names
+        self._pending = {}  # lower-cased name -> (name as typed, [futures])
+        self._timer = None
+
+    async def lookup(self, name):
+        """(status_code, LabelRecord, err) for one med, like a row of resolve_fda_multi_drugs."""
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._pending.setdefault(name.strip().lower(), (name, []))[1].append(fut)
+        if len(self._pending) >= self.max_names:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await fut
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = list(self._pending.values()), {}
+        if batch:
+            metrics.inc("rx_api_lookup_batches_total")
+            metrics.inc("rx_api_lookup_names_total", len(batch))
+            asyncio.get_running_loop().run_in_executor(self.executor, self._resolve, asyncio.get_running_loop(), batch)
+
+    @staticmethod
+    def _resolve(loop, batch):
+        def settle(futures, value=None, exc=None):
+            for fut in futures:
+                if fut.done():
+                    continue
+                if exc is not None:
+                    fut.set_exception(exc)
+                else:
+                    fut.set_result(value)
+
+        names = [name for name, _ in batch]
+        try:
+            for i, status_code, record, err in engine.resolve_fda_multi_drugs(names):
+                loop.call_soon_threadsafe(settle, batch[i][1], (status_code, record, err))
+        except Exception as e:
+            for _, futures in batch:
+                loop.call_soon_threadsafe(settle, futures, None, e)
+
+
+executor = ThreadPoolExecutor(max_workers=API_LOOKUP_THREADS, thread_name_prefix="scoring-api")
+batcher = LookupBatcher(executor)
+
+
+def _blocking(fn, *args):
+    return asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+
+
+def _error_json(err):
+    if isinstance(err, fda_api.RateLimited):
+        return {"type": "rate_limited", "retry_after": err.retry_after}
+    if isinstance(err, requests.exceptions.RequestException):
+        return {"type": "upstream", "message": str(err)}
+    return {"type": "internal", "message": f"{type(err).__name__}: {err}"}
+
+
+async def _med_row(i, med):
+    try:
+        status_code, record, err = await batcher.lookup(med)
+        if err is None:
+            return {"i": i, "name": med, "entry": await _blocking(engine.med_entry, med, status_code, record)}
+    except Exception as e:
+        err = e
+    return {"i": i, "name": med, "error": _error_json(err)}
+
+
+# =========================================================
+#  ENDPOINTS
+# =========================================================
+async def _body(request):
+    if API_KEY and request.headers.get("authorization") != f"Bearer {API_KEY}":
+        raise ApiError(401, "missing or wrong API key")
+    try:
+        body = await request.json()
+    except ValueError:
+        raise ApiError(400, "body must be JSON")
+    if not isinstance(body, dict):
+        raise ApiError(400, "body must be a JSON object")
+    return body
+
+
+def _str_list(value, field, limit):
+    if isinstance(value, str):
+        value = value.split(",")
+    if not isinstance(value, list):
+        raise ApiError(400, f"'{field}' must be a list or a comma separated string")
+    if len(value) > limit:
+        raise ApiError(413, f"at most {limit} '{field}' per request")
+    return [str(v).strip() for v in value if str(v).strip()]
+
+
+async def drug(request):
+    body = await _body(request)
+    name = str(body.get("name") or "").strip()
+    if not name:
+        raise ApiError(400, "'name' is required")
+    with metrics.timer("api_drug"):
+        return JSONResponse(await _blocking(engine.decode_drug, name, body.get("force") is True))
+
+
+async def meds(request):
+    body = await _body(request)
+    names = [m for m in _str_list(body.get("meds"), "meds", MAX_MEDS) if len(m) >= 3]
+    tasks = [asyncio.ensure_future(_med_row(i, m)) for i, m in enumerate(names)]
+    if body.get("stream"):
+        async def rows():
+            for next_row in asyncio.as_completed(tasks):
+                yield json.dumps(await next_row) + "\n"
+        return StreamingResponse(rows(), media_type="application/x-ndjson")
+    with metrics.timer("api_meds"):
+        results = await asyncio.gather(*tasks)
+    combos = await _blocking(engine.combo_verdict, [r.get("entry") for r in results])
+    return JSONResponse({"meds": results, "combinations": combos})
+
+
+async def combinations(request):
+    body = await _body(request)
+    drugs = body.get("drugs")
+    if not isinstance(drugs, list) or not all(isinstance(d, dict) and "drug_key" in d for d in drugs):
+        raise ApiError(400, "'drugs' must be a list of {drug_key, tags}")
+    entries = [{"found": d.get("found", True), "drug_key": str(d["drug_key"]).lower(), "tags": list(d.get("tags") or [])}
+               for d in drugs]
+    return JSONResponse({"combinations": await _blocking(engine.combo_verdict, entries)})
+
+
+async def conditions(request):
+    body = await _body(request)
+    conds = _str_list(body.get("conditions") or [], "conditions", len(IMPAIRMENT_DATA))
+    unknown = [c for c in conds if c not in IMPAIRMENT_DATA]
+    if unknown:
+        raise ApiError(400, f"unknown conditions: {', '.join(unknown)}")
+    return JSONResponse(await _blocking(_conditions_result, conds, engine._as_bool(body.get("smoker")),
+                                       engine._as_number(body.get("bmi"))))
+
+
+def _conditions_result(conds, smoker, bmi):
+    result = engine.analyze_impairments(conds, smoker, bmi)
+    result["matrices"] = {c: engine.get_product_matrix(result["risks"][c]) for c in conds}
+    return result
+
+
+async def build(request):
+    body = await _body(request)
+    if "applicants" not in body:
+        return JSONResponse(await _blocking(engine.rate_build, engine._as_number(body.get("height_in")),
+                                            engine._as_number(body.get("weight")), engine._as_number(body.get("age"), None),
+                                            body.get("sex")))
+    applicants = body["applicants"]
+    if not isinstance(applicants, list) or len(applicants) > MAX_APPLICANTS * 100:
+        raise ApiError(400, f"'applicants' must be a list of at most {MAX_APPLICANTS * 100}")
+    return JSONResponse({"ratings": await _blocking(engine.rate_builds, applicants)})
+
+
+async def score(request):
+    body = await _body(request)
+    applicants = body.get("applicants")
+    if not isinstance(applicants, list) or not all(isinstance(a, dict) for a in applicants):
+        raise ApiError(400, "'applicants' must be a list of objects")
+    if len(applicants) > MAX_APPLICANTS:
+        raise ApiError(413, f"at most {MAX_APPLICANTS} applicants per request")
+    use_fda = body.get("use_fda", True) is not False
+    builds = await _blocking(engine.rate_builds, applicants)
+    with metrics.timer("api_score"):
+        results = await asyncio.gather(*(_blocking(engine.score_applicant, a, use_fda, b) for a, b in zip(applicants, builds)),
+                                       return_exceptions=True)
+    return JSONResponse({"results": [{"id": a.get("id"), "error": f"{type(r).__name__}: {r}"} if isinstance(r, Exception) else r
+                                     for a, r in zip(applicants, results)]})
+
+
+async def healthz(request):
+    return JSONResponse({"ok": True, "pid": os.getpid(), "label_cache": await _blocking(engine.get_default_cache().stats)})
+
+
+async def metrics_text(request):
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+async def api_error(request, exc):
+    return JSONResponse({"error": str(exc)}, status_code=exc.status)
+
+
+async def rate_limited(request, exc):
+    # Whole seconds, rounded up: "0" would tell the client to retry right away
+    headers = {"Retry-After": str(max(1, math.ceil(exc.retry_after or 0)))}
+    return JSONResponse({"error": "openFDA is busy, try again shortly", "retry_after": exc.retry_after}, 429, headers)
+
+
+async def upstream_error(request, exc):
+    return JSONResponse({"error": f"openFDA unreachable: {exc}"}, status_code=502)
+
+
+app = Starlette(
+    routes=[
+        Route("/v1/drug", drug, methods=["POST"]),
+        Route("/v1/meds", meds, methods=["POST"]),
+        Route("/v1/combinations", combinations, methods=["POST"]),
+        Route("/v1/conditions", conditions, methods=["POST"]),
+        Route("/v1/build", build, methods=["POST"]),
+        Route("/v1/score", score, methods=["POST"]),
+        Route("/healthz", healthz),
+        Route("/metrics", metrics_text),
+    ],
+    exception_handlers={ApiError: api_error, fda_api.RateLimited: rate_limited,
+                        requests.exceptions.RequestException: upstream_error},
+)
+
+
+def main(argv=None):
+    import uvicorn
+    parser = argparse.ArgumentParser(description="Rx Assistant JSON scoring API")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=API_PORT)
+    parser.add_argument("--workers", type=int, default=API_WORKERS, help="worker processes")
+    args = parser.parse_args(argv)
+
+    if args.workers > 1 and fda_api.FDA_RATE_PER_MIN > 0:
+        # Each worker has its own token bucket; together they must stay inside the one openFDA quota
+        os.environ["FDA_RATE_PER_MIN"] = str(fda_api.FDA_RATE_PER_MIN / args.workers)
+        os.environ["FDA_RATE_BURST"] = str(max(1, fda_api.FDA_RATE_BURST // args.workers))
+    uvicorn.run("scoring_api:app", host=args.host, port=args.port, workers=args.workers, log_level="warning")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+import json
+import os
+import threading
+
+import requests
+
+import engine
+from fda_api import RateLimited
+
+# =========================================================
+#  SCORING BACKEND (in-process engine or scoring_api.py over HTTP)
+# =========================================================
+# The page only calls decode_drug / med_entries / combo_verdict /
+# analyze_impairments / rate_build on whatever get_default_backend() returns.
+#   SCORING_API_URL=http://scoring:8600   use the API (the app is a thin client)
+#   SCORING_API_KEY=...                   sent as a bearer token if the API wants one
+# Unset, it's the engine module itself and nothing goes over the network.
+
+SCORING_API_TIMEOUT = float(os.environ.get("SCORING_API_TIMEOUT", "30"))
+
+
+class RemoteEngine:
+    def __init__(self, base_url, api_key=None, timeout=SCORING_API_TIMEOUT):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        if api_key:
+            self.session.headers["Authorization"] = f"Bearer {api_key}"
+
+    def _post(self, path, body, stream=False):
+        r = self.session.post(f"{self.base_url}{path}", json=body, timeout=self.timeout, stream=stream)
+        if r.status_code == 429:
+            raise RateLimited(float(r.headers.get("Retry-After") or 0) or None)
+        r.raise_for_status()  # HTTPError is a RequestException, so the tabs show "couldn't reach"
+        return r
+
+    def decode_drug(self, drug_name, force=False):
+        return self._post("/v1/drug", {"name": drug_name, "force": force}).json()
+
+    def med_entries(self, meds):
+        # NDJSON, one line per med as it resolves, so tab 2 still fills in as results arrive
+        with self._post("/v1/meds", {"meds": meds, "stream": True}, stream=True) as r:
+            for line in r.iter_lines():
+                if line:
+                    row = json.loads(line)
+                    yield row["i"], row.get("entry"), _error(row.get("error"))
+
+    def combo_verdict(self, entries):
+        return self._post("/v1/combinations", {"drugs": [e for e in entries if e]}).json()["combinations"]
+
+    def analyze_impairments(self, conditions, is_smoker, bmi):
+        return self._post("/v1/conditions", {"conditions": list(conditions), "smoker": is_smoker, "bmi": bmi}).json()
+
+    def rate_build(self, height_in, weight, age=None, sex=None):
+        return self._post("/v1/build", {"height_in": height_in, "weight": weight, "age": age, "sex": sex}).json()
+
+
+def _error(err):
+    # Per-med errors come back as {"type", "message"}; turn them into what the in-process engine would raise
+    if not err:
+        return None
+    if err["type"] == "rate_limited":
+        return RateLimited(err.get("retry_after"))
+    if err["type"] == "upstream":
+        return requests.exceptions.RequestException(err.get("message", ""))
+    return RuntimeError(err.get("message", ""))
+
+
+_default_backend = None
+_default_lock = threading.Lock()
+
+
+def get_default_backend():
+    global _default_backend
+    with _default_lock:
+        if _default_backend is None:
+            url = os.environ.get("SCORING_API_URL")
+            _default_backend = RemoteEngine(url, os.environ.get("SCORING_API_KEY")) if url else engine
+    return _default_backend
+
+
+def set_default_backend(backend):
+    global _default_backend
+    with _default_lock:
+        _default_backend = backend
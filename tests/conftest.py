@@ -0,0 +1,39 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# The sample openFDA dump the benchmarks use (86 labels)
+FIXTURE_DUMP = os.path.join(ROOT, "benchmarks", "fixtures", "openfda_labels.json")
+
+
+@pytest.fixture
+def offline_engine(monkeypatch):
+    """The engine on a memory-only cache and no label KB. openFDA isn't reached: every
+    lookup is recorded in the returned list and answered 404."""
+    import fda_api
+    import label_cache
+    import label_kb
+    calls = []
+
+    def fetch(name):
+        calls.append(name)
+        return 404, None
+
+    def resolve_batch(names, max_workers=None):
+        for i, name in enumerate(names):
+            calls.append(name)
+            yield i, 404, None, None
+
+    monkeypatch.setattr(fda_api, "fetch_single_drug", fetch)
+    monkeypatch.setattr(fda_api, "fetch_multi_drug", fetch)
+    monkeypatch.setattr(fda_api, "resolve_batch", resolve_batch)
+    monkeypatch.setenv("LABEL_KB_PATH", "")
+    label_kb.set_default_kb(None)
+    label_cache.set_default_cache(label_cache.LabelCache(path=None))
+    yield calls
+    label_kb.set_default_kb(None)
+    label_cache.set_default_cache(None)
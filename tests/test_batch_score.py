@@ -0,0 +1,38 @@
+import io
+import json
+
+import batch_score
+
+BOOK = "\n".join([
+    '{"id": 1, "meds": "Metformin, Plavix", "height_in": 70, "weight": 200}',
+    '{"id": 2, "meds": ',
+    '["not", "an", "applicant"]',
+    '{"id": 3, "conditions": ["Asthma"], "height_in": 64, "weight": 150}',
+]) + "\n"
+
+
+def test_bad_lines_become_error_rows_and_the_rest_are_scored():
+    items = batch_score.with_builds(batch_score.read_records(io.StringIO(BOOK), "jsonl"))
+    results = [batch_score.score_record(item, use_fda=False) for item in items]
+    assert [r["id"] for r in results] == [1, None, None, 3]
+    assert results[1]["error"].startswith("line 2: not valid JSON")
+    assert results[2]["error"] == "line 3: expected a JSON object, got list"
+    assert results[0]["build_class"] == "Preferred" and "error" not in results[3]
+
+
+def test_a_chunk_that_wont_rate_falls_back_to_one_record_at_a_time(monkeypatch):
+    records = [{"id": 1, "height_in": 70, "weight": 200}, {"id": 2, "height_in": 64, "weight": 150}]
+
+    def boom(records):
+        raise TypeError("odd field")
+    monkeypatch.setattr(batch_score, "rate_builds", boom)
+    assert [b for _, b in batch_score.with_builds(records)] == [None, None]
+    assert [batch_score.score_record((r, None), use_fda=False)["build_class"] for r in records] == ["Preferred", "Preferred Plus"]
+
+
+def test_main_finishes_the_file(tmp_path):
+    src, dst = tmp_path / "book.jsonl", tmp_path / "scored.jsonl"
+    src.write_text(BOOK, encoding="utf-8")
+    assert batch_score.main([str(src), "-o", str(dst), "--offline", "--workers", "1"]) == 0
+    rows = [json.loads(line) for line in dst.read_text(encoding="utf-8").splitlines()]
+    assert [("error" in r) for r in rows] == [False, True, True, False]
@@ -0,0 +1,93 @@
+import math
+import random
+
+import pytest
+
+import build_chart
+import engine
+from data import BUILD_AGE_BANDS, BUILD_CLASSES, BUILD_DEFAULT_AGE, BUILD_SEX_ADJUST, BUILD_TABLE
+
+CHART = {h: (lo, row) for h, lo, row in BUILD_TABLE}
+
+
+def scalar_rating(height, weight, age=None, sex=None):
+    # One applicant at a time, straight off data.py
+    if not height > 0 or not weight > 0:
+        return "Unknown"
+    h = round(height)
+    if h not in CHART:
+        return "Refer (height off chart)"
+    lo, row = CHART[h]
+    if weight < lo:
+        return "Refer (underweight)"
+    age = BUILD_DEFAULT_AGE if age is None or math.isnan(age) else age
+    pct = [p for a, p in BUILD_AGE_BANDS if age >= a][-1]
+    factor = 1.0 + BUILD_SEX_ADJUST["F" if str(sex).strip()[:1].upper() == "F" else "M"] + pct
+    for (name, _), max_weight in zip(BUILD_CLASSES, row):
+        if weight <= math.floor(factor * max_weight):
+            return name
+    return "Decline"
+
+
+@pytest.fixture(autouse=True)
+def standard_chart():
+    build_chart.set_default_chart(None)
+    yield
+    build_chart.set_default_chart(None)
+
+
+def test_rate_builds_matches_row_by_row_rating():
+    rng = random.Random(18)
+    records = []
+    for _ in range(5000):
+        records.append({"height_in": rng.choice([0, 50, 55.6, 60, 66.4, 70, 72, 80, 90]) + rng.random() * 0.4,
+                        "weight": rng.choice([0, 60, 100, 150, 190, 230, 280, 400]) + rng.randint(0, 30),
+                        "age": rng.choice([None, "", 25, 49.9, 50, 65, 70, 88]),
+                        "sex": rng.choice([None, "M", "F", "female", "Male", ""])})
+    rated = engine.rate_builds(records)
+    for record, got in zip(records, rated):
+        age = engine._as_number(record["age"], float("nan"))
+        assert got["build_class"] == scalar_rating(record["height_in"], record["weight"], age, record["sex"]), record
+
+
+def test_feet_and_inches_rate_the_same_as_height_in():
+    by_feet = engine.rate_builds([{"feet": 5, "inches": 10, "weight": 200}])
+    by_inches = engine.rate_builds([{"height_in": 70, "weight": 200}])
+    assert by_feet == by_inches == [{"build_class": "Preferred", "risk": "risk-safe"}]
+
+
+@pytest.mark.parametrize("record, expected", [
+    ({"height_in": 70, "weight": 300}, ("Decline", "risk-high")),
+    ({"height_in": 70, "weight": 100}, ("Refer (underweight)", "risk-med")),
+    ({"height_in": 90, "weight": 200}, ("Refer (height off chart)", "risk-med")),
+    ({"height_in": 70}, ("Unknown", None)),
+    ({"height_in": 70, "weight": 289, "age": 72}, ("Table 4", "risk-med")),
+    ({"height_in": 70, "weight": 188, "sex": "F"}, ("Preferred", "risk-safe")),
+])
+def test_edges_of_the_chart(record, expected):
+    assert engine.rate_builds([record]) == [{"build_class": expected[0], "risk": expected[1]}]
+
+
+def test_empty_batch():
+    assert engine.rate_builds([]) == []
+
+
+def test_carrier_chart_from_csv(tmp_path):
+    path = tmp_path / "carrier.csv"
+    lines = ["sex,age_min,height_in,min_weight,Preferred,Standard"]
+    for sex in "MF":
+        for age in (0, 60):
+            for h in (60, 61):
+                lines.append(f"{sex},{age},{h},100,{150 + age},{180 + age}")
+    path.write_text("\n".join(lines) + "\n")
+    build_chart.set_default_chart(build_chart.BuildChart.from_csv(str(path)))
+    rated = engine.rate_builds([{"height_in": 60, "weight": 170}, {"height_in": 61, "weight": 170, "age": 65},
+                                {"height_in": 62, "weight": 170}, {"height_in": 60, "weight": 181}])
+    assert [r["build_class"] for r in rated] == ["Standard", "Preferred", "Refer (height off chart)", "Decline"]
+
+
+def test_csv_chart_with_a_gap_is_rejected(tmp_path):
+    path = tmp_path / "carrier.csv"
+    path.write_text("sex,age_min,height_in,min_weight,Preferred\nM,0,60,100,150\n")
+    with pytest.raises(ValueError, match="doesn't cover"):
+        build_chart.BuildChart.from_csv(str(path))
@@ -0,0 +1,59 @@
+"""The tab 2 verdicts the single-category combo check gave, pinned against the fixture labels.
+
+    python -m pytest tests
+"""
+import itertools
+import json
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import engine
+from label_record import LabelRecord
+
+HEART = "HIGH RISK (Diabetes + Heart): Compounded mortality risk. Expect Table 4+ or Decline."
+TRIFECTA = "METABOLIC SYNDROME: Client has the 'Trifecta'. Look for carriers with Metabolic Syndrome credits."
+
+with open(os.path.join(ROOT, "benchmarks", "fixtures", "openfda_labels.json"), encoding="utf-8") as f:
+    LABELS = {r["openfda"]["brand_name"][0]: LabelRecord.from_label(r) for r in json.load(f)["results"]}
+
+
+def verdict(*names):
+    return engine.check_med_combinations([engine.drug_tags(LABELS[n].indications, n) for n in names])
+
+
+def old_verdict(*names):
+    # The original check: one category per med, Trifecta before Diabetes + Heart
+    cats = {engine.simple_category_check(LABELS[n].indications, n) for n in names}
+    if {"Diabetes", "Hypertension", "Cholesterol"} <= cats:
+        return [TRIFECTA]
+    if {"Diabetes", "Cardiac"} <= cats:
+        return [HEART]
+    return []
+
+
+@pytest.mark.parametrize("other", ["Metoprolol Tartrate", "Furosemide", "Lisinopril"])
+def test_metformin_with_bp_meds_is_not_diabetes_plus_heart(other):
+    assert verdict("Metformin Hydrochloride", other) == []
+
+
+def test_metformin_with_plavix_is_diabetes_plus_heart():
+    assert verdict("Metformin Hydrochloride", "Plavix") == [HEART]
+
+
+def test_trifecta_wins_over_diabetes_plus_heart():
+    assert verdict("Metformin Hydrochloride", "Lisinopril", "Atorvastatin Calcium", "Plavix") == [TRIFECTA]
+
+
+@pytest.mark.parametrize("size", [2, 3])
+def test_category_findings_match_the_old_check(size):
+    mismatched = []
+    for names in itertools.combinations(sorted(LABELS), size):
+        new = [v for v in verdict(*names) if v in (HEART, TRIFECTA)]
+        if new != old_verdict(*names):
+            mismatched.append(names)
+    assert not mismatched, mismatched[:5]
@@ -0,0 +1,74 @@
+import random
+
+import pytest
+
+from data import IMPAIRMENT_DATA, RISK_ORDER
+from rules import ComorbidityEngine, assess_comorbidities
+
+CONDITIONS = sorted(IMPAIRMENT_DATA)
+
+
+def old_assessment(conditions, is_smoker, bmi):
+    # The hard-coded check_comorbidities / condition_risk the rules replaced
+    warnings = []
+    if is_smoker: warnings.append("SMOKER STATUS: Rates will be Standard Smoker (Tobacco) at best.")
+    if bmi > 30: warnings.append("BUILD RATING: High BMI typically triggers a Table Rating based on build alone.")
+    if is_smoker:
+        if "COPD / Emphysema" in conditions or "Asthma" in conditions: warnings.append("DECLINE WARNING: COPD/Asthma + Smoking is a major knockout for most carriers.")
+        if "Heart Attack (History of)" in conditions: warnings.append("HIGH RISK: Smoking after a Heart Attack is typically Table 4 to Decline.")
+    if bmi > 35:
+        if "Sleep Apnea" in conditions: warnings.append("BUILD RISK: Sleep Apnea with BMI > 35 requires documented CPAP compliance for best rates.")
+    if "Diabetes Type 2" in conditions and "Heart Attack (History of)" in conditions: warnings.append("COMORBIDITY ALERT: Diabetes + Heart History is treated very strictly. Expect Table 4 minimum.")
+    risks = {}
+    for cond in conditions:
+        risk = IMPAIRMENT_DATA[cond].get("risk", "risk-med")
+        if is_smoker or bmi > 33:
+            risk = {"risk-safe": "risk-med", "risk-med": "risk-high"}.get(risk, risk)
+        risks[cond] = risk
+    floor = "risk-med" if is_smoker or bmi > 33 else "risk-safe"
+    return {"warnings": warnings, "risks": risks, "floor": floor}
+
+
+def test_rules_match_the_old_hard_coded_checks():
+    rng = random.Random(17)
+    picks = [["COPD / Emphysema"], ["Sleep Apnea"], ["Diabetes Type 2", "Heart Attack (History of)"], ["Asthma"]]
+    for _ in range(2000):
+        conditions = rng.choice(picks) + rng.sample(CONDITIONS, rng.randint(0, 4))
+        conditions = list(dict.fromkeys(conditions))
+        args = (conditions, rng.random() < 0.5, rng.choice([22.0, 30.0, 30.5, 33.0, 33.5, 35.0, 36.0]))
+        assert assess_comorbidities(*args) == old_assessment(*args), args
+
+
+def test_free_text_conditions_are_ignored():
+    out = assess_comorbidities(["Asthma", "Ingrown toenail"], False, 22.0)
+    assert out["risks"] == {"Asthma": IMPAIRMENT_DATA["Asthma"].get("risk", "risk-med")}
+
+
+CONDS = {"A": {"risk": "risk-safe"}, "B": {"risk": "risk-med"}, "C": {}}
+
+
+def test_applies_to_limits_a_bump_to_those_conditions():
+    engine = ComorbidityEngine([{"id": "b", "any_of": ["A", "B"], "bump": 1, "applies_to": ["A"]}], CONDS)
+    assert engine.evaluate(["A", "B"], False, 20)["risks"] == {"A": "risk-med", "B": "risk-med"}
+    assert engine.evaluate(["C"], False, 20)["risks"] == {"C": "risk-med"}
+
+
+def test_bumps_take_the_largest_step_and_stop_at_the_top():
+    rules = [{"id": "one", "smoker": True, "bump": 1}, {"id": "two", "bmi_at_most": 18.5, "bump": 2}]
+    engine = ComorbidityEngine(rules, CONDS)
+    assert engine.evaluate(["A", "B"], True, 17)["risks"] == {"A": "risk-high", "B": "risk-high"}
+    assert engine.evaluate(["A"], True, 25)["risks"] == {"A": "risk-med"}
+
+
+def test_all_of_needs_every_condition_and_floor_is_the_highest():
+    rules = [{"id": "ab", "all_of": ["A", "B"], "warning": "A+B", "floor": RISK_ORDER[2]},
+             {"id": "a", "all_of": ["A"], "floor": RISK_ORDER[1]}]
+    engine = ComorbidityEngine(rules, CONDS)
+    assert engine.evaluate(["A"], False, 20) == {"warnings": [], "risks": {"A": "risk-safe"}, "floor": "risk-med"}
+    assert engine.evaluate(["A", "B"], False, 20)["warnings"] == ["A+B"]
+    assert engine.evaluate(["A", "B"], False, 20)["floor"] == "risk-high"
+
+
+def test_rule_naming_an_unknown_condition_fails_up_front():
+    with pytest.raises(ValueError, match="unknown condition 'D'"):
+        ComorbidityEngine([{"id": "bad", "all_of": ["A", "D"]}], CONDS)
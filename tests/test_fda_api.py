@@ -0,0 +1,205 @@
+import threading
+import time
+
+import pytest
+
+import fda_api
+from label_record import LabelRecord
+
+
+class FakeResponse:
+    def __init__(self, status_code, payload=None, headers=None):
+        self.status_code = status_code
+        self._payload = payload
+        self.headers = headers or {}
+
+    def json(self):
+        return self._payload
+
+
+class FakeSession:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.urls = []
+
+    def get(self, url, timeout=None):
+        self.urls.append(url)
+        return self.responses.pop(0)
+
+
+def test_single_flight_runs_concurrent_callers_once():
+    flight = fda_api.SingleFlight()
+    release = threading.Event()
+    calls, results = [], []
+
+    def fn():
+        calls.append(1)
+        release.wait(5)
+        return 200, {"results": []}
+
+    threads = [threading.Thread(target=lambda: results.append(flight.do("lisinopril", fn))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    while not calls:
+        time.sleep(0.01)
+    time.sleep(0.05)  # let the rest queue up behind the leader
+    release.set()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
+    assert results == [(200, {"results": []})] * 8
+    assert flight.do("lisinopril", fn) and len(calls) == 2  # finished calls aren't reused
+
+
+def test_single_flight_shares_the_leaders_error():
+    flight = fda_api.SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    errors = []
+
+    def fn():
+        started.set()
+        release.wait(5)
+        raise fda_api.RateLimited(3)
+
+    def call():
+        try:
+            flight.do("plavix", fn)
+        except fda_api.RateLimited as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    assert started.wait(5)
+    follower = threading.Thread(target=call)
+    follower.start()
+    time.sleep(0.05)
+    release.set()
+    leader.join()
+    follower.join()
+    assert len(errors) == 2 and errors[0] is errors[1]
+
+
+def test_token_bucket_allows_the_burst_then_paces():
+    bucket = fda_api.TokenBucket(rate_per_sec=20, burst=3)
+    start = time.monotonic()
+    for _ in range(3):
+        assert bucket.acquire()
+    assert time.monotonic() - start < 0.05
+    assert bucket.acquire()
+    assert bucket.acquire()
+    assert time.monotonic() - start >= 0.09  # two more slots at 20/s
+
+
+def test_token_bucket_refuses_a_slot_further_away_than_the_timeout():
+    bucket = fda_api.TokenBucket(rate_per_sec=1, burst=1)
+    assert bucket.acquire(timeout=0)
+    assert bucket.acquire(timeout=0.5) is False
+    bucket.pause(10)
+    assert bucket.acquire(timeout=5) is False
+
+
+def test_zero_rate_only_waits_out_pauses():
+    bucket = fda_api.TokenBucket(rate_per_sec=0, burst=1)
+    assert all(bucket.acquire(timeout=0) for _ in range(100))
+    bucket.pause(10)
+    assert bucket.acquire(timeout=1) is False
+
+
+def test_gateway_waits_out_a_429_then_retries(monkeypatch):
+    session = FakeSession([FakeResponse(429, headers={"Retry-After": "0.05"}), FakeResponse(200, {"results": [1]})])
+    monkeypatch.setattr(fda_api, "_session", session)
+    gateway = fda_api.UpstreamGateway(rate_per_min=0, max_queue_wait=1)
+    assert gateway.fetch("x") == (200, {"results": [1]})
+    assert len(session.urls) == 2
+
+
+def test_gateway_raises_rate_limited_instead_of_a_404(monkeypatch):
+    session = FakeSession([FakeResponse(429, headers={"Retry-After": "30"})])
+    monkeypatch.setattr(fda_api, "_session", session)
+    gateway = fda_api.UpstreamGateway(rate_per_min=0, max_queue_wait=1)
+    with pytest.raises(fda_api.RateLimited) as e:
+        gateway.fetch("x")
+    assert e.value.retry_after == 30 and len(session.urls) == 1
+
+
+def brand_label(brand, generic=""):
+    return {"openfda": {"brand_name": [brand], "generic_name": [generic or brand]}, "indications_and_usage": ["x"]}
+
+
+def resolved(names):
+    """resolve_batch over the fake upstream, as {index: (status, brand, error)}."""
+    out = {}
+    for i, status, record, err in fda_api.resolve_batch(names, max_workers=2):
+        assert i not in out
+        out[i] = (status, record.brand if record is not None else None, err)
+    return out
+
+
+@pytest.fixture
+def fake_upstream(monkeypatch):
+    calls = {"batch": [], "single": []}
+    answers = {"batch": None, "single": {}}
+
+    def fetch_batch(chunk):
+        calls["batch"].append(chunk)
+        answer = answers["batch"]
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    def fetch_multi_drug(name):
+        calls["single"].append(name)
+        return answers["single"].get(name, (404, None))
+
+    monkeypatch.setattr(fda_api, "fetch_batch", fetch_batch)
+    monkeypatch.setattr(fda_api, "fetch_multi_drug", fetch_multi_drug)
+    return calls, answers
+
+
+def test_batch_answer_is_demuxed_to_every_input_position(fake_upstream):
+    calls, answers = fake_upstream
+    answers["batch"] = (200, {"results": [brand_label("Plavix", "clopidogrel"), brand_label("Lisinopril")]})
+    out = resolved(["Plavix", "lisinopril", " PLAVIX "])
+    assert out == {0: (200, "Plavix", None), 1: (200, "Lisinopril", None), 2: (200, "Plavix", None)}
+    assert calls["batch"] == [["plavix", "lisinopril"]] and calls["single"] == []
+
+
+def test_names_the_batch_cant_attribute_fall_back_to_single_lookups(fake_upstream):
+    calls, answers = fake_upstream
+    answers["batch"] = (200, {"results": [brand_label("Plavix")]})
+    answers["single"]["metformin"] = (200, LabelRecord.from_label(brand_label("Glucophage", "metformin")))
+    out = resolved(["Plavix", "Metformin"])
+    assert out[0] == (200, "Plavix", None)
+    assert out[1] == (200, "Glucophage", None) and calls["single"] == ["metformin"]
+
+
+def test_batch_404_answers_every_name_in_the_chunk(fake_upstream):
+    calls, answers = fake_upstream
+    answers["batch"] = (404, None)
+    assert resolved(["Notadrug", "Alsonot"]) == {0: (404, None, None), 1: (404, None, None)}
+    assert calls["single"] == []
+
+
+def test_rate_limited_batch_is_not_split_into_single_lookups(fake_upstream):
+    calls, answers = fake_upstream
+    answers["batch"] = fda_api.RateLimited(5)
+    out = resolved(["Plavix", "Lisinopril"])
+    assert all(status is None and isinstance(err, fda_api.RateLimited) for status, _, err in out.values())
+    assert sorted(out) == [0, 1] and calls["single"] == []
+
+
+def test_failed_batch_falls_back_to_single_lookups(fake_upstream):
+    calls, answers = fake_upstream
+    answers["batch"] = (500, None)
+    answers["single"]["plavix"] = (404, None)
+    assert resolved(["Plavix"]) == {0: (404, None, None)}
+    assert calls["single"] == ["plavix"]
+
+
+def test_long_lists_are_split_into_chunks():
+    names = [f"drug{i}" for i in range(45)]
+    chunks = fda_api.chunk_names(names)
+    assert [len(c) for c in chunks] == [20, 20, 5] and sum(chunks, []) == names
+    long_names = ["x" * 400 for _ in range(5)]
+    assert all(sum(len(fda_api._brand_term(n)) + 1 for n in c) <= fda_api.BATCH_MAX_SEARCH_CHARS
+               for c in fda_api.chunk_names(long_names))
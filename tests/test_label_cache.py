@@ -0,0 +1,98 @@
+import threading
+import time
+
+from label_cache import LabelCache
+from label_record import LabelRecord
+
+
+def label(name, indications="used to treat high blood pressure"):
+    return LabelRecord(brand_names=[name], generic_names=[name], indications=indications)
+
+
+def wait_for(cond, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not cond():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_stale_entry_is_served_while_one_refresh_runs(tmp_path):
+    cache = LabelCache(path=str(tmp_path / "labels.sqlite3"), ttl=60)
+    cache.put("lisinopril", 200, label("Lisinopril", "old"), stored_at=time.time() - 120)
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        return 200, label("Lisinopril", "new")
+
+    for _ in range(5):
+        assert cache.get_or_fetch("lisinopril", fetch) == (200, label("Lisinopril", "old"))
+    release.set()
+    wait_for(lambda: cache.stats()["refreshes"] == 1)
+    assert len(calls) == 1
+    assert cache.get("lisinopril") == (200, label("Lisinopril", "new"))
+    assert cache.stats()["stale_hits"] == 5 and cache.stats()["hits"] == 1
+
+
+def test_failed_refresh_keeps_the_last_good_label():
+    cache = LabelCache(path=None, ttl=60)
+    cache.put("plavix", 200, label("Plavix"), stored_at=time.time() - 120)
+
+    def fetch():
+        raise ConnectionError("openFDA down")
+
+    assert cache.get("plavix", refresh=fetch) == (200, label("Plavix"))
+    wait_for(lambda: cache.stats()["refresh_errors"] == 1)
+    assert cache.get("plavix") == (200, label("Plavix"))
+
+
+def test_404_is_cached_until_the_negative_ttl_runs_out():
+    cache = LabelCache(path=None, negative_ttl=900)
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return 404, None
+
+    assert cache.get_or_fetch("notadrug", fetch) == (404, None)
+    assert cache.get_or_fetch("notadrug", fetch) == (404, None)
+    assert len(calls) == 1 and cache.stats()["negative_hits"] == 1
+
+    cache.put("notadrug", 404, None, stored_at=time.time() - 1000)
+    assert cache.get("notadrug") is None
+
+
+def test_server_errors_are_not_cached():
+    cache = LabelCache(path=None)
+    answers = iter([(503, None), (200, label("Metformin"))])
+    assert cache.get_or_fetch("metformin", lambda: next(answers)) == (503, None)
+    assert cache.get_or_fetch("metformin", lambda: next(answers)) == (200, label("Metformin"))
+
+
+def test_memory_tier_evicts_least_recently_used_by_bytes():
+    one = 200 + len("drug0") + label("Drug0").nbytes()
+    cache = LabelCache(path=None, max_memory_bytes=3 * one)
+    for i in range(3):
+        cache.put(f"drug{i}", 200, label(f"Drug{i}"))
+    cache.get("drug0")
+    cache.put("drug3", 200, label("Drug3"))
+    assert cache.peek("drug1") is None
+    assert all(cache.peek(f"drug{i}") is not None for i in (0, 2, 3))
+    assert cache.stats()["memory_bytes"] <= 3 * one
+
+
+def test_disk_tier_evicts_least_recently_used_by_bytes(tmp_path):
+    path = str(tmp_path / "labels.sqlite3")
+    writer = LabelCache(path=path)
+    for i in range(10):
+        writer.put(f"drug{i}", 200, label(f"Drug{i}", "x" * 1000), stored_at=time.time())
+    room = writer.stats()["disk_bytes"] // 2 + 100  # five of them
+
+    cache = LabelCache(path=path, max_disk_bytes=room, max_memory_bytes=1)
+    cache.get("drug0")  # read from disk, so drug0 is now the most recently used
+    cache.put("drug10", 200, label("Drug10", "x" * 1000))
+    stats = cache.stats()
+    assert stats["disk_bytes"] <= room and stats["evictions"] == 6
+    assert set(cache.recent_keys(10, "drug")) == {"drug0", "drug7", "drug8", "drug9", "drug10"}
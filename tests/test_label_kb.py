@@ -0,0 +1,108 @@
+import json
+
+import pytest
+
+import engine
+import label_cache
+import label_kb
+from conftest import FIXTURE_DUMP
+from label_cache import LabelCache
+
+
+@pytest.fixture
+def kb(tmp_path):
+    label_kb.ingest([FIXTURE_DUMP], str(tmp_path))
+    return label_kb.LabelKB(str(tmp_path))
+
+
+@pytest.fixture
+def engine_kb(kb):
+    # The engine on this KB and a memory-only cache, nothing on disk or the network
+    label_kb.set_default_kb(kb)
+    label_cache.set_default_cache(LabelCache(path=None))
+    yield kb
+    label_kb.set_default_kb(None)
+    label_cache.set_default_cache(None)
+
+
+def test_ingest_counts_the_fixture(kb):
+    stats = kb.stats()
+    assert stats["labels"] == 86
+    assert stats["last_ingest"]["added"] == 86
+
+
+@pytest.mark.parametrize("name, brand", [
+    ("Eliquis", "Eliquis"),
+    ("eliquis", "Eliquis"),
+    ("Metformin Hydrochloride", "Metformin Hydrochloride"),
+    ("metformin", "Metformin Hydrochloride"),
+    ("Advair", "Advair Diskus"),
+    ("budesonide and formoterol", "Symbicort"),
+])
+def test_lookup_by_name_and_phrase(kb, name, brand):
+    record = kb.lookup(name)
+    assert record is not None and record.brand == brand
+
+
+@pytest.mark.parametrize("name", ["and", "hydrochloride", "sodium", "calcium", "tartrate", "xr", "hfa",
+                                  "formoterol fumarate dihydrate and", "Xyzzyq"])
+def test_salts_joiners_and_fragments_find_nothing(kb, name):
+    assert kb.lookup(name) is None
+
+
+def test_newer_label_replaces_older_one(kb, tmp_path):
+    with open(FIXTURE_DUMP, encoding="utf-8") as f:
+        label = next(r for r in json.load(f)["results"] if r["openfda"]["brand_name"] == ["Eliquis"])
+    label["effective_time"] = "29990101"
+    label["indications_and_usage"] = ["Updated indications."]
+    newer = tmp_path / "newer.json"
+    newer.write_text(json.dumps({"results": [label]}), encoding="utf-8")
+
+    info = label_kb.ingest([str(newer)], kb.path)
+    assert info["last_ingest"]["updated"] == 1 and info["labels"] == 86
+    assert label_kb.LabelKB(kb.path).lookup("Eliquis").indications == "Updated indications."
+
+
+def test_empty_kb_picks_up_a_later_ingest(tmp_path, monkeypatch):
+    monkeypatch.setenv("LABEL_KB_PATH", str(tmp_path))
+    monkeypatch.setattr(label_kb, "RECHECK_SECONDS", 0)
+    label_kb.set_default_kb(None)
+    try:
+        assert label_kb.get_default_kb().lookup("Eliquis") is None
+        label_kb.ingest([FIXTURE_DUMP], str(tmp_path))
+        assert label_kb.get_default_kb().lookup("Eliquis") is not None
+    finally:
+        label_kb.set_default_kb(None)
+
+
+@pytest.mark.parametrize("name", ["and", "n/a", "none"])
+def test_junk_is_not_answered_from_the_kb(engine_kb, name):
+    assert engine.decode_drug(name) == {"found": False, "suggestion": None, "preflight": "junk"}
+
+
+def test_kb_answers_tab1_and_tab2_without_openfda(engine_kb):
+    assert engine.decode_drug("Eliquis")["brand"] == "Eliquis"
+    entries = dict((i, e) for i, e, err in engine.med_entries(["Metformin", "and", "Lisinopril"]))
+    assert entries[0]["category"] == "Diabetes"
+    assert entries[1] == {"found": False, "junk": True, "suggestion": None}
+    assert entries[2]["category"] == "Hypertension"
+
+
+def test_suggestions_pick_up_names_from_a_later_ingest(tmp_path, monkeypatch):
+    import name_index
+    monkeypatch.setenv("LABEL_KB_PATH", str(tmp_path))
+    monkeypatch.setattr(label_kb, "RECHECK_SECONDS", 0)
+    label_kb.set_default_kb(None)
+    try:
+        assert name_index.get_default_index().canonical("Tradjenta") is None
+        label = {"set_id": "tradjenta-1", "effective_time": "20240101",
+                 "openfda": {"brand_name": ["Tradjenta"], "generic_name": ["LINAGLIPTIN"]},
+                 "indications_and_usage": ["Type 2 diabetes mellitus."]}
+        dump = tmp_path / "dump.json"
+        dump.write_text(json.dumps({"results": [label]}), encoding="utf-8")
+        label_kb.ingest([str(dump)], str(tmp_path))
+        index = name_index.get_default_index()
+        assert index.canonical("tradjenta") == "Tradjenta"
+        assert index.preflight("Linagliptn") == ("typo", "Linagliptin")
+    finally:
+        label_kb.set_default_kb(None)
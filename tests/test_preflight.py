@@ -0,0 +1,37 @@
+import pytest
+
+import engine
+from name_index import get_default_index
+
+
+@pytest.mark.parametrize("name, right", [("Metforman", "Metformin"), ("Ozempik", "Ozempic"),
+                                         ("Gabapenton", "Gabapentin"), ("Cymbolta", "Cymbalta")])
+def test_known_misspellings_are_answered_without_openfda(offline_engine, name, right):
+    assert engine.decode_drug(name) == {"found": False, "suggestion": right, "preflight": "misspelling"}
+    (i, entry, err), = engine.med_entries([name])
+    assert entry == {"found": False, "junk": False, "suggestion": right}
+    assert offline_engine == []
+
+
+def test_force_looks_a_known_misspelling_up_anyway(offline_engine):
+    assert engine.decode_drug("Metforman", force=True) == {"found": False, "suggestion": "Metformin"}
+    assert offline_engine == ["Metforman"]
+
+
+def test_typo_guess_still_goes_to_openfda_and_suggests_after_the_miss(offline_engine):
+    # Linagliptin is a real drug one edit from Sitagliptin; only openFDA can say it isn't
+    assert get_default_index().preflight("Linagliptin") == ("typo", "Sitagliptin")
+    assert engine.decode_drug("Linagliptin") == {"found": False, "suggestion": "Sitagliptin"}
+    (i, entry, err), = engine.med_entries(["Linagliptin"])
+    assert entry["suggestion"] == "Sitagliptin"
+    assert offline_engine == ["Linagliptin", "Linagliptin"]
+
+
+def test_confirmed_miss_is_not_asked_twice(offline_engine):
+    list(engine.med_entries(["Xyzzyqin"]))
+    list(engine.med_entries(["Xyzzyqin"]))
+    assert offline_engine == ["Xyzzyqin"]
+
+
+def test_hctz_is_an_abbreviation_not_a_misspelling():
+    assert get_default_index().preflight("hctz")[0] == "lookup"
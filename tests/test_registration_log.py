@@ -0,0 +1,106 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+
+from registration_log import FakeSheetBackend, RegistrationLogger
+
+
+def logger(tmp_path, backend, **kw):
+    kw.setdefault("flush_interval", 0.05)
+    return RegistrationLogger(backend, spill_path=str(tmp_path / "spill.jsonl"), base_backoff=0, **kw)
+
+
+def write_spill(path, rows):
+    with open(path, "a", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row) + "\n")
+
+
+def test_rows_are_batched_and_flushed(tmp_path):
+    backend = FakeSheetBackend()
+    log = logger(tmp_path, backend, batch_size=10, flush_interval=5)
+    for i in range(25):
+        log.log("2026-01-01", f"user{i}")
+    assert log.flush(timeout=5)
+    assert [r[1] for r in backend.rows] == [f"user{i}" for i in range(25)]
+    assert log.stats()["queued"] == log.stats()["sent"] == 25
+
+
+def test_failed_batch_is_spilled_then_replayed_first(tmp_path):
+    backend = FakeSheetBackend(fail_next=3)
+    log = logger(tmp_path, backend, max_retries=2)
+    log.log("a")
+    assert log.flush(timeout=5)
+    assert backend.rows == [] and log.stats()["spilled"] == 1
+
+    log.log("b")
+    assert log.flush(timeout=5)
+    assert backend.rows == [["a"], ["b"]]
+    assert log.stats()["replayed"] == 1
+    assert os.listdir(tmp_path) == ["spill.jsonl.lock"]
+
+
+def test_two_loggers_never_replay_the_same_spilled_rows(tmp_path):
+    spilled = [[f"old{i}"] for i in range(50)]
+    write_spill(tmp_path / "spill.jsonl", spilled)
+    backend = FakeSheetBackend(latency=0.05)
+    loggers = [logger(tmp_path, backend) for _ in range(4)]
+    threads = [threading.Thread(target=lg._send, args=([[f"new{i}"]],)) for i, lg in enumerate(loggers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(backend.rows) == sorted(spilled + [[f"new{i}"] for i in range(4)])
+    assert sum(lg.stats()["replayed"] for lg in loggers) == 50
+
+
+def test_rows_spilled_during_a_replay_are_kept(tmp_path):
+    write_spill(tmp_path / "spill.jsonl", [["old"]])
+    sending = threading.Event()
+    release = threading.Event()
+
+    class SlowBackend(FakeSheetBackend):
+        def append_rows(self, rows):
+            sending.set()
+            release.wait(5)
+            super().append_rows(rows)
+
+    backend = SlowBackend()
+    replayer = logger(tmp_path, backend)
+    t = threading.Thread(target=replayer._send, args=([["new"]],))
+    t.start()
+    assert sending.wait(5)
+    logger(tmp_path, FakeSheetBackend(fail_next=1), max_retries=0)._send([["late"]])
+    release.set()
+    t.join()
+
+    assert backend.rows == [["old"], ["new"]]
+    with open(tmp_path / "spill.jsonl", encoding="utf-8") as f:
+        assert [json.loads(line) for line in f] == [["late"]]
+
+
+def test_claim_left_by_a_dead_process_is_replayed(tmp_path):
+    dead = subprocess.Popen([sys.executable, "-c", "pass"])
+    dead.wait()
+    write_spill(tmp_path / f"spill.jsonl.replaying.{dead.pid}.0", [["orphan"]])
+    write_spill(tmp_path / f"spill.jsonl.replaying.{os.getppid()}.0", [["in flight"]])
+    backend = FakeSheetBackend()
+    logger(tmp_path, backend)._send([["new"]])
+    assert backend.rows == [["orphan"], ["new"]]
+    assert not (tmp_path / f"spill.jsonl.replaying.{dead.pid}.0").exists()
+    assert (tmp_path / f"spill.jsonl.replaying.{os.getppid()}.0").exists()
+
+
+def test_stats_add_up_under_concurrent_logging(tmp_path):
+    backend = FakeSheetBackend()
+    log = logger(tmp_path, backend, batch_size=7)
+    threads = [threading.Thread(target=lambda: [log.log(i) for i in range(500)]) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert log.flush(timeout=10)
+    stats = log.stats()
+    assert stats["queued"] == stats["sent"] == len(backend.rows) == 4000
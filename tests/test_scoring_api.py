@@ -0,0 +1,15 @@
+import asyncio
+
+import pytest
+
+import fda_api
+import scoring_api
+
+
+@pytest.mark.parametrize("retry_after, header", [(0.5, "1"), (0, "1"), (None, "1"), (2.2, "3"), (30, "30")])
+def test_retry_after_is_whole_seconds_rounded_up(retry_after, header):
+    exc = fda_api.RateLimited()
+    exc.retry_after = retry_after
+    response = asyncio.run(scoring_api.rate_limited(None, exc))
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == header